@@ -25,13 +25,20 @@ async def app_startup():
 
     mp_queue = Queue()
     finish_event = Event()
-    unicast_server = UnicastServer(config=config, mp_queue=mp_queue, finish_event=finish_event)
-    unicast_server.start()
+    unicast_servers: list[UnicastServer] = []
+    for shard_id in range(config.app_unicast_processes):
+        unicast_server = UnicastServer(config=config, mp_queue=mp_queue, finish_event=finish_event, shard_id=shard_id)
+        unicast_server.start()
+        unicast_servers.append(unicast_server)
 
     ppe = ProcessPoolExecutor(max_workers=os.cpu_count())
     ppe.map(sorted, [0] * os.cpu_count())  # warmup
 
-    app.manager = Manager(config=config, mp_queue=mp_queue, ppe=ppe, finish_event=finish_event)
+    app.manager = Manager(config=config,
+                          mp_queue=mp_queue,
+                          ppe=ppe,
+                          finish_event=finish_event,
+                          unicast_servers=unicast_servers)
     routers = Routers(config=config, manager=app.manager)
     app.include_router(routers.router)
 
@@ -105,6 +112,7 @@ if __name__ == "__main__":
         logger.info(f"API bind address: http://{config.app_api_host}:{config.app_api_port}")
         logger.info(f"Docs Swagger API address: http://{config.app_api_host}:{config.app_api_port}/docs")
         logger.info(f"RTP SERVER bind address: http://{config.app_unicast_host}:{config.app_unicast_port}")
+        logger.info(f"RTP SERVER processes: {config.app_unicast_processes}")
         logger.info(f"App Name: {config.app_name}")
         logger.info(f"App Version: {config.app_version}")
         logger.info(f"Python Version: {config.python_version}")
@@ -23,15 +23,31 @@ class Routers(object):
         self.router.add_api_route("/diag", self.get_diag, methods=["GET"])
         self.router.add_api_route("/restart", self.restart, methods=["POST"])
         self.router.add_api_route("/events", self.events, methods=["POST"])
+        self.router.add_api_route("/templates", self.get_templates, methods=["GET"])
+        self.router.add_api_route("/templates/reload", self.reload_templates, methods=["POST"])
 
     async def get_diag(self):
         return {
             "app_name": self.config.app_name,
             "alive": self.config.alive,
             "wait_shutdown": self.config.wait_shutdown,
+            "unicast_shards": self.manager.get_unicast_stats(),
+            "scheduler": self.manager.scheduler.get_stats(),
+            "templates": self.manager.get_template_stats(),
+            "dtmf": self.manager.get_dtmf_stats(),
             "current_time": datetime.now().isoformat()
         }
 
+    async def get_templates(self):
+        return self.manager.get_template_stats()
+
+    async def reload_templates(self) -> ORJSONResponse:
+        stats = await self.manager.reload_templates()
+        if stats is None:
+            return ORJSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                  content={"status": "error", "msg": "detector is not started"})
+        return ORJSONResponse(content={"status": "ok", **stats})
+
     async def restart(self):
         self.config.wait_shutdown = True
 
@@ -1,24 +1,30 @@
-import asyncio
 import json
 import os
-import wave
+import time
+from collections import deque
+from concurrent.futures import Executor
 from datetime import datetime, timedelta
 from os import makedirs
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
 from loguru import logger
 
 import src.custom_models.http_models as http_models
+from src.audio_ring_buffer import AudioRingBuffer
 from src.config import (Config,
                         DEFAULT_SAMPLE_WIDTH,
                         DEFAULT_SAMPLE_RATE,
-                        SEQ_NUMBER_AFTER_FIRST_RESET,
                         AMPLITUDE_THRESHOLD_BEEP,
                         AMPLITUDE_THRESHOLD_NOISE,
                         AMPLITUDE_THRESHOLD_VOICE)
 from src.custom_dataclasses.package import Package
+from src.custom_functions.audio_encoding import get_save_format
+from src.custom_functions.g711 import get_codec, decode_payloads, CODEC_LINEAR
 from src.http_clients.call_service_client import CallServiceClient
+from src.jitter_buffer import JitterBuffer
+from src.record_writer import RecordWriter
 
 CODE_ERROR = -9
 CODE_AWAIT = -1
@@ -33,7 +39,9 @@ class AudioContainer(object):
                  chan_id: str,
                  call_id: str,
                  event_create,
-                 call_service_client: CallServiceClient
+                 call_service_client: CallServiceClient,
+                 record_executor: Optional[Executor] = None,
+                 encode_executor: Optional[Executor] = None
                  ):
         self.config: Config = config
         self.em_host: str = em_host
@@ -41,8 +49,12 @@ class AudioContainer(object):
         self.call_id: str = call_id
         self.chan_id: str = chan_id
         self.call_service_client: CallServiceClient = call_service_client
+        self.record_executor: Optional[Executor] = record_executor  # threads for writing records
+        self.encode_executor: Optional[Executor] = encode_executor  # processes for resampling records
 
         self.em_ssrc: int = CODE_AWAIT
+        self.em_codec: str = event_create.info.em_codec if event_create else ''
+        self.codec: str = get_codec(self.em_codec)  # correct after first package if em_codec is unknown
 
         self.event_create: http_models.EventCreate = event_create
         self.event_progress: Optional[http_models.EventProgress] = None
@@ -50,22 +62,20 @@ class AudioContainer(object):
         self.events_detect: list[http_models.EventDetect] = []
         self.event_destroy: Optional[http_models.EventDestroy] = None
 
-        self.packages_for_analyse: list[Package] = []
-        self.bytes_samples: dict[int, bytes] = {}
-        self.analyzed_samples: dict[int, list[int]] = {}
-        self.max_amplitude_samples: dict[int, int] = {}
-        self.min_amplitude_samples: dict[int, int] = {}
-
-        self.trend_samples: dict[int, int] = {}
+        self.jitter_buffer: JitterBuffer = JitterBuffer(playout_delay=config.jitter_playout_delay,
+                                                        max_size=config.jitter_buffer_size)
+        self.audio_buffer: Optional[AudioRingBuffer] = None  # created with the first package
+        self.record_writer: Optional[RecordWriter] = None  # only if save_record, created with the first package
 
         self.detect_until_time: datetime = datetime.now() + timedelta(minutes=2)
         self.break_while_time: datetime = datetime.now() + timedelta(minutes=90)
         self.time_add_first_package: Optional[datetime] = None
         self.time_add_last_package: Optional[datetime] = None
+        self.next_tick_time: float = 0  # time.monotonic(), parse ticks are run by TickScheduler of Manager
+        self.parse_finished: bool = False
 
         self.duration_stream: float = 0
         self.duration_check_detect: float = 0
-        self.number_resets_sequence: int = 0
         self.length_payload = CODE_AWAIT
         self.seq_num_first_package: int = CODE_AWAIT
         self.seq_num_last_package: int = CODE_AWAIT
@@ -77,7 +87,25 @@ class AudioContainer(object):
         self.amp_adc_noise: int = CODE_AWAIT
         self.found_first_noise: int = 0
 
+        # state of incremental detectors, every detector touches only packages after its cursor
+        self.cursor_first_beep: int = 0
+        self.cursor_amp_adc_noise: int = 0
+        self.cursor_noise_after_answer: int = 0
+        self.counter_noise_after_answer: float = 0
+        self.answer_seq_num_noise_after_answer: int = CODE_AWAIT
+        self.cursor_voice_before_answer: int = 0
+        self.counter_voice_before_answer: int = 0
+        self.seq_num_last_beep: int = 0
+        self.voice_candidates: deque[int] = deque()  # packages louder than voice after the last beep
+        self.cursor_first_noise: int = 0
+        self.max_amp_first_noise: int = 0
+        self.counter_first_noise: int = 0
+
         self.last_detect_seq_num: int = 0
+        self.count_detect_ticks: int = 0  # detection passes which sent new samples for fingerprinting
+        self.count_gated_ticks: int = 0  # detection passes skipped by the energy gate (quiet window)
+        self.cursor_dtmf: int = 0  # the next package for DTMF detection
+        self.dtmf_digits: str = ''
         self.found_templates: str = ''
 
         self.log = logger.bind(object_id=f'{chan_id}@{em_host}:{em_port}')
@@ -88,8 +116,15 @@ class AudioContainer(object):
         self.detect_until_time = datetime.now()
         self.found_templates = name
 
+    def add_dtmf_digits(self, digits: str):
+        self.log.info(f'found DTMF digits={digits}')
+        self.dtmf_digits += digits
+
     def get_sample_width(self) -> int:
-        if self.event_create:
+        if self.codec != CODEC_LINEAR:
+            # G.711 payloads are decoded into 16 bit linear samples
+            return DEFAULT_SAMPLE_WIDTH
+        elif self.event_create:
             if self.event_create.info.em_sample_width != DEFAULT_SAMPLE_WIDTH:
                 self.log.warning('Correct work with another sample_width is not guaranteed')
             return self.event_create.info.em_sample_width
@@ -109,15 +144,23 @@ class AudioContainer(object):
 
     def append_package_for_analyse(self, package: Package):
         self.time_add_last_package: datetime = datetime.now()
-        self.packages_for_analyse.append(package)
+        self.jitter_buffer.push(package)
 
         if self.seq_num_first_package == CODE_AWAIT:
             self.log.info(f"add first package: {package.seq_num}")
             self.seq_num_first_package = package.seq_num
             self.seq_num_last_package = package.seq_num
             self.time_add_first_package = datetime.now()
-            self.length_payload = len(package.payload)
-            asyncio.create_task(self.start_parse())
+            self.codec = get_codec(self.em_codec, package.payload_type)
+            # length of payload after decoding into 16 bit linear samples
+            self.length_payload = len(package.payload) * (1 if self.codec == CODEC_LINEAR else DEFAULT_SAMPLE_WIDTH)
+            self.audio_buffer = AudioRingBuffer(
+                audio_capacity=int(self.config.audio_buffer_seconds / self.get_duration_one_sample()),
+                stats_capacity=int(self.config.stats_buffer_seconds / self.get_duration_one_sample()),
+                samples_per_package=self.length_payload // DEFAULT_SAMPLE_WIDTH)
+            self.next_tick_time = time.monotonic() + self.get_tick_interval()
+            self.log.info("begin start_parse")
+        package.set_codec(self.codec)  # Package.samples are decoded as samples of the container
 
     def add_event_progress(self, event: http_models.EventProgress):
         self.event_progress = event
@@ -143,35 +186,52 @@ class AudioContainer(object):
         self.event_destroy = event
         self.break_while_time = datetime.now() + timedelta(seconds=5)
 
-    async def start_parse(self):
-        self.log.info("begin start_parse")
-        try:
-            while self.config.alive and datetime.now() < self.break_while_time:
-                if self.event_answer:
-                    await asyncio.sleep(0.2)
-                else:
-                    await asyncio.sleep(0.5)
+    def get_tick_interval(self) -> float:
+        return 0.2 if self.event_answer else 0.5
 
-                self.check_end()
-                self.fast_build()
-                self.find_first_noise()
+    def is_deadline_expired(self, now: datetime) -> bool:
+        """Parsing must be finished or packages are not received too long"""
 
-                if self.seq_num_first_beep == CODE_AWAIT:
-                    self.find_seq_num_first_beep()
-                    self.find_amp_adc_noise()
+        if not self.config.alive or now >= self.break_while_time:
+            return True
+        return self.time_add_last_package is not None and (now - self.time_add_last_package).total_seconds() > 30
 
-                if self.event_answer:
-                    self.find_seq_num_noise_after_answer()
-                else:
-                    self.find_seq_num_voice_before_answer()
+    def run_tick(self) -> bool:
+        """One step of parsing, return False when parsing is over (and the record is saved)"""
+
+        try:
+            if not self.config.alive or datetime.now() >= self.break_while_time:
+                self.parse_finished = True
+                self.log.info("end start_parse")
+                self.start_save()
+                return False
+
+            self.check_end()
+            self.parse_tick()
+            self.next_tick_time = time.monotonic() + self.get_tick_interval()
 
         except Exception as e:
+            self.parse_finished = True
             self.log.error(e)
             self.log.exception(e)
-            return
+            return False
+
+        return True
 
-        self.log.info("end start_parse")
-        self.start_save()
+    def parse_tick(self):
+        """Take released packages and continue every detector from the place where it stopped"""
+
+        self.fast_build()
+        self.find_first_noise()
+
+        if self.seq_num_first_beep == CODE_AWAIT:
+            self.find_seq_num_first_beep()
+            self.find_amp_adc_noise()
+
+        if self.event_answer:
+            self.find_seq_num_noise_after_answer()
+        else:
+            self.find_seq_num_voice_before_answer()
 
     def check_end(self):
         if datetime.now() > self.break_while_time:
@@ -182,61 +242,86 @@ class AudioContainer(object):
             self.log.error('new packages are not received and event_destroy not found')
             return
 
-    def fast_build(self) -> None:
+    def get_last_amplitudes(self, count_packages: int) -> np.ndarray:
+        if self.audio_buffer is None:
+            return np.zeros(0, dtype=np.int16)
+        return self.audio_buffer.get_last_amplitudes(count_packages)
 
-        parse_packages = self.packages_for_analyse[0: 400]
-        self.packages_for_analyse = self.packages_for_analyse[len(parse_packages):]
+    def get_amplitude_range(self, count_packages: int) -> tuple[int, int]:
+        """:return: the smallest and the biggest amplitude of the last count_packages packages"""
 
-        for package in parse_packages:
-            fix_seq_num = package.seq_num
+        if self.audio_buffer is None or len(self.audio_buffer) == 0:
+            return 0, 0
+        return self.audio_buffer.get_amplitude_range(count_packages)
 
-            # find reset sequence package number
-            if self.seq_num_last_package - fix_seq_num > SEQ_NUMBER_AFTER_FIRST_RESET - 1000:
-                if fix_seq_num < 1000:
-                    self.number_resets_sequence = round(self.seq_num_last_package / SEQ_NUMBER_AFTER_FIRST_RESET)
-                fix_seq_num = package.seq_num + (self.number_resets_sequence * SEQ_NUMBER_AFTER_FIRST_RESET)
+    def get_stats_window(self, first_seq_num: int = 0) -> tuple[range, list[int], list[int]]:
+        """
+        Stats of packages which are still in the audio buffer
 
-            if self.seq_num_last_package < fix_seq_num:
-                self.seq_num_last_package = fix_seq_num
+        :param first_seq_num: skip packages before this sequence number
+        :return: sequence numbers, max amplitudes, min amplitudes
+        """
+        if self.audio_buffer is None or len(self.audio_buffer) == 0:
+            return range(first_seq_num, first_seq_num), [], []
 
-            self.analyzed_samples[fix_seq_num] = package.amplitudes
+        first_seq_num = max(first_seq_num, self.audio_buffer.get_first_stats_seq_num())
+        last_seq_num = self.audio_buffer.last_seq_num
+        if first_seq_num > last_seq_num:
+            return range(first_seq_num, first_seq_num), [], []
 
-            self.bytes_samples[fix_seq_num] = package.wav_bytes
-            self.max_amplitude_samples[fix_seq_num] = package.max_amplitude
-            self.min_amplitude_samples[fix_seq_num] = package.min_amplitude
+        max_amps, min_amps = self.audio_buffer.get_stats(first_seq_num, last_seq_num)
+        return range(first_seq_num, last_seq_num + 1), max_amps.tolist(), min_amps.tolist()
 
-        self.duration_stream = len(self.analyzed_samples) * self.get_duration_one_sample()
+    def fast_build(self) -> None:
 
-        if datetime.now() < self.detect_until_time and len(parse_packages) > 50:
-            self.log.warning(f'find delay!!! count parse_packages={len(parse_packages)}')
+        parse_packages = self.jitter_buffer.pop_ready(limit=400)
 
-        if len(self.analyzed_samples) == self.seq_num_last_package - self.seq_num_first_package + 1:
-            return
+        # decode all payloads of the batch with one lookup
+        batch_samples = decode_payloads([package.payload for _, package in parse_packages], self.codec)
+
+        if self.record_writer is None and parse_packages and self.is_save_record():
+            self.record_writer = self.create_record_writer()
+
+        lost_sequences, count_lost = [], 0
+        for (ext_seq_num, package), samples in zip(parse_packages, batch_samples):
+            if len(self.audio_buffer) == 0:
+                # the jitter buffer may release reordered package before the first received
+                self.seq_num_first_package = ext_seq_num
+            elif self.audio_buffer.last_seq_num < ext_seq_num - 1:
+                # packages are released in order, so the gap is known immediately
+                lost_sequences.extend([self.audio_buffer.last_seq_num + 1, ext_seq_num - 1])
+                count_lost += ext_seq_num - 1 - self.audio_buffer.last_seq_num
 
-        lost_sequences = []
-        for seq_num in range(self.seq_num_first_package, self.seq_num_last_package):
-            if seq_num not in self.analyzed_samples:
-                lost_sequences.append(seq_num)
-                self.analyzed_samples[seq_num] = self.analyzed_samples[self.seq_num_first_package]
-                self.max_amplitude_samples[seq_num] = 0
-                self.min_amplitude_samples[seq_num] = 0
+            self.audio_buffer.put(ext_seq_num, samples)
+            if self.record_writer is not None:
+                self.record_writer.write(samples)
+
+        if len(self.audio_buffer) > 0:
+            self.seq_num_last_package = self.audio_buffer.last_seq_num
+        self.duration_stream = len(self.audio_buffer) * self.get_duration_one_sample()
+
+        if datetime.now() < self.detect_until_time and len(parse_packages) > 50:
+            self.log.warning(f'find delay!!! count parse_packages={len(parse_packages)}')
 
         if len(lost_sequences) > 0:
-            self.log.error(f'lost from {lost_sequences[0]} to {lost_sequences[-1]}, count={len(lost_sequences)}')
+            self.log.error(f'lost from {lost_sequences[0]} to {lost_sequences[-1]}, count={count_lost}')
 
     def find_seq_num_first_beep(self) -> None:
         if self.seq_num_first_beep != CODE_AWAIT:
             return
 
-        for seq_num in sorted(self.max_amplitude_samples.keys()):
-            if self.seq_num_answer_package != CODE_AWAIT:
-                self.log.warning(f'find answer, but not found beep!')
-                self.seq_num_first_beep = CODE_NOT_FOUND
-                return
-            elif self.max_amplitude_samples[seq_num] > AMPLITUDE_THRESHOLD_BEEP:
+        if self.seq_num_answer_package != CODE_AWAIT and self.audio_buffer and len(self.audio_buffer) > 0:
+            self.log.warning(f'find answer, but not found beep!')
+            self.seq_num_first_beep = CODE_NOT_FOUND
+            return
+
+        seq_numbers, max_amps, _ = self.get_stats_window(first_seq_num=self.cursor_first_beep)
+        for seq_num, max_amp in zip(seq_numbers, max_amps):
+            if max_amp > AMPLITUDE_THRESHOLD_BEEP:
                 self.seq_num_first_beep = seq_num
                 self.log.debug(f'find_first_beep_time seq_num={seq_num}')
                 return
+        self.cursor_first_beep = seq_numbers.stop
 
     def find_amp_adc_noise(self) -> None:
         if self.amp_adc_noise != CODE_AWAIT:
@@ -248,10 +333,8 @@ class AudioContainer(object):
             self.amp_adc_noise = CODE_NOT_FOUND
             return
 
-        for seq_num in self.analyzed_samples:
-            max_amp = self.max_amplitude_samples[seq_num]
-            min_amp = self.min_amplitude_samples[seq_num]
-
+        seq_numbers, max_amps, min_amps = self.get_stats_window(first_seq_num=self.cursor_amp_adc_noise)
+        for max_amp, min_amp in zip(max_amps, min_amps):
             if min(abs(min_amp), abs(max_amp)) < AMPLITUDE_THRESHOLD_NOISE:
                 continue
             elif max_amp - min_amp > AMPLITUDE_THRESHOLD_BEEP:
@@ -262,6 +345,7 @@ class AudioContainer(object):
                 self.log.debug(f'found ADC noise min_amp={min_amp} and max_amp={max_amp} avg={avg}')
                 self.amp_adc_noise = avg
                 return
+        self.cursor_amp_adc_noise = seq_numbers.stop
 
     def find_seq_num_noise_after_answer(self) -> None:
         if self.seq_num_noise_after_answer != CODE_AWAIT:
@@ -270,49 +354,62 @@ class AudioContainer(object):
         if self.event_answer is None:
             return
 
-        counter = 0
-        for seq_num, max_amp in self.max_amplitude_samples.items():
-            if seq_num < self.seq_num_answer_package:
-                continue
+        if self.answer_seq_num_noise_after_answer != self.seq_num_answer_package:
+            # start (or restart if answer was changed) from the answer package
+            self.answer_seq_num_noise_after_answer = self.seq_num_answer_package
+            self.cursor_noise_after_answer = self.seq_num_answer_package
+            self.counter_noise_after_answer = 0
 
+        seq_numbers, max_amps, _ = self.get_stats_window(first_seq_num=self.cursor_noise_after_answer)
+        for seq_num, max_amp in zip(seq_numbers, max_amps):
             if self.amp_adc_noise > 0:
                 max_amp = max_amp - self.amp_adc_noise
 
             if max_amp > AMPLITUDE_THRESHOLD_NOISE:
-                counter += 1
+                self.counter_noise_after_answer += 1
             else:
-                counter = max(counter - 0.3, 0)
+                self.counter_noise_after_answer = max(self.counter_noise_after_answer - 0.3, 0)
 
-            if counter > 2:
+            if self.counter_noise_after_answer > 2:
                 self.log.info(f"found noise after answer seq_num={seq_num}")
                 self.seq_num_noise_after_answer = seq_num
                 return
+        self.cursor_noise_after_answer = seq_numbers.stop
 
     def find_seq_num_voice_before_answer(self) -> None:
         if self.seq_num_voice_before_answer != CODE_AWAIT:
             return
 
-        seq_num_last_beep = 0
-        counter = 0
-        for seq_num, max_amp in self.max_amplitude_samples.items():
-            if seq_num < seq_num_last_beep:
+        # skip beeps: after more than 10 beep packages in a row, voice is searched 50 packages later
+        seq_numbers, max_amps, _ = self.get_stats_window(first_seq_num=self.cursor_voice_before_answer)
+        for seq_num, max_amp in zip(seq_numbers, max_amps):
+            if max_amp > AMPLITUDE_THRESHOLD_VOICE:
+                self.voice_candidates.append(seq_num)
+
+            if seq_num < self.seq_num_last_beep:
                 continue
             elif max_amp > AMPLITUDE_THRESHOLD_BEEP:
-                counter += 1
+                self.counter_voice_before_answer += 1
             else:
-                counter = 0
+                self.counter_voice_before_answer = 0
 
-            if counter > 10:
-                seq_num_last_beep = seq_num + 50
+            if self.counter_voice_before_answer > 10:
+                self.seq_num_last_beep = seq_num + 50
+        self.cursor_voice_before_answer = seq_numbers.stop
 
-        if counter > 1:
-            seq_num_last_beep = self.seq_num_last_package
+        if self.counter_voice_before_answer > 1:
+            # the beep may be still playing, check only the last package
+            seq_num_from = self.seq_num_last_package
+        else:
+            seq_num_from = self.seq_num_last_beep
 
-        for seq_num in sorted(self.max_amplitude_samples.keys()):
-            if seq_num < seq_num_last_beep:
-                continue
+        # seq_num_last_beep and seq_num_last_package only grow, older candidates will never be used
+        while self.voice_candidates and self.voice_candidates[0] < min(self.seq_num_last_beep,
+                                                                       self.seq_num_last_package):
+            self.voice_candidates.popleft()
 
-            if self.max_amplitude_samples[seq_num] > AMPLITUDE_THRESHOLD_VOICE:
+        for seq_num in self.voice_candidates:
+            if seq_num >= seq_num_from:
                 self.log.info(f"found voice before answer seq_num={seq_num}")
                 self.seq_num_voice_before_answer = seq_num
                 return
@@ -324,17 +421,17 @@ class AudioContainer(object):
             self.found_first_noise = 1
             return
 
-        if max(self.max_amplitude_samples) > AMPLITUDE_THRESHOLD_NOISE:
-            counter = 0
-            for seq_num, max_amp in self.max_amplitude_samples.items():
-                min_amp = self.min_amplitude_samples.get(seq_num, 0)
-                if max_amp - min_amp > AMPLITUDE_THRESHOLD_NOISE:
-                    counter += 1
+        seq_numbers, max_amps, min_amps = self.get_stats_window(first_seq_num=self.cursor_first_noise)
+        for max_amp, min_amp in zip(max_amps, min_amps):
+            self.max_amp_first_noise = max(self.max_amp_first_noise, max_amp)
+            if max_amp - min_amp > AMPLITUDE_THRESHOLD_NOISE:
+                self.counter_first_noise += 1
+        self.cursor_first_noise = seq_numbers.stop
 
-            if counter > 1:
-                self.log.success('FOUND FIRST NOISE')
-                self.found_first_noise = 1
-                return
+        if self.max_amp_first_noise > AMPLITUDE_THRESHOLD_NOISE and self.counter_first_noise > 1:
+            self.log.success('FOUND FIRST NOISE')
+            self.found_first_noise = 1
+            return
 
     def start_save(self) -> None:
         try:
@@ -351,30 +448,53 @@ class AudioContainer(object):
                 "get_sample_width": self.get_sample_width(),
                 "get_duration_one_sample": self.get_duration_one_sample(),
                 "amp_adc_noise": self.amp_adc_noise,
-                "len_parse_packs": len(self.max_amplitude_samples),
-                "len_raw_packs": len(self.packages_for_analyse),
-                "duration_check_detect": self.duration_check_detect
+                "len_parse_packs": len(self.audio_buffer) if self.audio_buffer else 0,
+                "len_raw_packs": len(self.jitter_buffer),
+                "jitter_buffer": self.jitter_buffer.get_stats(),
+                "duration_check_detect": self.duration_check_detect,
+                "count_detect_ticks": self.count_detect_ticks,
+                "count_gated_ticks": self.count_gated_ticks,
+                "dtmf_digits": self.dtmf_digits
             }
             self.log.success(f'info: {json.dumps(info)}')
 
-            if len(self.packages_for_analyse) > 0:
-                self.log.error(f'found raw packs, count: {len(self.packages_for_analyse)}')
+            if len(self.jitter_buffer) > 0:
+                self.log.error(f'found raw packs, count: {len(self.jitter_buffer)}')
 
             if self.seq_num_last_package == CODE_AWAIT:
                 self.log.warning('not found packs')
 
-            if self.event_create.info.save_record == 1:
-                file_path = self.get_path_for_save_file(self.chan_id, self.event_create.info.save_format)
-                self.save_wav_file(file_path=file_path,
-                                   bytes_samples=self.bytes_samples,
-                                   sample_width=self.get_sample_width(),
-                                   sample_rate=self.get_sample_rate())
-                self.log.info(f"running save file: {file_path}")
+            if self.record_writer is not None:
+                self.record_writer.close()
+                self.log.info(f"running save file: {self.record_writer.get_stats()}")
 
         except Exception as exc:
             self.log.error(exc)
             self.log.exception(exc)
 
+    def is_save_record(self) -> bool:
+        return self.event_create is not None and self.event_create.info.save_record == 1
+
+    def create_record_writer(self) -> RecordWriter:
+        info = self.event_create.info
+        bytes_per_second = DEFAULT_SAMPLE_WIDTH * self.get_sample_rate()
+        save_format = get_save_format(info.save_format)
+        if save_format != str(info.save_format).lower():
+            self.log.warning(f'save_format={info.save_format} is not supported, use {save_format}')
+
+        file_path = self.get_path_for_save_file(self.chan_id, save_format)
+        self.log.info(f"start record into file: {file_path}")
+        return RecordWriter(file_path=file_path,
+                            sample_rate=self.get_sample_rate(),
+                            save_format=save_format,
+                            save_sample_rate=info.save_sample_rate,
+                            save_sample_width=info.save_sample_width,
+                            executor=self.record_executor,
+                            encode_executor=self.encode_executor,
+                            chunk_bytes=int(self.config.record_chunk_seconds * bytes_per_second),
+                            max_buffer_bytes=int(self.config.record_buffer_seconds * bytes_per_second),
+                            object_id=f'{self.chan_id}@{self.em_host}:{self.em_port}')
+
     @staticmethod
     def get_path_for_save_file(file_name: str, save_format: str = 'wav', folder: str = 'records'):
         sysdate = datetime.now()
@@ -383,16 +503,3 @@ class AudioContainer(object):
             makedirs(path, exist_ok=True)
 
         return f'{path}/{file_name.replace(".wav", "")}.{save_format}'
-
-    @staticmethod
-    def save_wav_file(file_path: str, bytes_samples: dict[int, bytes], sample_width: int, sample_rate: int):
-        try:
-            with wave.open(file_path, 'wb') as f:
-                f.setnchannels(1)  # mono
-                f.setsampwidth(sample_width)
-                f.setframerate(sample_rate)
-
-                for data in bytes_samples.values():
-                    f.writeframes(data)
-        except Exception as e:
-            print(f'ERROR save_wav_file, e={e}')
@@ -0,0 +1,117 @@
+import numpy as np
+
+from src.config import DEFAULT_SAMPLE_SIZE
+
+
+class AudioRingBuffer(object):
+    """
+    Preallocated ring buffers of one channel indexed by extended sequence number.
+
+    samples: int16 matrix (one row per package) for the last audio_capacity packages
+    max_amplitudes/min_amplitudes: per-package stats for the last stats_capacity packages
+    Lost packages are stored as silence with zero stats.
+    """
+
+    def __init__(self,
+                 audio_capacity: int,
+                 stats_capacity: int,
+                 samples_per_package: int = DEFAULT_SAMPLE_SIZE):
+        self.audio_capacity: int = audio_capacity
+        self.stats_capacity: int = max(stats_capacity, audio_capacity)
+        self.samples_per_package: int = samples_per_package
+
+        self.samples = np.zeros((self.audio_capacity, samples_per_package), dtype=np.int16)
+        self.max_amplitudes = np.zeros(self.stats_capacity, dtype=np.int32)
+        self.min_amplitudes = np.zeros(self.stats_capacity, dtype=np.int32)
+
+        self.first_seq_num: int | None = None
+        self.last_seq_num: int | None = None
+        self.count_packages: int = 0  # received and lost, from the first package
+
+    def __len__(self) -> int:
+        return self.count_packages
+
+    def get_first_stats_seq_num(self) -> int:
+        """The oldest sequence number whose stats are still in the buffer"""
+
+        return max(self.first_seq_num, self.last_seq_num - self.stats_capacity + 1)
+
+    def put(self, seq_num: int, samples: np.ndarray):
+        """Add package, seq_num must be bigger than last_seq_num (packages are released by the jitter buffer)"""
+
+        if self.first_seq_num is None:
+            self.first_seq_num = seq_num
+            self.last_seq_num = seq_num - 1
+        elif seq_num <= self.last_seq_num:
+            return
+
+        self.put_lost(self.last_seq_num + 1, seq_num)
+
+        row = self.samples[seq_num % self.audio_capacity]
+        size = min(samples.size, self.samples_per_package)
+        row[:size] = samples[:size]
+        row[size:] = 0
+
+        stats_index = seq_num % self.stats_capacity
+        self.max_amplitudes[stats_index] = samples.max() if samples.size else 0
+        self.min_amplitudes[stats_index] = samples.min() if samples.size else 0
+
+        self.last_seq_num = seq_num
+        self.count_packages += 1
+
+    def put_lost(self, first_seq_num: int, last_seq_num: int):
+        """Fill packages from first_seq_num up to last_seq_num (not included) with silence"""
+
+        if last_seq_num <= first_seq_num:
+            return
+
+        count = last_seq_num - first_seq_num
+        audio_rows = np.arange(max(first_seq_num, last_seq_num - self.audio_capacity), last_seq_num)
+        self.samples[audio_rows % self.audio_capacity] = 0
+        stats_rows = np.arange(max(first_seq_num, last_seq_num - self.stats_capacity), last_seq_num)
+        self.max_amplitudes[stats_rows % self.stats_capacity] = 0
+        self.min_amplitudes[stats_rows % self.stats_capacity] = 0
+
+        self.last_seq_num = last_seq_num - 1
+        self.count_packages += count
+
+    def get_last_amplitudes(self, count_packages: int) -> np.ndarray:
+        """Samples of the last count_packages packages as one array (single copy)"""
+
+        if self.last_seq_num is None:
+            return np.zeros(0, dtype=np.int16)
+
+        count_packages = min(count_packages, self.count_packages, self.audio_capacity)
+        rows = np.arange(self.last_seq_num - count_packages + 1, self.last_seq_num + 1) % self.audio_capacity
+        return self.samples.take(rows, axis=0).ravel()
+
+    def get_packages(self, first_seq_num: int) -> tuple[int, np.ndarray]:
+        """
+        Packages from first_seq_num up to the last one, only packages which are still in the buffer
+
+        :return: sequence number of the first returned package, int16 matrix (one row per package)
+        """
+        if self.last_seq_num is None:
+            return first_seq_num, np.zeros((0, self.samples_per_package), dtype=np.int16)
+
+        first_seq_num = max(first_seq_num, self.first_seq_num, self.last_seq_num - self.audio_capacity + 1)
+        rows = np.arange(first_seq_num, self.last_seq_num + 1) % self.audio_capacity
+        return first_seq_num, self.samples.take(rows, axis=0)
+
+    def get_amplitude_range(self, count_packages: int) -> tuple[int, int]:
+        """The smallest and the biggest amplitude of the last count_packages packages (lost packages are zeros)"""
+
+        if self.last_seq_num is None:
+            return 0, 0
+        first_seq_num = max(self.last_seq_num - count_packages + 1, self.get_first_stats_seq_num())
+        max_amps, min_amps = self.get_stats(first_seq_num, self.last_seq_num)
+        return int(min_amps.min()), int(max_amps.max())
+
+    def get_stats(self, first_seq_num: int, last_seq_num: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Stats of packages from first_seq_num to last_seq_num (included), limited by the stats window
+
+        :return: max_amplitudes, min_amplitudes
+        """
+        rows = np.arange(first_seq_num, last_seq_num + 1) % self.stats_capacity
+        return self.max_amplitudes.take(rows), self.min_amplitudes.take(rows)
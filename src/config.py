@@ -6,7 +6,6 @@ DEFAULT_SAMPLE_RATE = 8000  # 8k kHz
 DEFAULT_SAMPLE_WIDTH = 2  # for 16 bit this equal 2
 DEFAULT_SAMPLE_SIZE = 160  # for 8 kHz this 160, for 16 kHz this 320
 DEFAULT_PAYLOAD_LENGTH = 320  # for 8 kHz this 320, for 16 kHz this 640 (sample_size*sample_width)
-SEQ_NUMBER_AFTER_FIRST_RESET = 65535
 
 AMPLITUDE_THRESHOLD_BEEP = 2000
 AMPLITUDE_THRESHOLD_VOICE = 250
@@ -21,6 +20,17 @@ PEAK_NEIGHBORHOOD_SIZE = 6  # 20 was the original value.
 MIN_HASH_TIME_DELTA = 0
 MAX_HASH_TIME_DELTA = 99
 PEAK_SORT = True
+MATCH_MIN_TEMPLATE_HASHES = 11  # hashes shared with the template
+MATCH_MIN_TIMELY_HASHES = 5  # hashes with the best difference of offsets
+MATCH_MIN_OFFSET_TIMES = 2  # unique offsets of timely hashes
+MATCH_MIN_COUNT = 80  # timely hashes + MATCH_WEIGHT_OFFSET_TIMES * offset times
+MATCH_WEIGHT_OFFSET_TIMES = 15
+DTMF_MIN_AMPLITUDE = 100  # amplitude of the weaker tone
+DTMF_MIN_TONE_RATIO = 0.5  # energy of both tones to energy of the package
+DTMF_MAX_TWIST_DB = 8  # the high tone weaker than the low one
+DTMF_MAX_REVERSE_TWIST_DB = 4  # the high tone stronger than the low one
+DTMF_RELATIVE_PEAK_DB = 6  # the tone over other frequencies of its group
+DTMF_MIN_PACKAGES = 2  # packages of the same digit (40 ms) for the event
 
 
 def filter_error_log(record):
@@ -42,8 +52,31 @@ class Config(object):
         "app_unicast_port": 1234,
         "app_unicast_protocol": "udp",
         "app_unicast_buffer_size": 1024,
+        "app_unicast_batch_receive": True,
+        "app_unicast_batch_size": 64,
+        "app_unicast_processes": 1,
+        "app_unicast_transport": "queue",
+        "app_unicast_ring_slots": 32768,
+        "jitter_playout_delay": 0.2,
+        "jitter_buffer_size": 500,
+        "audio_buffer_seconds": 5,
+        "stats_buffer_seconds": 180,
+        "scheduler_interval": 0.1,
+        "scheduler_batch_size": 50,
+        "record_threads": 2,
+        "record_chunk_seconds": 1,
+        "record_buffer_seconds": 30,
+        "detect_workers": 2,
+        "detect_batch_size": 64,
+        "detect_flush_interval": 0.1,
+        "detect_gate_amplitude": -1,
+        "detect_dtmf": True,
         "save_png_match_detection": True,
-        "template_folder_path": "/opt/pysonic_nemo/template"
+        "template_folder_path": "/opt/pysonic_nemo/template",
+        "template_index_path": "/opt/pysonic_nemo/template_index",
+        "template_watch_interval": 10,
+        "template_phase_shift": 0,
+        "template_report_path": "/opt/pysonic_nemo/template_report.json"
     }
 
     def __init__(self, config_path: str = ''):
@@ -77,9 +110,34 @@ class Config(object):
         self.app_unicast_port: int = int(self.new_config['app_unicast_port'])
         self.app_unicast_protocol: str = str(self.new_config['app_unicast_protocol'])
         self.app_unicast_buffer_size: int = int(self.new_config['app_unicast_buffer_size'])
+        self.app_unicast_batch_receive: bool = bool(self.new_config['app_unicast_batch_receive'])
+        self.app_unicast_batch_size: int = int(self.new_config['app_unicast_batch_size'])
+        self.app_unicast_processes: int = max(1, int(self.new_config['app_unicast_processes']))
+        self.app_unicast_transport: str = str(self.new_config['app_unicast_transport'])  # queue or shared_memory
+        self.app_unicast_ring_slots: int = int(self.new_config['app_unicast_ring_slots'])
+        self.jitter_playout_delay: float = float(self.new_config['jitter_playout_delay'])  # seconds
+        self.jitter_buffer_size: int = int(self.new_config['jitter_buffer_size'])  # packages
+        self.audio_buffer_seconds: float = float(self.new_config['audio_buffer_seconds'])  # samples for detection
+        self.stats_buffer_seconds: float = float(self.new_config['stats_buffer_seconds'])  # max/min amplitudes
+        self.scheduler_interval: float = float(self.new_config['scheduler_interval'])  # seconds between passes
+        self.scheduler_batch_size: int = max(1, int(self.new_config['scheduler_batch_size']))  # containers
+        self.record_threads: int = max(1, int(self.new_config['record_threads']))  # threads for writing records
+        self.record_chunk_seconds: float = float(self.new_config['record_chunk_seconds'])  # audio in one write
+        self.record_buffer_seconds: float = float(self.new_config['record_buffer_seconds'])  # max not written audio
+        self.detect_workers: int = max(1, int(self.new_config['detect_workers']))  # processes for detection
+        self.detect_batch_size: int = max(1, int(self.new_config['detect_batch_size']))  # channels in one task
+        self.detect_flush_interval: float = float(self.new_config['detect_flush_interval'])  # seconds between batches
+        self.detect_gate_amplitude: int = int(self.new_config['detect_gate_amplitude'])  # -1 - no peaks, 0 - off
+        self.detect_dtmf: int = int(self.new_config['detect_dtmf'])  # Goertzel DTMF detection of all channels
         self.save_png_match_detection: int = int(self.new_config['save_png_match_detection'])
 
         self.template_folder_path: str = str(self.new_config['template_folder_path'])
+        self.template_index_path: str = str(self.new_config['template_index_path'])  # compiled index, empty - off
+        self.template_watch_interval: float = float(self.new_config['template_watch_interval'])  # seconds, 0 - off
+        # samples, 0 - off; every template gets hop / shift - 1 more fingerprints (hop is 90 samples), the index
+        # of every detect worker grows as much: 10 - about 9x memory and 5x compile time, 30 - about 3x
+        self.template_phase_shift: int = max(0, int(self.new_config['template_phase_shift']))
+        self.template_report_path: str = str(self.new_config['template_report_path'])  # similar templates, empty - off
 
     def get_different_type_variables(self) -> list:
         different: list[str] = []
@@ -1,48 +1,56 @@
 import os.path
-import statistics
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib import use
 
 
 @dataclass
 class FingerPrint(object):
     print_name: str
     arr2d: np.array
-    hashes_offsets: dict[str, int] = None
-    first_points: dict[str, tuple[int, int]] = None
-    second_points: dict[str, tuple[int, int]] = None
+    hashes: np.ndarray = None  # unique packed hashes (see fingerprint_mining.pack_hash) in order of generation
+    offsets: np.ndarray = None  # the first offset of every hash
+    points: np.ndarray = None  # t1, freq1, t2, freq2 of the first pair of every hash
     dtmf: int | None = None
 
     def __post_init__(self):
-        self.hashes_offsets: dict[str, int] = {}
-        self.first_points: dict[str, tuple[int, int]] = dict()
-        self.second_points: dict[str, tuple[int, int]] = dict()
+        if self.hashes is None:
+            self.hashes = np.zeros(0, dtype=np.uint64)
+        if self.offsets is None:
+            self.offsets = np.zeros(0, dtype=np.int64)
+        if self.points is None:
+            self.points = np.zeros((0, 4), dtype=np.int64)
 
-    def add_hash_offset(self, _hash: str, offset: int):
-        if _hash not in self.hashes_offsets:
-            self.hashes_offsets[_hash] = offset
+    @property
+    def hashes_offsets(self) -> dict[int, int]:
+        return dict(zip(self.hashes.tolist(), self.offsets.tolist()))
 
-    def add_first_points(self, _hash, x, y):
-        if _hash not in self.first_points:
-            self.first_points[_hash] = (x, y)
+    @property
+    def first_points(self) -> dict[int, tuple[int, int]]:
+        return dict(zip(self.hashes.tolist(), map(tuple, self.points[:, 0:2].tolist())))
 
-    def add_second_points(self, _hash, x, y):
-        if _hash not in self.second_points:
-            self.second_points[_hash] = (x, y)
+    @property
+    def second_points(self) -> dict[int, tuple[int, int]]:
+        return dict(zip(self.hashes.tolist(), map(tuple, self.points[:, 2:4].tolist())))
+
+    def get_hash_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """Unique hashes (uint64) and their first offsets (int64) in order of generation"""
+
+        return self.hashes, self.offsets
 
     def save_print2png(self, print_name: str, print_folder: str = 'fingerprint_template'):
-        if len(self.first_points) == 0:
+        if self.hashes.size == 0:
             return
 
         Path(print_folder).mkdir(parents=True, exist_ok=True)
         full_path = os.path.join(print_folder, f"{print_name}.png")
 
-        use('agg')
+        import matplotlib
+        matplotlib.use('agg')  # imported only for pictures, not in the detection path
+        import matplotlib.pyplot as plt
+
         fig, ax = plt.subplots()
         ax.set_title('specgram')
         ax.set_aspect(0.1)
@@ -57,30 +65,10 @@ class FingerPrint(object):
         plt.close(fig)
 
     @staticmethod
-    def get_timely_hashes(source_hashes_offsets: dict[str, int],
-                          correct_hashes_offsets: dict[str, int]) -> tuple[dict[str, int], int]:
-        hashes_diff_offset: dict[str, int] = {}
-        for s_hash, s_offset in source_hashes_offsets.items():
-            if s_hash in correct_hashes_offsets:
-                hashes_diff_offset[s_hash] = s_offset - correct_hashes_offsets[s_hash]
-
-        if len(hashes_diff_offset) == 0:
-            return dict(), 0  # not found matches
-
-        median = statistics.median(hashes_diff_offset.values())
-        for h in list(hashes_diff_offset.keys()):
-            if hashes_diff_offset[h] - median == 0:
-                continue
-            hashes_diff_offset.pop(h)
-        correct_hashes_offsets = {h: o for h, o in source_hashes_offsets.items() if h in hashes_diff_offset}
-
-        return correct_hashes_offsets, median
-
-    @staticmethod
-    def save_matching_print2png(first_points: dict[str, tuple[int, int]],
-                                second_points: dict[str, tuple[int, int]],
+    def save_matching_print2png(first_points: dict[int, tuple[int, int]],
+                                second_points: dict[int, tuple[int, int]],
                                 arr2d: np.array,
-                                hashes: list[str],
+                                hashes: list[int],
                                 print_name: str,
                                 save_folder: str = 'fingerprint_template',
                                 shift_line: int | None = None):
@@ -101,7 +89,10 @@ class FingerPrint(object):
                 Path(path).mkdir(parents=True, exist_ok=True)
             path_with_name = os.path.join(path, f"{print_name}.png")
 
-            use('agg')
+            import matplotlib
+            matplotlib.use('agg')
+            import matplotlib.pyplot as plt
+
             fig, ax = plt.subplots()
             plt.axvline(x=shift_line, color='r', label='start_found')
 
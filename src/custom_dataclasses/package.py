@@ -1,44 +1,89 @@
+import time
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from struct import unpack, pack
+from struct import Struct
 
-from src.config import DEFAULT_SAMPLE_WIDTH
+import numpy as np
 
+from src.custom_functions.g711 import get_codec, decode_payload
 
-@dataclass
+RTP_HEADER = Struct('>BBHII')  # V/P/X/CC, M/PT, sequence number, timestamp, ssrc
+RTP_HEADER_SIZE = 12
+LOSE_TIMEOUT = 5  # seconds
+
+
+@dataclass(slots=True)
 class Package(object):
+    """
+    RTP package, keeps only the raw datagram and parsed header,
+    samples are decoded on the first access as NumPy view over the payload (or by G.711 lookup table) and kept
+    """
+
     em_host: str
     em_port: int
     data: bytes
-    csrc_count: int = None
-    payload_type: int = None
-    seq_num: int = None
-    payload: bytes = None
-    timestamp: int = None
-    ssrc: int = None
-    em_address: str = ''
-    em_address_ssrc: str = ''
-    amplitudes: list = None
-    max_amplitude: int = 0
-    min_amplitude: int = 0
-    wav_bytes: bytes = b''
-    lose_time: datetime = field(default_factory=lambda: datetime.now() + timedelta(seconds=5))
+    arrival_time: float = field(default_factory=time.time)
+    csrc_count: int = 0
+    payload_type: int = 0
+    seq_num: int = 0
+    timestamp: int = 0
+    ssrc: int = 0
+    payload_offset: int = RTP_HEADER_SIZE
+    codec: str = ''  # codec of the AudioContainer, if empty then codec is selected by payload_type
+    decoded: np.ndarray | None = field(default=None, init=False, repr=False, compare=False)  # samples of codec
 
     def __post_init__(self):
-        self.csrc_count = self.data[0] & 0x0F
-        self.payload_type = self.data[1] & 0x7F
-        self.seq_num = int.from_bytes(self.data[2:4], byteorder='big', signed=False)
-        self.payload: bytes = self.data[12 + (4 * self.csrc_count):]
-        self.timestamp: int = int.from_bytes(self.data[4:8], byteorder='big')
-        self.ssrc: int = int.from_bytes(self.data[8:12], byteorder='big')
-        self.em_address = f"{self.em_host}:{self.em_port}"
-        self.em_address_ssrc = f"{self.ssrc}@{self.em_host}:{self.em_port}"
+        first_byte, second_byte, self.seq_num, self.timestamp, self.ssrc = RTP_HEADER.unpack_from(self.data)
+        self.csrc_count = first_byte & 0x0F
+        self.payload_type = second_byte & 0x7F
+        self.payload_offset = RTP_HEADER_SIZE + 4 * self.csrc_count
+
+    @property
+    def em_address(self) -> str:
+        return f"{self.em_host}:{self.em_port}"
+
+    @property
+    def em_address_ssrc(self) -> str:
+        return f"{self.ssrc}@{self.em_host}:{self.em_port}"
+
+    @property
+    def lose_time(self) -> datetime:
+        return datetime.fromtimestamp(self.arrival_time) + timedelta(seconds=LOSE_TIMEOUT)
+
+    @property
+    def payload(self) -> bytes:
+        return self.data[self.payload_offset:]
+
+    def set_codec(self, codec: str):
+        if codec != self.codec:
+            self.codec = codec
+            self.decoded = None
+
+    @property
+    def samples(self) -> np.ndarray:
+        """int16 samples (read only), for linear PCM it is big-endian view over the payload (without copy)"""
+
+        if self.decoded is None:
+            codec = get_codec(self.codec, self.payload_type)
+            self.decoded = decode_payload(self.data, codec, offset=self.payload_offset)
+            self.decoded.flags.writeable = False
+        return self.decoded
+
+    @property
+    def amplitudes(self) -> list[int]:
+        return self.samples.tolist()
 
-        self.amplitudes = list(unpack(">" + "h" * (len(self.payload) // DEFAULT_SAMPLE_WIDTH), self.payload))
+    @property
+    def max_amplitude(self) -> int:
+        samples = self.samples
+        return int(samples.max()) if samples.size else 0
 
-        self.max_amplitude = max(self.amplitudes)
-        self.min_amplitude = min(self.amplitudes)
+    @property
+    def min_amplitude(self) -> int:
+        samples = self.samples
+        return int(samples.min()) if samples.size else 0
 
+    @property
+    def wav_bytes(self) -> bytes:
         # big-endian to little-endian for next save wav file
-        for amp in self.amplitudes:
-            self.wav_bytes += pack('<h', amp)
+        return self.samples.astype('<i2').tobytes()
@@ -1,6 +1,9 @@
 from typing import Optional
 
-from src.config import DEFAULT_SAMPLE_SIZE, DEFAULT_SAMPLE_RATE
+import numpy as np
+
+from src.config import DEFAULT_SAMPLE_SIZE, DEFAULT_SAMPLE_RATE, DEFAULT_WINDOW_SIZE, DEFAULT_OVERLAP_RATIO
+from src.custom_dataclasses.fingerprint import FingerPrint
 from src.fingerprint_mining import get_fingerprint
 
 
@@ -8,22 +11,23 @@ class Template(object):
     def __init__(self,
                  template_id: int,
                  template_name: str,
-                 amplitudes: list[int],
+                 amplitudes: list[int] | np.ndarray,
                  trim_first_low_amplitudes: bool = True,
                  limit_samples: Optional[int] = None,
                  sample_size: int = DEFAULT_SAMPLE_SIZE,
-                 sample_rate: int = DEFAULT_SAMPLE_RATE):
+                 sample_rate: int = DEFAULT_SAMPLE_RATE,
+                 phase_shift: int = 0):
         self.template_id: int = template_id
         self.template_name: str = template_name
         self.sample_size = sample_size
         self.sample_rate = sample_rate
 
-        while trim_first_low_amplitudes:
-            amp = amplitudes.pop(0)
-            if abs(amp) > 5 or len(amplitudes) == 0:
-                amplitudes.insert(0, amp)
-                amplitudes.insert(0, 0)
-                break
+        amplitudes = amplitudes.tolist() if isinstance(amplitudes, np.ndarray) else list(amplitudes)
+        if trim_first_low_amplitudes and len(amplitudes) > 0:
+            # leading samples up to the first one louder than 5 are replaced by one zero
+            loud = np.flatnonzero(np.abs(np.asarray(amplitudes, dtype=np.int32)) > 5)
+            first = int(loud[0]) if loud.size else len(amplitudes) - 1
+            amplitudes = [0] + amplitudes[first:]
 
         self.count_samples: int = len(amplitudes) // sample_size
         if limit_samples:
@@ -31,6 +35,15 @@ class Template(object):
 
         self.fingerprint = get_fingerprint(print_name=template_name, amplitudes=amplitudes)
 
+        # frames of a stream have any alignment to frames of the template,
+        # so the template is fingerprinted also with frames shifted by phase_shift samples (only hashes are kept)
+        self.phase_fingerprints: list[FingerPrint] = []
+        hop = DEFAULT_WINDOW_SIZE - int(DEFAULT_WINDOW_SIZE * DEFAULT_OVERLAP_RATIO)
+        for shift in range(phase_shift, hop, phase_shift) if phase_shift > 0 else []:
+            fingerprint = get_fingerprint(print_name=template_name, amplitudes=[0] * shift + amplitudes)
+            fingerprint.arr2d = None
+            self.phase_fingerprints.append(fingerprint)
+
         self.count_amplitudes = self.count_samples * sample_size
         self.amplitudes = amplitudes[0: self.count_amplitudes]
         self.samples: dict[int, list] = self.convert_amplitudes2samples(amplitudes=self.amplitudes,
@@ -0,0 +1,87 @@
+import math
+
+import numpy as np
+from scipy.signal import resample_poly
+
+SAVE_FORMAT_WAV = 'wav'
+SAVE_FORMAT_FLAC = 'flac'
+SAVE_FORMAT_OGG = 'ogg'
+
+# save_format: (soundfile format, {sample_width: subtype})
+SAVE_FORMATS = {
+    SAVE_FORMAT_WAV: ('WAV', {1: 'PCM_U8', 2: 'PCM_16', 3: 'PCM_24', 4: 'PCM_32'}),
+    SAVE_FORMAT_FLAC: ('FLAC', {1: 'PCM_S8', 2: 'PCM_16', 3: 'PCM_24'}),
+    SAVE_FORMAT_OGG: ('OGG', {}),  # Vorbis is lossy, sample width is not used
+}
+SAVE_FORMAT_ALIASES = {
+    'wave': SAVE_FORMAT_WAV,
+    'oga': SAVE_FORMAT_OGG,
+    'vorbis': SAVE_FORMAT_OGG,
+}
+RESAMPLE_HALF_LENGTH = 10  # half length of resample_poly filter in periods of the slower rate
+
+
+def get_save_format(save_format: str) -> str:
+    """Normalized save_format, unknown formats are saved as wav"""
+
+    save_format = str(save_format).lower().strip('.')
+    save_format = SAVE_FORMAT_ALIASES.get(save_format, save_format)
+    return save_format if save_format in SAVE_FORMATS else SAVE_FORMAT_WAV
+
+
+def get_sample_width(save_format: str, sample_width: int) -> int:
+    """Supported sample width nearest to requested, 0 for lossy formats"""
+
+    subtypes = SAVE_FORMATS[save_format][1]
+    if len(subtypes) == 0:
+        return 0
+    elif sample_width in subtypes:
+        return sample_width
+    return min(subtypes, key=lambda width: (abs(width - sample_width), -width))
+
+
+def get_format_subtype(save_format: str, sample_width: int) -> tuple[str, str]:
+    sf_format, subtypes = SAVE_FORMATS[save_format]
+    return sf_format, subtypes.get(sample_width, 'VORBIS')
+
+
+def get_resample_ratio(sample_rate: int, save_sample_rate: int) -> tuple[int, int]:
+    """up, down for resample_poly"""
+
+    gcd = math.gcd(sample_rate, save_sample_rate)
+    return save_sample_rate // gcd, sample_rate // gcd
+
+
+def get_resample_padding(up: int, down: int) -> int:
+    """Count of neighbour input samples which are enough for the filter, multiple of down"""
+
+    if up == down:
+        return 0
+    need = RESAMPLE_HALF_LENGTH * max(up, down) / up + 1
+    return down * math.ceil(need / down)
+
+
+def encode_chunk(samples: np.ndarray,
+                 before: np.ndarray,
+                 after: np.ndarray,
+                 up: int,
+                 down: int,
+                 sample_width: int) -> np.ndarray:
+    """
+    Polyphase resampling and width conversion of one chunk of int16 samples, runs in the process pool
+
+    :param samples: chunk, its length must be multiple of down (except the last chunk)
+    :param before: previous input samples (length multiple of down), used only as filter context
+    :param after: next input samples, used only as filter context
+    :return: int16 samples (int32 for sample width more than 2 bytes)
+    """
+    if up != down:
+        signal = np.concatenate((before, samples, after)).astype(np.float32)
+        resampled = resample_poly(signal, up, down)
+        start = len(before) * up // down
+        resampled = resampled[start: start + math.ceil(len(samples) * up / down)]
+        samples = np.clip(np.rint(resampled), -32768, 32767).astype(np.int16)
+
+    if sample_width > 2:
+        return samples.astype(np.int32) << 16
+    return samples
@@ -1,24 +1,28 @@
-import numpy
-from matplotlib import mlab
-from numpy import ndarray, zeros
+from numpy import ndarray
 
 from src.config import DEFAULT_SAMPLE_RATE, DEFAULT_WINDOW_SIZE, DEFAULT_OVERLAP_RATIO
+from src.custom_functions.stft import specgram, specgram_batch
 
 
-def get_spectrum_with_name(name: str,
-                           amplitudes: list[int],
-                           fs: int = DEFAULT_SAMPLE_RATE,
-                           wsize: int = DEFAULT_WINDOW_SIZE,
-                           wratio: float = DEFAULT_OVERLAP_RATIO
-                           ) -> tuple[str, ndarray]:
-    spectrum, _, _ = mlab.specgram(
-        amplitudes,
-        NFFT=wsize,
-        Fs=fs,
-        window=mlab.window_hanning,
-        noverlap=int(wsize * wratio)
-    )
-    if isinstance(spectrum, numpy.ndarray) is False:
-        spectrum = zeros((1, 1))
+def get_spectrum_frames(amplitudes: ndarray,
+                        fs: int = DEFAULT_SAMPLE_RATE,
+                        wsize: int = DEFAULT_WINDOW_SIZE,
+                        wratio: float = DEFAULT_OVERLAP_RATIO) -> ndarray:
+    """
+    The same frames as mlab.specgram (hanning window, one-sided PSD), but without padding of short input
 
-    return name, spectrum
+    :return: matrix (wsize // 2 + 1, count_frames), count_frames may be 0
+    """
+    return specgram(amplitudes, fs=fs, wsize=wsize, wratio=wratio, pad_short=False)
+
+
+def get_spectrum_frames_batch(signals: list[ndarray],
+                              fs: int = DEFAULT_SAMPLE_RATE,
+                              wsize: int = DEFAULT_WINDOW_SIZE,
+                              wratio: float = DEFAULT_OVERLAP_RATIO) -> list[ndarray]:
+    """
+    get_spectrum_frames of many signals with one FFT call: frames of all signals are stacked into one int16 matrix
+
+    :return: matrix (wsize // 2 + 1, count_frames) for every signal
+    """
+    return specgram_batch(signals, fs=fs, wsize=wsize, wratio=wratio)
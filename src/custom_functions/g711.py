@@ -0,0 +1,107 @@
+import numpy as np
+
+CODEC_LINEAR = 'linear'
+CODEC_ULAW = 'ulaw'
+CODEC_ALAW = 'alaw'
+
+PAYLOAD_TYPE_PCMU = 0
+PAYLOAD_TYPE_PCMA = 8
+
+CODEC_ALIASES = {
+    'ulaw': CODEC_ULAW,
+    'mulaw': CODEC_ULAW,
+    'pcmu': CODEC_ULAW,
+    'g711u': CODEC_ULAW,
+    'alaw': CODEC_ALAW,
+    'pcma': CODEC_ALAW,
+    'g711a': CODEC_ALAW,
+    'slin': CODEC_LINEAR,
+    'slin16': CODEC_LINEAR,
+    'l16': CODEC_LINEAR,
+    'linear': CODEC_LINEAR,
+    'pcm': CODEC_LINEAR,
+}
+
+
+def ulaw2linear(value: int) -> int:
+    """Decode one μ-law byte (ITU-T G.711) to 16 bit linear sample"""
+
+    value = ~value & 0xFF
+    exponent = (value >> 4) & 0x07
+    mantissa = value & 0x0F
+    sample = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return -sample if value & 0x80 else sample
+
+
+def alaw2linear(value: int) -> int:
+    """Decode one A-law byte (ITU-T G.711) to 16 bit linear sample"""
+
+    value ^= 0x55
+    exponent = (value >> 4) & 0x07
+    mantissa = value & 0x0F
+    if exponent == 0:
+        sample = (mantissa << 4) + 8
+    else:
+        sample = ((mantissa << 4) + 0x108) << (exponent - 1)
+    return sample if value & 0x80 else -sample
+
+
+ULAW_TABLE = np.array([ulaw2linear(value) for value in range(256)], dtype=np.int16)
+ALAW_TABLE = np.array([alaw2linear(value) for value in range(256)], dtype=np.int16)
+TABLES = {CODEC_ULAW: ULAW_TABLE, CODEC_ALAW: ALAW_TABLE}
+
+
+def get_codec(em_codec: str = '', payload_type: int | None = None) -> str:
+    """
+    Codec name by em_codec from EventCreate, if em_codec is unknown then by RTP payload type
+
+    :param em_codec: codec name from EventCreateInfo (ulaw, alaw, slin, PCMU, ...)
+    :param payload_type: RTP payload type (0 - PCMU, 8 - PCMA)
+    :return: CODEC_LINEAR, CODEC_ULAW or CODEC_ALAW
+    """
+    codec = CODEC_ALIASES.get(str(em_codec).lower())
+    if codec:
+        return codec
+    elif payload_type == PAYLOAD_TYPE_PCMU:
+        return CODEC_ULAW
+    elif payload_type == PAYLOAD_TYPE_PCMA:
+        return CODEC_ALAW
+    return CODEC_LINEAR
+
+
+def decode_payload(payload: bytes, codec: str, offset: int = 0) -> np.ndarray:
+    """
+    Decode RTP payload to int16 samples
+
+    :param payload: raw bytes (whole datagram if offset is used)
+    :param codec: CODEC_LINEAR, CODEC_ULAW or CODEC_ALAW
+    :param offset: start of payload in bytes
+    :return: samples, for linear it is big-endian view without copy
+    """
+    if codec in TABLES:
+        return TABLES[codec][np.frombuffer(payload, dtype=np.uint8, offset=offset)]
+
+    count = (len(payload) - offset) // 2
+    return np.frombuffer(payload, dtype='>i2', count=count, offset=offset)
+
+
+def decode_payloads(payloads: list[bytes], codec: str) -> list[np.ndarray]:
+    """
+    Decode many payloads with one lookup (fancy indexing) over the joined buffer
+
+    :param payloads: RTP payloads of one stream
+    :param codec: CODEC_LINEAR, CODEC_ULAW or CODEC_ALAW
+    :return: int16 samples for every payload
+    """
+    if len(payloads) == 0:
+        return []
+
+    if codec in TABLES:
+        joined = TABLES[codec][np.frombuffer(b''.join(payloads), dtype=np.uint8)]
+        lengths = [len(payload) for payload in payloads]
+    else:
+        payloads = [payload[:len(payload) - len(payload) % 2] for payload in payloads]
+        joined = np.frombuffer(b''.join(payloads), dtype='>i2').astype(np.int16)
+        lengths = [len(payload) // 2 for payload in payloads]
+
+    return np.split(joined, np.cumsum(lengths[:-1]))
@@ -0,0 +1,129 @@
+"""
+Short-time Fourier transform of audio without matplotlib.
+
+The power spectrum is the same as of mlab.specgram (mode psd, hanning window, one-sided, scaled by frequency):
+matrix (wsize // 2 + 1, count_frames), but it is computed in float32 on strided frames of the signal.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from src.config import DEFAULT_SAMPLE_RATE, DEFAULT_WINDOW_SIZE, DEFAULT_OVERLAP_RATIO
+
+
+@lru_cache(maxsize=8)
+def get_window(wsize: int) -> np.ndarray:
+    """Hanning window (float32, read only)"""
+
+    window = np.hanning(wsize).astype(np.float32)
+    window.flags.writeable = False
+    return window
+
+
+@lru_cache(maxsize=8)
+def get_scale(wsize: int, fs: int) -> np.ndarray:
+    """Scale of every frequency bin: density of the window and doubled bins of the one-sided spectrum"""
+
+    scale = np.full(wsize // 2 + 1, 1 / (fs * (np.hanning(wsize) ** 2).sum()))
+    scale[1: (wsize + 1) // 2] *= 2  # without DC and Nyquist
+    scale = scale.astype(np.float32)
+    scale.flags.writeable = False
+    return scale
+
+
+@lru_cache(maxsize=8)
+def get_window_leakage(wsize: int, first_bin: int) -> float:
+    """The biggest magnitude of the window spectrum from first_bin: how much a constant leaks into these bins"""
+
+    return float(np.abs(np.fft.rfft(np.hanning(wsize)))[first_bin:].max(initial=0))
+
+
+def get_max_power(min_amp: float,
+                  max_amp: float,
+                  fs: int = DEFAULT_SAMPLE_RATE,
+                  wsize: int = DEFAULT_WINDOW_SIZE,
+                  first_bin: int = 0) -> float:
+    """
+    Upper bound of the power spectrum (bins from first_bin) of any frame with all samples in [min_amp, max_amp]:
+    |X| <= (max_amp - min_amp) / 2 * sum(window) + |middle| * leakage of the window, middle of the range
+    """
+    middle = (max_amp + min_amp) / 2
+    magnitude = (max_amp - min_amp) / 2 * np.hanning(wsize).sum()
+    magnitude += abs(middle) * (np.hanning(wsize).sum() if first_bin == 0 else get_window_leakage(wsize, first_bin))
+    return float(magnitude ** 2 * get_scale(wsize, fs).max())
+
+
+def get_step(wsize: int = DEFAULT_WINDOW_SIZE, wratio: float = DEFAULT_OVERLAP_RATIO) -> int:
+    return wsize - int(wsize * wratio)
+
+
+def get_count_frames(count_samples: int,
+                     wsize: int = DEFAULT_WINDOW_SIZE,
+                     wratio: float = DEFAULT_OVERLAP_RATIO) -> int:
+    """Count of complete frames in count_samples samples"""
+
+    return max(0, (count_samples - wsize) // get_step(wsize, wratio) + 1)
+
+
+def get_frames(signal: np.ndarray, wsize: int, step: int, count_frames: int) -> np.ndarray:
+    """Frames of the signal as a strided view (count_frames, wsize), without copying"""
+
+    return np.lib.stride_tricks.sliding_window_view(signal, wsize)[::step][:count_frames]
+
+
+def get_power_spectrum(frames: np.ndarray, fs: int = DEFAULT_SAMPLE_RATE) -> np.ndarray:
+    """
+    One-sided power spectral density of frames, one FFT call for all of them
+
+    :param frames: matrix (count_frames, wsize), int16 or float32
+    :return: matrix (count_frames, wsize // 2 + 1), float32
+    """
+    wsize = frames.shape[1]
+    spectrum = np.fft.rfft(frames * get_window(wsize), axis=1)
+    power = np.square(spectrum.real)
+    power += np.square(spectrum.imag)
+    power *= get_scale(wsize, fs)
+    return power
+
+
+def specgram(amplitudes: list[int] | np.ndarray,
+             fs: int = DEFAULT_SAMPLE_RATE,
+             wsize: int = DEFAULT_WINDOW_SIZE,
+             wratio: float = DEFAULT_OVERLAP_RATIO,
+             pad_short: bool = True) -> np.ndarray:
+    """
+    Power spectrum as the first result of mlab.specgram
+
+    :param pad_short: the signal shorter than wsize is padded with zeros to one frame (as mlab.specgram)
+    :return: matrix (wsize // 2 + 1, count_frames), count_frames may be 0 without pad_short
+    """
+    signal = np.asarray(amplitudes, dtype=np.float32)
+    if pad_short and signal.size < wsize:
+        signal = np.concatenate((signal, np.zeros(wsize - signal.size, dtype=np.float32)))
+
+    count_frames = get_count_frames(signal.size, wsize, wratio)
+    if count_frames == 0:
+        return np.zeros((wsize // 2 + 1, 0), dtype=np.float32)
+    return get_power_spectrum(get_frames(signal, wsize, get_step(wsize, wratio), count_frames), fs=fs).T
+
+
+def specgram_batch(signals: list[np.ndarray],
+                   fs: int = DEFAULT_SAMPLE_RATE,
+                   wsize: int = DEFAULT_WINDOW_SIZE,
+                   wratio: float = DEFAULT_OVERLAP_RATIO) -> list[np.ndarray]:
+    """
+    specgram (without padding) of many int16 signals with one FFT call: frames of all signals are stacked
+
+    :return: matrix (wsize // 2 + 1, count_frames) for every signal
+    """
+    step = get_step(wsize, wratio)
+    counts = [get_count_frames(len(signal), wsize, wratio) for signal in signals]
+    if sum(counts) == 0:
+        return [np.zeros((wsize // 2 + 1, 0), dtype=np.float32) for _ in signals]
+
+    frames = np.concatenate([get_frames(signal, wsize, step, count)
+                             for signal, count in zip(signals, counts) if count > 0]).astype(np.int16)
+    spectrum = get_power_spectrum(frames, fs=fs)
+
+    bounds = np.cumsum(counts)[:-1]
+    return [part.T for part in np.split(spectrum, bounds)]
@@ -0,0 +1,106 @@
+"""
+Detection pipeline inside a worker process.
+
+Every worker is the only worker of its ProcessPoolExecutor, so all tasks of a channel come to the same process
+in order and the state of the channel (SpectrumCache and StreamingMatcher) stays in the worker.
+The template index is loaded once by init_worker, tasks carry only new samples and return small results.
+"""
+import time
+from typing import Optional
+
+import numpy as np
+
+from src.fingerprint_mining import get_fingerprint_with_spectrum
+from src.spectrum_cache import SpectrumCache
+from src.streaming_matcher import StreamingMatcher
+from src.template_index import TemplateIndex
+
+template_index: Optional[TemplateIndex] = None
+channels: dict[str, tuple[SpectrumCache, StreamingMatcher]] = {}
+
+
+def init_worker(template_names: list[str], hashes: np.ndarray, ids: np.ndarray, offsets: np.ndarray):
+    """Initializer of the pool: the built template index of the Detector"""
+
+    channels.clear()
+    set_template_index(template_names, hashes, ids, offsets)
+
+
+def set_template_index(template_names: list[str], hashes: np.ndarray, ids: np.ndarray, offsets: np.ndarray) -> int:
+    """
+    Replace the template index between two tasks, so detection never sees a half-built index.
+    Spectrums of channels are kept, votes are dropped (template ids of the new index are other).
+
+    :return: count of channels
+    """
+    global template_index
+    new_index = TemplateIndex()
+    new_index.template_names = template_names
+    new_index.hashes, new_index.ids, new_index.offsets = hashes, ids, offsets
+    template_index = new_index
+
+    for chan_id, (spectrum_cache, matcher) in channels.items():
+        channels[chan_id] = spectrum_cache, StreamingMatcher(template_index=new_index,
+                                                             window_frames=matcher.window_frames)
+    return len(channels)
+
+
+def get_channel(chan_id: str, window_samples: int, reset: bool) -> tuple[SpectrumCache, StreamingMatcher]:
+    if reset or chan_id not in channels:
+        spectrum_cache = SpectrumCache(count_frames=SpectrumCache.get_count_frames(window_samples))
+        matcher = StreamingMatcher(template_index=template_index, window_frames=spectrum_cache.count_frames)
+        channels[chan_id] = spectrum_cache, matcher
+    return channels[chan_id]
+
+
+def detect_channels(tasks: list[tuple[str, Optional[np.ndarray], int, bool]],
+                    save_png: bool = False) -> list[tuple[str, Optional[str], Optional[int], float]]:
+    """
+    Process new samples of channels, spectrum frames of all channels are computed with one FFT call
+
+    :param tasks: chan_id, new int16 samples (None - forget the channel), window_samples, reset
+    :return: chan_id, template_name, match_count, duration - for every processed channel
+    """
+    t1 = time.monotonic()
+    batch = []
+    for chan_id, samples, window_samples, reset in tasks:
+        if samples is None:
+            channels.pop(chan_id, None)
+        else:
+            batch.append((chan_id, samples, get_channel(chan_id, window_samples, reset)))
+
+    try:
+        frames_list = SpectrumCache.add_samples_batch([channel[0] for _, _, channel in batch],
+                                                      [samples for _, samples, _ in batch])
+    except Exception as e:
+        print(f'ERROR! [detect_channels] spectrum of {len(batch)} channels e={e}')
+        return [(chan_id, None, None, 0.0) for chan_id, _, _ in batch]
+    duration_spectrum = (time.monotonic() - t1) / max(len(batch), 1)
+
+    results = []
+    for (chan_id, _, (spectrum_cache, matcher)), new_frames in zip(batch, frames_list):
+        t2 = time.monotonic()
+        try:
+            found_template, match_count = matcher.add_frames(new_frames)
+            if found_template is not None and save_png:
+                save_match_png(chan_id, found_template, spectrum_cache)
+        except Exception as e:
+            print(f'ERROR! [detect_channels] chan_id={chan_id} e={e}')
+            found_template, match_count = None, None
+        results.append((chan_id, found_template, match_count, duration_spectrum + time.monotonic() - t2))
+    return results
+
+
+def save_match_png(chan_id: str, template_name: str, spectrum_cache: SpectrumCache):
+    """Fingerprint of the whole window, only for the picture"""
+
+    fingerprint = get_fingerprint_with_spectrum(print_name=chan_id, spectrum=spectrum_cache.get_spectrum())
+    query_index, template_ids, _ = template_index.lookup(fingerprint.hashes)
+    matched = np.array([template_index.template_names[i] == template_name for i in template_ids.tolist()], dtype=bool)
+    fingerprint.save_matching_print2png(first_points=fingerprint.first_points,
+                                        second_points=fingerprint.second_points,
+                                        arr2d=fingerprint.arr2d,
+                                        hashes=fingerprint.hashes[query_index[matched]].tolist(),
+                                        save_folder='fingerprint_record',
+                                        print_name=f"{chan_id}_{template_name}",
+                                        shift_line=0)
@@ -1,21 +1,27 @@
 import asyncio
-import functools
+import json
 import os
 import random
 import time
+import zlib
 from asyncio import AbstractEventLoop
-from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
-import soundfile
+import numpy as np
 from loguru import logger
 
 from src.audio_container import AudioContainer
-from src.config import Config, DEFAULT_SAMPLE_RATE
-from src.custom_dataclasses.fingerprint import FingerPrint
-from src.custom_dataclasses.template import Template
-from src.custom_functions.build_spectrum import get_spectrum_with_name
-from src.fingerprint_mining import get_fingerprint_with_spectrum
+from src.config import Config, DEFAULT_SAMPLE_SIZE
+from src.detect_worker import init_worker, detect_channels, set_template_index
+from src.dtmf_detector import DtmfDetector
+from src.fingerprint_mining import is_without_peaks
+from src.template_index import TemplateIndex
+from src.template_similarity import find_similar_templates, merge_similar_pairs
+from src.template_store import TemplateStore
+
+DETECT_WINDOW_PACKAGES = 150  # last three seconds
 
 
 class Detector(object):
@@ -27,12 +33,17 @@ class Detector(object):
         self.audio_containers: dict[str, AudioContainer] = audio_containers
         self.ppe: ProcessPoolExecutor = ppe
 
-        self.executor_tasks: list[Future] = []
-        self.executor_times: list[float] = []
         self.detection_times: list[float] = []
-        self.templates: dict[str, Template] = {}
-        self.all_templates_hash: dict[str, list[str]] = {}
-        self.chan_id_with_amps: dict[str, list[int]] = {}
+        self.template_store: TemplateStore | None = None
+        self.template_index: TemplateIndex = TemplateIndex()
+        self.reload_lock: asyncio.Lock = asyncio.Lock()
+        self.similar_check_generation: int = 0
+        self.detect_executors: list[ProcessPoolExecutor] = []  # one worker per executor, channels are sticky
+        self.detect_chan_ids: set[str] = set()  # channels with state in workers
+        self.chan_id_with_samples: dict[str, list[np.ndarray]] = {}  # new samples, not sent yet
+        self.reset_chan_ids: set[str] = set()
+        self.drop_chan_ids: set[str] = set()
+        self.dtmf_detector: DtmfDetector = DtmfDetector()
         self.event_loop: AbstractEventLoop = asyncio.get_running_loop()
         self.log = logger.bind(object_id=self.__class__.__name__)
         self.log.info(f'init Detection')
@@ -40,68 +51,163 @@ class Detector(object):
     async def start_detection(self):
         self.log.info("start_detection")
         self.load_templates()
+        self.start_detect_executors()
         asyncio.create_task(self.start_loop())
         asyncio.create_task(self.run_detection())
+        asyncio.create_task(self.start_template_watcher())
+        asyncio.create_task(self.check_similar_templates())
 
     def load_templates(self):
         self.log.info('start load_templates')
-        folder = self.config.template_folder_path
-        file_list = [file for file in os.listdir(folder) if file.endswith('.wav')]
-
-        for template_id, file_name in enumerate(file_list):
-            file_path = os.path.join(folder, file_name)
-            template_name = file_name.replace('.wav', '')
-
-            audio_data, samplerate = soundfile.read(file_path, dtype='int16')
+        self.template_store = TemplateStore(folder_path=self.config.template_folder_path,
+                                            index_path=self.config.template_index_path,
+                                            phase_shift=self.config.template_phase_shift,
+                                            executor=self.ppe)
+        self.template_index = self.template_store.load()
+        self.template_index.build()
+
+        self.log.info(f"end load_templates, hashes: {self.template_index.count_unique_hashes()}, "
+                      f"templates: {len(set(self.template_index.template_names))}")
+
+    async def check_similar_templates(self):
+        """Report of templates detected in the audio of other templates, detection does not wait for it"""
+
+        self.similar_check_generation += 1
+        generation = self.similar_check_generation
+        t1 = time.monotonic()
+        try:
+            template_index = self.template_index
+            templates = await asyncio.to_thread(lambda: [(name, *self.template_store.get_main_arrays(name))
+                                                         for name in sorted(set(template_index.template_names))])
+            arrays = self.get_template_arrays()
+            count_tasks = max(1, min(len(templates), os.cpu_count() or 1))
+            futures = [self.event_loop.run_in_executor(self.ppe,
+                                                       find_similar_templates,
+                                                       *arrays,
+                                                       templates[num::count_tasks])
+                       for num in range(count_tasks)]
+            results = await asyncio.gather(*futures)
+        except Exception as e:
+            self.log.error(f'ERROR check_similar_templates e={e}')
+            return
 
-            if samplerate != DEFAULT_SAMPLE_RATE:
-                self.log.warning(f'incorrect sample_rate in file_name={file_name} / {samplerate}, SKIP!')
-                continue
-            elif hasattr(audio_data[0], "size") is False:
-                self.log.warning(f'invalid audio_data in file_name={file_name}, SKIP!')
-                continue
-            elif hasattr(audio_data[0], "size") and audio_data[0].size == 2:
-                self.log.warning(f'found stereo in file_name={file_name}, SKIP!')
-                continue
+        if generation != self.similar_check_generation:
+            return  # templates were reloaded, the next check is running
+
+        pairs = merge_similar_pairs([record for result in results for record in result])
+        for record in pairs:
+            if record['kind'] == 'duplicate':
+                self.log.warning(f"Found cross template: {record['template_name']} >> {record['similar_name']} "
+                                 f"{record['match_count']} hash_count_1={record['hash_count']}")
+
+        report = {"time": datetime.now().isoformat(),
+                  "templates": len(templates),
+                  "duration": round(time.monotonic() - t1, 3),
+                  "pairs": pairs}
+        if self.config.template_report_path:
+            try:
+                await asyncio.to_thread(self.save_report, self.config.template_report_path, report)
+            except Exception as e:
+                self.log.error(f'ERROR save template report e={e}')
+        self.log.info(f"end check_similar_templates, templates: {len(templates)}, similar pairs: {len(pairs)}, "
+                      f"time: {report['duration']}s")
+
+    @staticmethod
+    def save_report(file_path: str, report: dict):
+        tmp_path = f'{file_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, file_path)
+
+    def get_template_stats(self) -> dict:
+        stats = dict(self.template_store.stats) if self.template_store is not None else {}
+        stats["reloading"] = self.reload_lock.locked()
+        return stats
+
+    async def reload_templates(self) -> dict:
+        """
+        Compile added and changed templates (in the process pool), drop removed ones and replace the index.
+        The new index is built aside and replaced by one assignment, workers get it between two batches.
+        """
+        async with self.reload_lock:
+            template_index = await asyncio.to_thread(self.template_store.load)
+            if template_index is None:
+                self.log.info('reload_templates: templates are not changed')
+                return self.get_template_stats()
+
+            await asyncio.to_thread(template_index.build)
+            self.template_index = template_index
+            asyncio.create_task(self.check_similar_templates())
+
+            arrays = self.get_template_arrays()
+            results = await asyncio.gather(*[self.run_in_shard(shard, set_template_index, *arrays)
+                                             for shard in range(len(self.detect_executors))], return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException):
+                    # a broken worker is restarted by run_detection with the new index
+                    self.log.error(f'ERROR set_template_index e={result}')
+
+            stats = self.get_template_stats()
+            self.log.info(f"reload_templates: templates={stats['templates']} compiled={stats['compiled']} "
+                          f"removed={stats['removed']} rebuild_time={stats['rebuild_time']}")
+            return stats
+
+    async def start_template_watcher(self):
+        if self.config.template_watch_interval <= 0:
+            return
 
-            self.templates[template_name] = Template(template_id=template_id,
-                                                     template_name=template_name,
-                                                     limit_samples=0,
-                                                     amplitudes=audio_data.tolist())
-            for tmp_hash in self.templates[template_name].fingerprint.hashes_offsets.keys():
-                if self.all_templates_hash.get(tmp_hash) is None:
-                    self.all_templates_hash[tmp_hash] = [template_name]
-                elif template_name in self.all_templates_hash[tmp_hash]:
-                    continue
-                else:
-                    self.all_templates_hash[tmp_hash].append(template_name)
-
-        for template_name in self.templates.keys():
-            found_template, match_count = self.analise_fingerprint(ac_print=self.templates[template_name].fingerprint,
-                                                                   skip_template_name=self.templates[
-                                                                       template_name].template_name,
-                                                                   real_search=False)
-            if found_template and match_count > 6700:
-                self.log.warning(f"Found cross template: {template_name} >> {found_template} {match_count} "
-                                 f"hash_count_1={len(self.templates[template_name].fingerprint.hashes_offsets)} "
-                                 f"hash_count_2={len(self.templates[found_template].fingerprint.hashes_offsets)} ")
-
-                # a_file_path = os.path.join(folder, f'{template_name}.wav')
-                # b_file_path = os.path.join(folder, f'{found_template}.wav')
-                # if self.templates[found_template].count_samples > self.templates[template_name].count_samples:
-                #     if os.path.isfile(a_file_path):
-                #         os.remove(a_file_path)
-                # else:
-                #     if os.path.isfile(b_file_path):
-                #         os.remove(a_file_path)
-        self.log.info(f"end load_templates, hashes: {len(self.all_templates_hash)}, templates: {len(self.templates)}")
+        self.log.info('start template watcher')
+        while self.config.wait_shutdown is False:
+            await asyncio.sleep(self.config.template_watch_interval)
+            try:
+                if not self.reload_lock.locked() and await asyncio.to_thread(self.template_store.is_changed):
+                    await self.reload_templates()
+            except Exception as e:
+                self.log.error(f'ERROR template watcher e={e}')
+        self.log.info('end template watcher')
+
+    def get_template_arrays(self) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+        """Arrays of the index for workers (memory-mapped arrays are sent as ndarray)"""
+
+        return (list(self.template_index.template_names),
+                np.asarray(self.template_index.hashes),
+                np.asarray(self.template_index.ids),
+                np.asarray(self.template_index.offsets))
+
+    def start_detect_executors(self):
+        """Every worker gets the built template index once, in the initializer"""
+
+        initargs = self.get_template_arrays()
+        self.detect_executors = [ProcessPoolExecutor(max_workers=1, initializer=init_worker, initargs=initargs)
+                                 for _ in range(self.config.detect_workers)]
+        self.log.info(f'started detect workers: {len(self.detect_executors)}')
+
+    def restart_detect_executor(self, shard: int):
+        """
+        The worker of the shard died: a new worker with the template index.
+        Channels of the shard are forgotten, so the next pass sends their whole window with reset
+        """
+
+        self.log.error(f'detect worker of shard {shard} is broken, restart it')
+        self.detect_executors[shard].shutdown(wait=False, cancel_futures=True)
+        self.detect_executors[shard] = ProcessPoolExecutor(max_workers=1,
+                                                           initializer=init_worker,
+                                                           initargs=self.get_template_arrays())
+        for chan_id in [chan_id for chan_id in self.detect_chan_ids if self.get_shard(chan_id) == shard]:
+            self.detect_chan_ids.discard(chan_id)
+            self.chan_id_with_samples.pop(chan_id, None)
+            self.reset_chan_ids.discard(chan_id)
+
+    def get_shard(self, chan_id: str) -> int:
+        return zlib.crc32(chan_id.encode()) % len(self.detect_executors)
 
     async def start_loop(self):
         self.log.info("start loop for prepare amplitudes and detection")
         while self.config.wait_shutdown is False:
             await asyncio.sleep(0.1)
             await self.run_prepare_amplitude()
-            await self.add_amps_in_executor()
+            if self.config.detect_dtmf:
+                self.run_dtmf()
         self.log.info("end start_loop")
 
     async def run_prepare_amplitude(self):
@@ -112,63 +218,161 @@ class Detector(object):
         chan_id_list = list(self.audio_containers.keys())
         random.shuffle(chan_id_list)
 
+        for chan_id in list(self.detect_chan_ids):
+            if chan_id not in self.audio_containers:
+                self.drop_channel(chan_id)
+
         for chan_id in chan_id_list:
             audio_container = self.audio_containers[chan_id]
             if audio_container is None:
                 continue
             elif audio_container.event_destroy:
+                self.drop_channel(chan_id)
                 continue
             elif audio_container.found_templates:
+                self.drop_channel(chan_id)
                 continue
             elif audio_container.found_first_noise == 0:
                 continue
             elif audio_container.duration_stream < 2:
                 continue
             elif datetime.now() > audio_container.detect_until_time:
+                self.drop_channel(chan_id)
                 continue
             elif audio_container.seq_num_last_package == audio_container.last_detect_seq_num:
                 continue
+            elif self.is_quiet_window(audio_container):
+                # samples are not marked as sent: they go to the worker with the first loud package,
+                # or the window is reset if the quiet part is longer than the window
+                audio_container.count_gated_ticks += 1
+                continue
+
+            # only packages after the previous detection are sent, the worker keeps the window of the channel
+            count_new_packages = audio_container.seq_num_last_package - audio_container.last_detect_seq_num
+            if chan_id not in self.detect_chan_ids or count_new_packages >= DETECT_WINDOW_PACKAGES:
+                self.detect_chan_ids.add(chan_id)
+                self.reset_chan_ids.add(chan_id)
+                self.drop_chan_ids.discard(chan_id)
+                self.chan_id_with_samples.pop(chan_id, None)
+                count_new_packages = DETECT_WINDOW_PACKAGES
 
-            self.chan_id_with_amps[chan_id] = []
-            last_seq_numbers = sorted(list(audio_container.analyzed_samples.keys()))[-150:]  # last three seconds
-            for seq_num in last_seq_numbers:
-                self.chan_id_with_amps[chan_id].extend(audio_container.analyzed_samples[seq_num])
+            samples = audio_container.get_last_amplitudes(count_new_packages)
+            self.chan_id_with_samples.setdefault(chan_id, []).append(samples)
 
             audio_container.last_detect_seq_num = audio_container.seq_num_last_package
+            audio_container.count_detect_ticks += 1
+
+    def run_dtmf(self):
+        """New packages of all channels are checked for DTMF with one call of Goertzel filters"""
+
+        for chan_id in list(self.dtmf_detector.channels):
+            if chan_id not in self.audio_containers:
+                self.dtmf_detector.drop_channel(chan_id)
+
+        chan_packages: dict[str, np.ndarray] = {}
+        for chan_id, audio_container in list(self.audio_containers.items()):
+            if audio_container is None or audio_container.audio_buffer is None or audio_container.parse_finished:
+                continue
+            elif audio_container.audio_buffer.samples_per_package != DEFAULT_SAMPLE_SIZE:
+                continue  # Goertzel filters are prepared for 20 ms packages
+            elif len(audio_container.audio_buffer) == 0:
+                continue
+            elif audio_container.audio_buffer.last_seq_num < audio_container.cursor_dtmf:
+                continue
+
+            _, packages = audio_container.audio_buffer.get_packages(audio_container.cursor_dtmf)
+            chan_packages[chan_id] = packages
+            audio_container.cursor_dtmf = audio_container.audio_buffer.last_seq_num + 1
 
-    async def add_amps_in_executor(self):
-        if len(self.chan_id_with_amps) == 0:
+        try:
+            new_digits = self.dtmf_detector.process(chan_packages)
+        except Exception as e:
+            self.log.error(f'ERROR run_dtmf e={e}')
             return
 
-        self.log.info("BEFORE run_in_executor")
-        for chan_id in list(self.chan_id_with_amps):
-            ac_amps = self.chan_id_with_amps.pop(chan_id)
+        for chan_id, digits in new_digits.items():
+            self.audio_containers[chan_id].add_dtmf_digits(digits)
+
+    def get_dtmf_stats(self) -> dict:
+        return self.dtmf_detector.get_stats()
+
+    def is_quiet_window(self, audio_container: AudioContainer) -> bool:
+        """
+        Energy gate: the whole detection window is too quiet for hashes (silent gaps, comfort noise),
+        so no template can be found - STFT and matching are skipped.
+        detect_gate_amplitude < 0: only windows which cannot have peaks above DEFAULT_AMP_MIN (is_without_peaks),
+        > 0: peak-to-peak amplitude of the window below this value, 0: off
+        """
+        if self.config.detect_gate_amplitude == 0:
+            return False
+
+        min_amp, max_amp = audio_container.get_amplitude_range(DETECT_WINDOW_PACKAGES)
+        if self.config.detect_gate_amplitude > 0:
+            return max_amp - min_amp < self.config.detect_gate_amplitude
+        return is_without_peaks(min_amp, max_amp)
+
+    def pop_detect_tasks(self) -> dict[int, list[tuple[str, np.ndarray | None, int, bool]]]:
+        """Tasks of detect_channels grouped by shard"""
+
+        shard_tasks: dict[int, list] = {}
+        for chan_id in self.drop_chan_ids:
+            shard_tasks.setdefault(self.get_shard(chan_id), []).append((chan_id, None, 0, False))
+        self.drop_chan_ids.clear()
+
+        for chan_id, samples in self.chan_id_with_samples.items():
+            audio_container = self.audio_containers.get(chan_id)
+            if audio_container is None:
+                continue
+            window_samples = DETECT_WINDOW_PACKAGES * audio_container.audio_buffer.samples_per_package
+            shard_tasks.setdefault(self.get_shard(chan_id), []).append(
+                (chan_id, np.concatenate(samples), window_samples, chan_id in self.reset_chan_ids))
+        self.chan_id_with_samples.clear()
+        self.reset_chan_ids.clear()
+        return shard_tasks
 
-            args = functools.partial(get_spectrum_with_name, name=chan_id, amplitudes=ac_amps)
-            self.executor_tasks.append(self.event_loop.run_in_executor(self.ppe, args))
+    def split_detect_tasks(self, shard_tasks: dict[int, list]) -> list[tuple[int, list]]:
+        """Batches of detect_batch_size channels, batches of one shard are executed in order"""
+
+        batch_size = self.config.detect_batch_size
+        return [(shard, tasks[start: start + batch_size])
+                for shard, tasks in shard_tasks.items()
+                for start in range(0, len(tasks), batch_size)]
 
     async def run_detection(self):
         self.log.info('start run_detection')
         while self.config.wait_shutdown is False:
-            if len(self.executor_tasks) == 0:
-                await asyncio.sleep(0.1)
+            # new samples are collected during detect_flush_interval, the next batches are sent after the results
+            await asyncio.sleep(self.config.detect_flush_interval)
+            shard_tasks = self.pop_detect_tasks()
+            if len(shard_tasks) == 0:
                 continue
 
             t1 = time.monotonic()
-            for task in asyncio.as_completed(self.executor_tasks):
-                chan_id, spectrum = await task
-                fingerprint: FingerPrint = get_fingerprint_with_spectrum(print_name=chan_id, spectrum=spectrum)
-                await asyncio.sleep(0)
-                detect_result = self.analise_fingerprint(fingerprint)
-                audio_container = self.audio_containers.get(fingerprint.print_name)
-                if audio_container is None:
+            batches = self.split_detect_tasks(shard_tasks)
+            futures = [self.run_in_shard(shard, detect_channels, tasks, bool(self.config.save_png_match_detection))
+                       for shard, tasks in batches]
+
+            broken_shards = set()
+            for (shard, _), results in zip(batches, await asyncio.gather(*futures, return_exceptions=True)):
+                if isinstance(results, BrokenProcessPool):
+                    broken_shards.add(shard)
+                    continue
+                elif isinstance(results, BaseException):
+                    self.log.error(f'ERROR detect_channels e={results}')
                     continue
 
-                audio_container.duration_check_detect += time.monotonic() - t1
+                for chan_id, found_template, match_count, duration in results:
+                    audio_container = self.audio_containers.get(chan_id)
+                    if audio_container is None:
+                        continue
 
-                if detect_result is not None:
-                    found_template, match_count = detect_result
-                    self.audio_containers[fingerprint.print_name].add_found_template(found_template)
+                    audio_container.duration_check_detect += duration
+                    if found_template is not None:
+                        self.log.success(f'template:{found_template} chan_id:{chan_id} match_count:{match_count}')
+                        audio_container.add_found_template(found_template)
+
+            for shard in broken_shards:
+                self.restart_detect_executor(shard)
 
             t2 = time.monotonic()
             self.detection_times.append(t2 - t1)
@@ -179,66 +383,21 @@ class Detector(object):
                               f"max_time={max(self.detection_times)}")
                 self.detection_times.clear()
 
-            for task in self.executor_tasks.copy():
-                if task.done():
-                    self.executor_tasks.remove(task)
+        for executor in self.detect_executors:
+            executor.shutdown(wait=False, cancel_futures=True)
         self.log.info('end run_detection')
 
-    def analise_fingerprint(self,
-                            ac_print: FingerPrint,
-                            skip_template_name: str = '',
-                            real_search: bool = True) -> tuple[str, int] | tuple[None, None]:
-        ac_tmp_hash_similar: dict[str, list[str]] = {}
-        for ac_hash in ac_print.hashes_offsets.keys():
-            if ac_hash in self.all_templates_hash.keys():
-                for tmp_name in self.all_templates_hash[ac_hash]:
-                    if isinstance(ac_tmp_hash_similar.get(tmp_name), list):
-                        ac_tmp_hash_similar[tmp_name].append(ac_hash)
-                    else:
-                        ac_tmp_hash_similar[tmp_name] = [ac_hash]
-
-        for template_name in ac_tmp_hash_similar.keys():
-            count_start_points = len(ac_tmp_hash_similar[template_name])
-
-            if count_start_points < 11:
-                continue
-            elif template_name == skip_template_name:
-                continue
-
-            template_hashes_offsets = self.templates[template_name].fingerprint.hashes_offsets
-            timely_hashes, shift = ac_print.get_timely_hashes(source_hashes_offsets=ac_print.hashes_offsets,
-                                                              correct_hashes_offsets=template_hashes_offsets)
-
-            offset_times = sorted(set(timely_hashes.values()))
-
-            len_timely_hashes, len_offset_times = len(timely_hashes), len(offset_times)
+    async def run_in_shard(self, shard: int, func, *args):
+        """BrokenProcessPool of submit (the pool is already known as broken) is returned by gather as other errors"""
 
-            if len_timely_hashes < 5 or len_offset_times < 2:
-                continue
-
-            match_count = len_timely_hashes + len_offset_times * 15
-
-            if match_count < 80:
-                if match_count > 60:
-                    self.log.info(f'match_count={match_count} {ac_print.print_name} > {template_name}')
-                continue
+        return await self.event_loop.run_in_executor(self.detect_executors[shard], func, *args)
 
-            if real_search:
-                self.log.success(f'len points:{len(timely_hashes)} template:{template_name} '
-                                 f'chan_id:{ac_print.print_name} len offset_times: {len(offset_times)}, '
-                                 f'count_start_points: {count_start_points}')
-                if self.config.save_png_match_detection:
-                    ac_print.save_matching_print2png(first_points=ac_print.first_points,
-                                                     second_points=ac_print.second_points,
-                                                     arr2d=ac_print.arr2d,
-                                                     hashes=ac_tmp_hash_similar[template_name],
-                                                     save_folder='fingerprint_record',
-                                                     print_name=f"{ac_print.print_name}_{template_name}",
-                                                     shift_line=shift)
-
-            return template_name, match_count
-
-        return None, None
+    def drop_channel(self, chan_id: str):
+        if chan_id in self.detect_chan_ids:
+            self.detect_chan_ids.discard(chan_id)
+            self.drop_chan_ids.add(chan_id)
+        self.chan_id_with_samples.pop(chan_id, None)
+        self.reset_chan_ids.discard(chan_id)
 
 
 if __name__ == "__main__":
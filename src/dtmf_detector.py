@@ -0,0 +1,125 @@
+from functools import lru_cache
+
+import numpy as np
+
+from src.config import (DEFAULT_SAMPLE_RATE,
+                        DTMF_MIN_AMPLITUDE,
+                        DTMF_MIN_TONE_RATIO,
+                        DTMF_MAX_TWIST_DB,
+                        DTMF_MAX_REVERSE_TWIST_DB,
+                        DTMF_RELATIVE_PEAK_DB,
+                        DTMF_MIN_PACKAGES)
+
+DTMF_LOW_FREQS = (697, 770, 852, 941)
+DTMF_HIGH_FREQS = (1209, 1336, 1477, 1633)
+DTMF_KEYS = ('123A', '456B', '789C', '*0#D')  # row - low tone, column - high tone
+NO_DIGIT = -1
+
+
+@lru_cache(maxsize=8)
+def get_goertzel_basis(count_samples: int, fs: int = DEFAULT_SAMPLE_RATE) -> np.ndarray:
+    """
+    Cos and sin of the 8 DTMF frequencies, matrix (count_samples, 16): the product with a package gives
+    the same values as Goertzel filters at exact frequencies (not rounded to FFT bins)
+    """
+    phases = 2 * np.pi * np.arange(count_samples)[:, None] * np.array(DTMF_LOW_FREQS + DTMF_HIGH_FREQS)[None, :] / fs
+    basis = np.concatenate((np.cos(phases), np.sin(phases)), axis=1).astype(np.float32)
+    basis.flags.writeable = False
+    return basis
+
+
+def get_tone_energies(packages: np.ndarray, fs: int = DEFAULT_SAMPLE_RATE) -> np.ndarray:
+    """
+    Goertzel filters of all packages with one matrix product
+
+    :param packages: int16 matrix (count_packages, count_samples)
+    :return: matrix (count_packages, 8), energy of every DTMF frequency in units of sum(samples ** 2)
+    """
+    count_samples = packages.shape[1]
+    products = packages.astype(np.float32) @ get_goertzel_basis(count_samples, fs)
+    return (np.square(products[:, :8]) + np.square(products[:, 8:])) * (2 / count_samples)
+
+
+def detect_digits(packages: np.ndarray, fs: int = DEFAULT_SAMPLE_RATE) -> np.ndarray:
+    """
+    DTMF digit of every package: the strongest tone of each group, energy, twist and relative peak checks
+
+    :param packages: int16 matrix (count_packages, count_samples), packages of any channels
+    :return: index of DTMF_KEYS (row * 4 + column) or NO_DIGIT for every package
+    """
+    if packages.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    energies = get_tone_energies(packages, fs)
+    total = np.einsum('ij,ij->i', packages.astype(np.float32), packages.astype(np.float32))
+
+    rows, columns = energies[:, :4].argmax(axis=1), energies[:, 4:].argmax(axis=1)
+    positions = np.arange(packages.shape[0])
+    low, high = energies[positions, rows], energies[positions, 4 + columns]
+
+    # energy of a sine with amplitude A in count_samples samples is A ** 2 * count_samples / 2
+    valid = np.minimum(low, high) >= DTMF_MIN_AMPLITUDE ** 2 * packages.shape[1] / 2
+    valid &= low + high >= DTMF_MIN_TONE_RATIO * total
+    valid &= high >= low * 10 ** (-DTMF_MAX_TWIST_DB / 10)
+    valid &= high <= low * 10 ** (DTMF_MAX_REVERSE_TWIST_DB / 10)
+
+    relative_peak = 10 ** (DTMF_RELATIVE_PEAK_DB / 10)
+    for group, peak in ((energies[:, :4], low), (energies[:, 4:], high)):
+        others = np.sort(group, axis=1)[:, -2]  # the second strongest frequency of the group
+        valid &= peak >= others * relative_peak
+
+    return np.where(valid, rows * 4 + columns, NO_DIGIT)
+
+
+class DtmfDetector(object):
+    """
+    Streaming DTMF detection of all channels.
+
+    New packages of all channels are checked together (detect_digits), one call per tick.
+    A digit is emitted once, when it lasts min_packages packages, the next one needs a package without it.
+    """
+
+    def __init__(self, fs: int = DEFAULT_SAMPLE_RATE, min_packages: int = DTMF_MIN_PACKAGES):
+        self.fs: int = fs
+        self.min_packages: int = min_packages
+        self.channels: dict[str, list[int]] = {}  # chan_id: [current digit, count of packages with it]
+        self.count_packages: int = 0
+        self.count_digits: int = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "channels": len(self.channels),
+            "packages": self.count_packages,
+            "digits": self.count_digits
+        }
+
+    def drop_channel(self, chan_id: str):
+        self.channels.pop(chan_id, None)
+
+    def process(self, chan_packages: dict[str, np.ndarray]) -> dict[str, str]:
+        """
+        :param chan_packages: new int16 packages of every channel, matrix (count_packages, count_samples),
+                              all channels must have the same count_samples
+        :return: new digits of channels
+        """
+        chan_packages = {chan_id: packages for chan_id, packages in chan_packages.items() if packages.shape[0]}
+        if len(chan_packages) == 0:
+            return {}
+
+        digits = detect_digits(np.concatenate(list(chan_packages.values())), fs=self.fs).tolist()
+        self.count_packages += len(digits)
+
+        new_digits: dict[str, str] = {}
+        position = 0
+        for chan_id, packages in chan_packages.items():
+            state = self.channels.setdefault(chan_id, [NO_DIGIT, 0])
+            for digit in digits[position: position + packages.shape[0]]:
+                if digit != state[0]:
+                    state[0], state[1] = digit, 0
+                state[1] += 1
+                if digit != NO_DIGIT and state[1] == self.min_packages:
+                    key = DTMF_KEYS[digit // 4][digit % 4]
+                    new_digits[chan_id] = new_digits.get(chan_id, '') + key
+                    self.count_digits += 1
+            position += packages.shape[0]
+        return new_digits
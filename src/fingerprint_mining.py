@@ -1,7 +1,5 @@
-from operator import itemgetter
-from typing import List, Tuple
+from functools import lru_cache
 
-import matplotlib.mlab as mlab
 import numpy as np
 from scipy.ndimage import generate_binary_structure, iterate_structure
 from scipy.ndimage import maximum_filter
@@ -17,6 +15,13 @@ from src.config import (DEFAULT_SAMPLE_RATE,
                         MIN_HASH_TIME_DELTA,
                         MAX_HASH_TIME_DELTA)
 from src.custom_dataclasses.fingerprint import FingerPrint
+from src.custom_functions.stft import specgram, get_max_power
+
+# hash fields packed into one uint64: freq1 (16 bit) | freq2 (16 bit) | t_delta (16 bit) | balance (1 bit)
+HASH_FREQ1_SHIFT = 33
+HASH_FREQ2_SHIFT = 17
+HASH_TIME_DELTA_SHIFT = 1
+HASH_FIELD_MASK = 0xFFFF
 
 
 def softmax(x):
@@ -25,8 +30,22 @@ def softmax(x):
     return e_x / e_x.sum(axis=0)  # only difference
 
 
+def pack_hash(freq1: int, freq2: int, t_delta: int, balance: int) -> int:
+    return (int(freq1) << HASH_FREQ1_SHIFT) | (int(freq2) << HASH_FREQ2_SHIFT) | \
+        (int(t_delta) << HASH_TIME_DELTA_SHIFT) | int(balance)
+
+
+def pack_hashes(freq1: np.ndarray, freq2: np.ndarray, t_delta: np.ndarray, balance: np.ndarray) -> np.ndarray:
+    """Vectorized pack_hash, returns uint64 array"""
+
+    return (freq1.astype(np.uint64) << np.uint64(HASH_FREQ1_SHIFT)) | \
+        (freq2.astype(np.uint64) << np.uint64(HASH_FREQ2_SHIFT)) | \
+        (t_delta.astype(np.uint64) << np.uint64(HASH_TIME_DELTA_SHIFT)) | \
+        balance.astype(np.uint64)
+
+
 def get_fingerprint(print_name: str,
-                    amplitudes: list[int],
+                    amplitudes: list[int] | np.ndarray,
                     fs: int = DEFAULT_SAMPLE_RATE,
                     wsize: int = DEFAULT_WINDOW_SIZE,
                     wratio: float = DEFAULT_OVERLAP_RATIO,
@@ -47,19 +66,12 @@ def get_fingerprint(print_name: str,
     :return: a list of hashes with their corresponding offsets.
     """
     try:
-        amplitudes = [0] * wsize * 2 + amplitudes + [0] * wsize
+        amplitudes = np.concatenate((np.zeros(wsize * 2, dtype=np.float32),
+                                     np.asarray(amplitudes, dtype=np.float32),
+                                     np.zeros(wsize, dtype=np.float32)))
 
         # FFT the signal and extract frequency components
-        spectrum, freqs, bins = mlab.specgram(
-            amplitudes,
-            NFFT=wsize,
-            Fs=fs,
-            window=mlab.window_hanning,
-            noverlap=int(wsize * wratio)
-        )
-
-        if isinstance(spectrum, np.ndarray) is False:
-            spectrum = np.zeros(1)
+        spectrum = specgram(amplitudes, fs=fs, wsize=wsize, wratio=wratio)
 
         if plot:
             # print(spectrum.shape)  # number_time_points: (len(amplitudes) - wsize)/ int(wsize*wratio)
@@ -91,15 +103,14 @@ def get_fingerprint_with_spectrum(print_name: str,
     FFT the channel, log transform output, find local maxima, then return locally sensitive hashes.
 
     :param print_name: fingerprint name
-    :param spectrum: the returned first param from mlab.specgram
+    :param spectrum: power spectrum (stft.specgram)
     :param fan_value: degree to which a fingerprint can be paired with its neighbors.
     :param amp_min: minimum amplitude in spectrogram in order to be considered a peak.
     :param plot: show plot graphic
     :return: a list of hashes with their corresponding offsets.
     """
     try:
-        # Apply log transform since specgram function returns linear array. 0s are excluded to avoid np warning.
-        arr2d = 10 * np.log10(spectrum, out=np.zeros_like(spectrum), where=(spectrum > 1))
+        arr2d = get_log_spectrum(spectrum)
 
         local_maxima = get_2d_peaks(arr2d, plot=plot, print_name=print_name, amp_min=amp_min)
 
@@ -115,7 +126,7 @@ def get_2d_peaks(arr2d: np.array,
                  print_name: str = '',
                  amp_min: int = DEFAULT_AMP_MIN,
                  connectivity_mask: int = CONNECTIVITY_MASK,
-                 peak_neighborhood_size: int = PEAK_NEIGHBORHOOD_SIZE) -> list[tuple[int, int]]:
+                 peak_neighborhood_size: int = PEAK_NEIGHBORHOOD_SIZE) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     Extract maximum peaks from the spectrogram matrix (arr2d).
 
@@ -125,52 +136,29 @@ def get_2d_peaks(arr2d: np.array,
     :param amp_min: minimum amplitude in spectrogram in order to be considered a peak.
     :param connectivity_mask: determines which elements of the output array belong to the structure
     :param peak_neighborhood_size: number of dilation's performed on the structure with itself
-    :return: a list composed by a list of frequencies and times.
+    :return: frequencies, times and amplitudes of peaks.
     """
     try:
         # Original code from the repo is using a morphology mask that does not consider diagonal elements
-        # as neighbors (basically a diamond figure) and then applies a dilation over it, so what I'm proposing
-        # is to change from the current diamond figure to a just a normal square one:
+        # as neighbors (basically a diamond figure) and then applies a dilation over it, the mask shape is
+        # configurable in order to allow both ways of find maximum peaks:
         #       F   T   F           T   T   T
         #       T   T   T   ==>     T   T   T
         #       F   T   F           T   T   T
-        # In my local tests time performance of the square mask was ~3 times faster
-        # respect to the diamond one, without hurting accuracy of the predictions.
-        # I've made now the mask shape configurable in order to allow both ways of find maximum peaks.
-        # That being said, we generate the mask by using the following function
         # https://docs.scipy.org/doc/scipy/reference/generated/scipy.ndimage.generate_binary_structure.html
-        struct = generate_binary_structure(2, connectivity_mask)
-
-        #  And then we apply dilation using the following function
-        #  http://docs.scipy.org/doc/scipy/reference/generated/scipy.ndimage.iterate_structure.html
-        #  Take into account that if PEAK_NEIGHBORHOOD_SIZE is 2 you can avoid the use of the scipy functions and just
-        #  change it by the following code:
-        #  neighborhood = np.ones((PEAK_NEIGHBORHOOD_SIZE * 2 + 1, PEAK_NEIGHBORHOOD_SIZE * 2 + 1), dtype=bool)
-        neighborhood = iterate_structure(struct, peak_neighborhood_size)
-
-        # find local maxima using our filter mask
-        local_max = maximum_filter(arr2d, footprint=neighborhood) == arr2d
-
-        # extract peaks
-        amps = arr2d[local_max]
-
-        freqs, times = np.where(local_max)
-
-        # filter peaks
-        amps = amps.flatten()
-
-        # get indices for frequency and time
-        filter_idxs = np.where(amps > amp_min)
+        # http://docs.scipy.org/doc/scipy/reference/generated/scipy.ndimage.iterate_structure.html
+        arr2d = np.asarray(arr2d, dtype=np.float32)
 
-        freqs_filter = freqs[filter_idxs]
-        times_filter = times[filter_idxs]
-        amps_filter = amps[filter_idxs]
+        # find local maxima using our filter mask, weak ones are dropped before the extraction
+        arr2d_max = get_neighborhood_maximum(arr2d, connectivity_mask, peak_neighborhood_size)
+        freqs_filter, times_filter = np.nonzero((arr2d_max == arr2d) & (arr2d > amp_min))
+        amps_filter = arr2d[freqs_filter, times_filter]
 
         if plot:
             import matplotlib.pyplot as plt
             # scatter of the peaks
             fig, ax = plt.subplots()
-            ax.imshow(maximum_filter(arr2d, footprint=neighborhood), interpolation='none')
+            ax.imshow(arr2d_max, interpolation='none')
             ax.scatter(times_filter, freqs_filter)
             ax.set_xlabel('Time')
             ax.set_ylabel('Frequency')
@@ -178,65 +166,142 @@ def get_2d_peaks(arr2d: np.array,
             plt.gca().invert_yaxis()
             plt.show()
 
-        return list(zip(freqs_filter, times_filter, amps_filter))
+        return freqs_filter, times_filter, amps_filter
     except Exception as e:
         print(f'ERROR! [get_2d_peaks] Exception detail: {e}')
 
 
+def is_without_peaks(min_amp: float, max_amp: float, amp_min: int = DEFAULT_AMP_MIN) -> bool:
+    """
+    Audio with all samples in [min_amp, max_amp] has no peaks above amp_min at frequencies used in hashes
+    (freq >= 2, see get_peak_pairs) - the bound of its power spectrum is not above amp_min after the log transform
+    """
+    return get_max_power(min_amp, max_amp, first_bin=2) * (1 + 1e-3) <= 10 ** (amp_min / 10)
+
+
+def get_neighborhood_maximum(arr2d: np.ndarray,
+                             connectivity_mask: int = CONNECTIVITY_MASK,
+                             peak_neighborhood_size: int = PEAK_NEIGHBORHOOD_SIZE) -> np.ndarray:
+    """
+    The same as maximum_filter with footprint iterate_structure(generate_binary_structure(2, connectivity_mask)),
+    but the square footprint is filtered separably (size=) and the diamond one by maximums of growing columns.
+    """
+    neighborhood = get_peak_neighborhood(connectivity_mask, peak_neighborhood_size)
+    if neighborhood.all():
+        return maximum_filter(arr2d, size=neighborhood.shape)
+    elif connectivity_mask != 1:
+        return maximum_filter(arr2d, footprint=neighborhood)
+
+    # diamond of radius r: maximum of columns of height 2k + 1 shifted by r - k frames, for k in 0..r
+    radius = neighborhood.shape[1] // 2
+    count_times = arr2d.shape[1]
+    column = np.pad(arr2d, ((0, 0), (radius, radius)), mode='symmetric')  # 'reflect' of scipy.ndimage
+    result = np.maximum(column[:, :count_times], column[:, 2 * radius:])
+    for k in range(1, radius + 1):
+        column = grow_columns(column)
+        np.maximum(result, column[:, k: k + count_times], out=result)
+        np.maximum(result, column[:, 2 * radius - k: 2 * radius - k + count_times], out=result)
+    return result
+
+
+def grow_columns(arr2d: np.ndarray) -> np.ndarray:
+    """Maximum of 3 neighbours in every column (the edge is reflected)"""
+
+    if arr2d.shape[0] < 2:
+        return arr2d
+    pairs = np.maximum(arr2d[:-1], arr2d[1:])
+    result = np.empty_like(arr2d)
+    np.maximum(pairs[:-1], pairs[1:], out=result[1:-1])
+    result[0], result[-1] = pairs[0], pairs[-1]
+    return result
+
+
+def get_log_spectrum(spectrum: np.ndarray) -> np.ndarray:
+    """Apply log transform since specgram function returns linear array. 0s are excluded to avoid np warning."""
+
+    return 10 * np.log10(spectrum, out=np.zeros_like(spectrum), where=(spectrum > 1))
+
+
+def get_peak_neighborhood_radius(connectivity_mask: int = CONNECTIVITY_MASK,
+                                 peak_neighborhood_size: int = PEAK_NEIGHBORHOOD_SIZE) -> int:
+    """Count of frames on each side, which are used for detect a peak"""
+
+    return get_peak_neighborhood(connectivity_mask, peak_neighborhood_size).shape[1] // 2
+
+
+@lru_cache(maxsize=8)
+def get_peak_neighborhood(connectivity_mask: int = CONNECTIVITY_MASK,
+                          peak_neighborhood_size: int = PEAK_NEIGHBORHOOD_SIZE) -> np.ndarray:
+    """Footprint of a peak: the mask generated with connectivity_mask and dilated peak_neighborhood_size times"""
+
+    struct = generate_binary_structure(2, connectivity_mask)
+    neighborhood = iterate_structure(struct, peak_neighborhood_size)
+    neighborhood.flags.writeable = False
+    return neighborhood
+
+
+def get_peak_pairs(freqs: np.ndarray,
+                   times: np.ndarray,
+                   amps: np.ndarray,
+                   fan_value: int = DEFAULT_FAN_VALUE,
+                   first_new: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Hashes of all pairs (i, i + j) for j in 1..fan_value-1 of sorted peaks, without removing of duplicates
+
+    :param first_new: only pairs with the second peak from this index (previous peaks were paired before)
+    :return: hashes (uint64), offsets (int64) and points (t1, freq1, t2, freq2) in order of the nested loops
+    """
+    count_peaks = freqs.size
+    first = np.arange(count_peaks)[:, None]
+    second = first + np.arange(1, max(fan_value, 1))[None, :]
+    exists = (second < count_peaks) & (second >= first_new)
+    first, second = np.broadcast_to(first, second.shape)[exists], second[exists]  # row-major order
+
+    freq1, freq2 = freqs[first], freqs[second]
+    t1, t2 = times[first], times[second]
+    amp1, amp2 = amps[first], amps[second]
+    t_delta = t2 - t1
+
+    valid = (freq1 >= 2) & (freq2 >= 2) & (MIN_HASH_TIME_DELTA <= t_delta) & (t_delta <= MAX_HASH_TIME_DELTA)
+
+    # the lower frequency is the first point of the hash
+    swap = freq1 > freq2
+    freq1, freq2 = np.where(swap, freq2, freq1)[valid], np.where(swap, freq1, freq2)[valid]
+    t1, t2 = np.where(swap, t2, t1)[valid], np.where(swap, t1, t2)[valid]
+    balance = np.where(swap, amp2 > amp1, amp1 > amp2)[valid]
+
+    hashes = pack_hashes(freq1, freq2, t_delta[valid], balance)
+    points = np.stack((t1, freq1, t2, freq2), axis=1).astype(np.int64)
+    return hashes, t1.astype(np.int64), points
+
+
 def generate_hashes(skeleton: FingerPrint,
-                    peaks: List[Tuple[int, int]],
+                    peaks: tuple[np.ndarray, np.ndarray, np.ndarray],
                     fan_value: int = DEFAULT_FAN_VALUE) -> FingerPrint:
     """
+    Every peak is paired with the next fan_value - 1 peaks, all pairs are built at once.
+
     :param skeleton: FingerPrint is not complete yet
-    :param peaks: list of peak frequencies and times.
+    :param peaks: frequencies, times and amplitudes of peaks.
     :param fan_value: degree to which a fingerprint can be paired with its neighbors.
     :return: FingerPrint is completely ready
     """
     try:
-        # frequencies are in the first position of the tuples
-        idx_freq = 0
-        # times are in the second position of the tuples
-        idx_time = 1
-        # amps are in the third position of the tuples
-        idx_amp = 2
+        freqs, times, amps = (np.asarray(values) for values in peaks)
 
         if PEAK_SORT:
-            peaks.sort(key=itemgetter(1))
-
-        # hashes = []
-        # hash_times = []
-        for i in range(len(peaks)):
-            for j in range(1, fan_value):
-                if (i + j) < len(peaks):
-
-                    freq1 = peaks[i][idx_freq]
-                    freq2 = peaks[i + j][idx_freq]
-                    if freq1 < 2 or freq2 < 2:
-                        continue
-
-                    t1 = peaks[i][idx_time]
-                    t2 = peaks[i + j][idx_time]
-                    t_delta = t2 - t1
-
-                    amp1 = peaks[i][idx_amp]
-                    amp2 = peaks[i + j][idx_amp]
-
-                    if freq1 > freq2:
-                        freq1, freq2 = freq2, freq1
-                        t1, t2 = t2, t1
-                        amp1, amp2 = amp2, amp1
-
-                    balance = 0
+            order = np.argsort(times, kind='stable')
+            freqs, times, amps = freqs[order], times[order], amps[order]
 
-                    if amp1 > amp2:
-                        balance = 1
+        hashes, t1, points = get_peak_pairs(freqs, times, amps, fan_value=fan_value)
 
-                    if MIN_HASH_TIME_DELTA <= t_delta <= MAX_HASH_TIME_DELTA:
-                        hstr = f"{freq1}|{freq2}|{t_delta}|{balance}"
-                        skeleton.add_hash_offset(hstr, t1)
-                        skeleton.add_first_points(hstr, t1, freq1)
-                        skeleton.add_second_points(hstr, t2, freq2)
+        # keep the first pair of every hash
+        _, first_index = np.unique(hashes, return_index=True)
+        first_index.sort()
 
+        skeleton.hashes = hashes[first_index]
+        skeleton.offsets = t1[first_index]
+        skeleton.points = points[first_index]
         return skeleton
     except Exception as e:
         print(f'ERROR! [generate_hashes] Exception detail: {e}')
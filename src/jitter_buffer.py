@@ -0,0 +1,149 @@
+import heapq
+import time
+
+from src.custom_dataclasses.package import Package
+
+SEQ_MODULO = 65536
+MAX_MISORDER = 100  # RFC 3550 A.1
+MAX_LATE_HISTORY = 1000
+
+
+class JitterBuffer(object):
+    """
+    Bounded jitter buffer of one RTP stream (one SSRC).
+
+    Every package gets extended (wrap-aware) sequence number, packages are released in order
+    after playout_delay. Missing package is declared lost, when the next package has waited playout_delay
+    or when the buffer is full.
+    """
+
+    def __init__(self,
+                 playout_delay: float = 0.2,
+                 max_size: int = 500):
+        self.playout_delay: float = playout_delay
+        self.max_size: int = max_size
+
+        self.heap: list[int] = []
+        self.packages: dict[int, Package] = {}
+
+        self.highest_ext_seq: int | None = None
+        self.highest_seq: int = 0
+        self.highest_timestamp: int = 0
+        self.timestamp_step: int = 0  # RTP timestamp increment per package
+        self.next_ext_seq: int | None = None
+        self.lost_ext_seq: set[int] = set()
+
+        self.count_received: int = 0
+        self.count_released: int = 0
+        self.count_lost: int = 0
+        self.count_late: int = 0
+        self.count_duplicate: int = 0
+        self.count_resets: int = 0
+
+    def __len__(self) -> int:
+        return len(self.packages)
+
+    def get_stats(self) -> dict:
+        return {
+            "received": self.count_received,
+            "released": self.count_released,
+            "lost": self.count_lost,
+            "late": self.count_late,
+            "duplicate": self.count_duplicate,
+            "resets": self.count_resets,
+            "buffered": len(self.packages)
+        }
+
+    def get_ext_seq(self, package: Package) -> int:
+        """
+        Extended sequence number, the RTP timestamp is used for detect restart of the sequence.
+        A jump of the sequence out of MAX_MISORDER is a restart with any change of the timestamp.
+        """
+
+        if self.highest_ext_seq is None:
+            self.highest_ext_seq = package.seq_num
+            self.highest_seq = package.seq_num
+            self.highest_timestamp = package.timestamp
+            return package.seq_num
+
+        # signed distance to the highest received package in 16 bit space, handles 65535 -> 0 wrap
+        seq_delta = (package.seq_num - self.highest_seq + SEQ_MODULO // 2) % SEQ_MODULO - SEQ_MODULO // 2
+        timestamp_delta = (package.timestamp - self.highest_timestamp + 2 ** 31) % 2 ** 32 - 2 ** 31
+
+        expected_delta = round(timestamp_delta / self.timestamp_step) if self.timestamp_step > 0 else seq_delta
+        is_jump = seq_delta > expected_delta + MAX_MISORDER or seq_delta < -MAX_MISORDER
+        if is_jump and timestamp_delta > 0:
+            # sequence was restarted (for example by media server), but time goes on
+            # (jump of the timestamp bigger than jump of the sequence is silence suppression, it is normal)
+            self.count_resets += 1
+            seq_delta = max(1, expected_delta)
+        elif is_jump:
+            # sequence and timestamp were restarted together (new sender), the package follows the highest one
+            self.count_resets += 1
+            seq_delta = 1
+        elif 0 < seq_delta and timestamp_delta > 0:
+            self.timestamp_step = timestamp_delta // seq_delta
+
+        ext_seq = self.highest_ext_seq + seq_delta
+        if seq_delta > 0:
+            self.highest_ext_seq = ext_seq
+            self.highest_seq = package.seq_num
+            self.highest_timestamp = package.timestamp
+        return ext_seq
+
+    def push(self, package: Package) -> None:
+        self.count_received += 1
+        ext_seq = self.get_ext_seq(package)
+
+        if ext_seq in self.packages:
+            self.count_duplicate += 1
+            return
+        elif self.next_ext_seq is not None and ext_seq < self.next_ext_seq:
+            if ext_seq in self.lost_ext_seq:
+                self.lost_ext_seq.discard(ext_seq)
+                self.count_late += 1
+            else:
+                self.count_duplicate += 1
+            return
+
+        self.packages[ext_seq] = package
+        heapq.heappush(self.heap, ext_seq)
+
+    def declare_lost(self, first_ext_seq: int, last_ext_seq: int):
+        """Packages from first_ext_seq up to last_ext_seq (not included) will never be released"""
+
+        self.count_lost += last_ext_seq - first_ext_seq
+        if len(self.lost_ext_seq) > MAX_LATE_HISTORY:
+            self.lost_ext_seq.clear()
+        self.lost_ext_seq.update(range(max(first_ext_seq, last_ext_seq - MAX_LATE_HISTORY), last_ext_seq))
+
+    def pop_ready(self, limit: int = 0, now: float | None = None) -> list[tuple[int, Package]]:
+        """
+        Release packages in order of extended sequence number
+
+        :param limit: max count of released packages (0 - without limit)
+        :param now: current time.time(), for tests
+        :return: list of (ext_seq, package)
+        """
+        now = time.time() if now is None else now
+        released: list[tuple[int, Package]] = []
+
+        while self.heap and (limit == 0 or len(released) < limit):
+            ext_seq = self.heap[0]
+            package = self.packages[ext_seq]
+
+            if self.next_ext_seq is not None and ext_seq != self.next_ext_seq:
+                # the gap before this package, wait for reordered packages
+                if now - package.arrival_time < self.playout_delay and len(self.packages) < self.max_size:
+                    break
+                self.declare_lost(self.next_ext_seq, ext_seq)
+            elif self.next_ext_seq is None and now - package.arrival_time < self.playout_delay:
+                break
+
+            heapq.heappop(self.heap)
+            self.packages.pop(ext_seq)
+            self.next_ext_seq = ext_seq + 1
+            self.count_released += 1
+            released.append((ext_seq, package))
+
+        return released
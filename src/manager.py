@@ -1,10 +1,11 @@
 import asyncio
 import os
 import time
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from multiprocessing import Queue, Event
 from queue import Empty
+from typing import Optional
 
 from loguru import logger
 
@@ -14,6 +15,9 @@ from src.config import Config
 from src.custom_dataclasses.package import Package
 from src.detector import Detector
 from src.http_clients.call_service_client import CallServiceClient
+from src.shared_ring_buffer import SharedRingBuffer
+from src.tick_scheduler import TickScheduler
+from src.unicast_server import UnicastServer
 
 
 class Manager(object):
@@ -23,11 +27,16 @@ class Manager(object):
                  config: Config,
                  mp_queue: Queue,
                  ppe: ProcessPoolExecutor,
-                 finish_event: Event):
+                 finish_event: Event,
+                 unicast_servers: list[UnicastServer] = None):
         self.config: Config = config
         self.mp_queue = mp_queue
         self.ppe: ProcessPoolExecutor = ppe
         self.finish_event: Event = finish_event
+        self.record_executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=config.record_threads,
+                                                                      thread_name_prefix='record')
+        self.unicast_servers: list[UnicastServer] = unicast_servers or []
+        self.rings: list[SharedRingBuffer] = [us.ring for us in self.unicast_servers if us.ring is not None]
 
         self.call_service_clients: dict[str, CallServiceClient] = {}
         self.packages_queue: list[Package] = []
@@ -36,6 +45,8 @@ class Manager(object):
         self.em_address_ssrc_with_chan_id: dict[str, str] = {}  # {em_address_ssrc: chan_id}
         self.em_address_wait_ssrc: dict[str, str] = {}  # {em_address: chan_id}
         self.audio_containers: dict[str, AudioContainer] = {}
+        self.scheduler: TickScheduler = TickScheduler(config=config, audio_containers=self.audio_containers)
+        self.detector: Optional[Detector] = None
         self.stress_peak: int = 0
 
     def __del__(self):
@@ -48,17 +59,55 @@ class Manager(object):
         self.config.alive = False
         self.config.wait_shutdown = True
         self.finish_event.set()
-        self.ppe.shutdown()
+        self.scheduler.finish_parsing()
 
         for call_service_client in self.call_service_clients.values():
             await call_service_client.close_session()
 
+        for ring in self.rings:
+            ring.close()
+        self.rings.clear()
+
         for key in list(self.audio_containers.keys()):
             self.log.info(f'unbind {key}')
-            self.audio_containers.pop(key)
+            audio_container = self.audio_containers.pop(key)
+            if audio_container.record_writer is not None:
+                audio_container.record_writer.close()
+        self.record_executor.shutdown(wait=True)
+        self.ppe.shutdown()
         self.log.info('end close_session')
         await asyncio.sleep(4)
 
+    def get_template_stats(self) -> dict:
+        return self.detector.get_template_stats() if self.detector is not None else {}
+
+    def get_dtmf_stats(self) -> dict:
+        return self.detector.get_dtmf_stats() if self.detector is not None else {}
+
+    async def reload_templates(self) -> Optional[dict]:
+        """:return: stats of templates, None - if detector is not started yet"""
+
+        if self.detector is None or self.detector.template_store is None:
+            return None
+        return await self.detector.reload_templates()
+
+    def get_unicast_stats(self) -> list[dict]:
+        return [unicast_server.get_shared_stats() for unicast_server in self.unicast_servers]
+
+    def receive_packages(self) -> list[Package]:
+        """Take received packages from the shared rings or from mp_queue"""
+
+        if self.rings:
+            packages: list[Package] = []
+            for ring in self.rings:
+                packages.extend(ring.get_packages())
+            return packages
+
+        try:
+            return self.mp_queue.get_nowait()
+        except Empty:
+            return []
+
     async def smart_sleep(self, delay: int):
         for sec in range(0, delay):
             if self.config.alive:
@@ -77,13 +126,14 @@ class Manager(object):
     async def start_manager(self):
         self.log.info('start_manager')
 
-        detector = Detector(config=self.config,
-                            audio_containers=self.audio_containers,
-                            ppe=self.ppe)
-        await detector.start_detection()
+        self.detector = Detector(config=self.config,
+                                 audio_containers=self.audio_containers,
+                                 ppe=self.ppe)
+        await self.detector.start_detection()
 
         asyncio.create_task(self.alive())
         asyncio.create_task(self.start_allocate())
+        asyncio.create_task(self.scheduler.start_scheduler())
         asyncio.create_task(self.save_result_into_db())
 
         try:
@@ -98,6 +148,7 @@ class Manager(object):
 
         # close FastAPI and our application
         self.config.alive = False
+        self.scheduler.finish_parsing()
         current_pid = os.getpid()
         os.kill(current_pid, 9)
 
@@ -107,10 +158,8 @@ class Manager(object):
         package_wait_chan_id = []
         while self.config.wait_shutdown is False:
             await asyncio.sleep(0)
-            try:
-                self.packages_queue: list[Package] = self.mp_queue.get_nowait()
-            except Empty:
-                self.packages_queue: list[Package] = []
+            self.packages_queue: list[Package] = self.receive_packages()
+            if len(self.packages_queue) == 0:
                 await asyncio.sleep(0.2)
 
             t1 = time.monotonic()
@@ -129,8 +178,7 @@ class Manager(object):
                 await asyncio.sleep(0.1)
                 continue
 
-            self.packages_queue.sort(key=lambda p: p.seq_num, reverse=False)
-
+            # packages are ordered by the jitter buffer of every AudioContainer
             lose_packages = 0
             for package in self.packages_queue:
                 if package.em_address_ssrc in self.em_address_ssrc_with_chan_id:
@@ -138,12 +186,14 @@ class Manager(object):
                     if chan_id in self.audio_containers:
                         audio_container = self.audio_containers[chan_id]
                         audio_container.append_package_for_analyse(package)
+                        self.scheduler.mark(audio_container)
                 elif package.em_address in self.em_address_wait_ssrc:
                     chan_id = self.em_address_wait_ssrc.pop(package.em_address)
                     self.em_address_ssrc_with_chan_id[package.em_address_ssrc] = chan_id
                     if chan_id in self.audio_containers:
                         audio_container = self.audio_containers[chan_id]
                         audio_container.append_package_for_analyse(package)
+                        self.scheduler.mark(audio_container)
                 elif datetime.now() < package.lose_time:
                     package_wait_chan_id.append(package)
                 else:
@@ -180,7 +230,9 @@ class Manager(object):
                                                               call_id=event.call_id,
                                                               chan_id=event.chan_id,
                                                               event_create=event,
-                                                              call_service_client=call_service_client)
+                                                              call_service_client=call_service_client,
+                                                              record_executor=self.record_executor,
+                                                              encode_executor=self.ppe)
 
         return True
 
@@ -0,0 +1,250 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Optional
+
+import numpy as np
+import soundfile
+from loguru import logger
+
+from src.custom_functions.audio_encoding import (SAVE_FORMAT_WAV,
+                                                 get_save_format,
+                                                 get_sample_width,
+                                                 get_format_subtype,
+                                                 get_resample_ratio,
+                                                 get_resample_padding,
+                                                 encode_chunk)
+
+
+class RecordWriter(object):
+    """
+    Streaming recorder of one channel.
+
+    In-order int16 audio is collected in small chunks, every full chunk is resampled and converted to
+    save_sample_width in the process pool (encode_executor) and appended to the file in the thread pool (executor),
+    so memory per recorded call does not depend on the call duration.
+    Writes of one file are queued, the next write is submitted when the previous one is finished and its chunk
+    is encoded (done-callback), so no thread waits for other writes or for the encoding.
+    The queue of not written audio is bounded by max_buffer_bytes, audio over the bound is dropped and counted.
+    The file is opened only for one write and closed after it, so recorded calls do not keep file descriptors.
+    FLAC and OGG can not be appended: audio is appended to a WAV part file, which is converted by close().
+    Resampling keeps last input samples of the chunk until the next chunk, they are the filter context.
+    close() writes the rest and finalizes the file.
+    """
+
+    def __init__(self,
+                 file_path: str,
+                 sample_rate: int,
+                 save_format: str = 'wav',
+                 save_sample_rate: int = 0,
+                 save_sample_width: int = 2,
+                 executor: Optional[Executor] = None,
+                 encode_executor: Optional[Executor] = None,
+                 chunk_bytes: int = 16000,
+                 max_buffer_bytes: int = 16000 * 30,
+                 object_id: str = ''):
+        self.file_path: str = file_path
+        self.sample_rate: int = sample_rate
+        self.save_format: str = get_save_format(save_format)
+        self.save_sample_rate: int = save_sample_rate if save_sample_rate > 0 else sample_rate
+        self.save_sample_width: int = get_sample_width(self.save_format, save_sample_width or 2)
+        self.executor: Optional[Executor] = executor  # without executor the file is written immediately
+        self.encode_executor: Optional[Executor] = encode_executor  # without executor audio is encoded in writer
+        self.chunk_bytes: int = chunk_bytes
+        self.max_buffer_bytes: int = max_buffer_bytes
+
+        self.up, self.down = get_resample_ratio(self.sample_rate, self.save_sample_rate)
+        self.padding: int = get_resample_padding(self.up, self.down)
+        self.is_converted: bool = self.up != self.down or self.save_sample_width not in (0, 2)
+
+        self.sf_format, self.subtype = get_format_subtype(self.save_format, self.save_sample_width)
+        if self.save_format == SAVE_FORMAT_WAV:
+            self.part_path: str = file_path
+            self.part_subtype: str = self.subtype
+        else:
+            self.part_path: str = f'{file_path}.part'
+            self.part_subtype: str = 'PCM_32' if self.save_sample_width > 2 else 'PCM_16'
+
+        self.chunk: list[np.ndarray] = []
+        self.chunk_size: int = 0  # bytes
+        self.hold_samples: np.ndarray = np.zeros(0, dtype=np.int16)  # not encoded, context of the next chunk
+        self.context_samples: np.ndarray = np.zeros(0, dtype=np.int16)  # last encoded, context of the next chunk
+        self.pending_bytes: int = 0  # submitted into the executor and not written yet
+        self.pending_lock = threading.Lock()
+        self.queue: deque[tuple[np.ndarray | Future | None, int, bool]] = deque()  # data, nbytes, close
+        self.is_writing: bool = False  # a write of the queue is submitted or waits for its encoding
+        self.is_part_created: bool = False
+        self.saved_future: Future = Future()  # the file is finalized
+        self.closed: bool = False
+
+        self.count_written_bytes: int = 0  # input bytes (16 bit samples of the stream)
+        self.count_dropped_bytes: int = 0
+        self.log = logger.bind(object_id=object_id or self.__class__.__name__)
+
+    def get_stats(self) -> dict:
+        return {
+            "file_path": self.file_path,
+            "save_format": self.save_format,
+            "save_sample_rate": self.save_sample_rate,
+            "save_sample_width": self.save_sample_width,
+            "written_bytes": self.count_written_bytes,
+            "pending_bytes": self.pending_bytes + self.chunk_size,
+            "dropped_bytes": self.count_dropped_bytes
+        }
+
+    def write(self, samples: np.ndarray):
+        """Add in-order int16 samples, called from the event loop"""
+
+        if self.closed:
+            return
+        elif self.pending_bytes + self.chunk_size + samples.nbytes > self.max_buffer_bytes:
+            if self.count_dropped_bytes == 0:
+                self.log.error(f'record writer is too slow, audio is dropped, file_path={self.file_path}')
+            self.count_dropped_bytes += samples.nbytes
+            return
+
+        self.chunk.append(samples)
+        self.chunk_size += samples.nbytes
+        if self.chunk_size >= self.chunk_bytes:
+            self.flush()
+
+    def flush(self, final: bool = False):
+        samples = np.concatenate([self.hold_samples] + self.chunk).astype(np.int16, copy=False)
+        self.chunk.clear()
+        self.chunk_size = 0
+
+        # resample_poly keeps alignment only for chunks with length multiple of down
+        count = len(samples) if final else (len(samples) - self.padding) // self.down * self.down
+        if count <= 0:
+            self.hold_samples = samples
+            return
+
+        chunk_samples = samples[:count]
+        after = samples[count: count + self.padding]
+        before = self.context_samples
+        self.hold_samples = samples[count:]
+        if self.padding > 0:
+            self.context_samples = np.concatenate((before, chunk_samples))[-self.padding:]
+
+        self.submit(self.encode(chunk_samples, before, after), nbytes=chunk_samples.nbytes, close=False)
+
+    def close(self) -> Optional[Future]:
+        """Write the rest of audio and finalize the header"""
+
+        if self.closed:
+            return self.saved_future if self.executor is not None else None
+        self.flush(final=True)
+        self.closed = True
+        return self.submit(None, nbytes=0, close=True)
+
+    def encode(self, samples: np.ndarray, before: np.ndarray, after: np.ndarray) -> np.ndarray | Future:
+        args = (samples, before, after, self.up, self.down, self.save_sample_width)
+        if not self.is_converted:
+            return samples
+        elif self.encode_executor is not None and self.executor is not None:
+            try:
+                return self.encode_executor.submit(encode_chunk, *args)
+            except RuntimeError:
+                pass  # the process pool is shut down, encode in the writer thread
+        return encode_chunk(*args)
+
+    def submit(self, data: np.ndarray | Future | None, nbytes: int, close: bool) -> Optional[Future]:
+        if self.executor is None:
+            self.write_chunk(data, nbytes, close)
+            return None
+
+        with self.pending_lock:
+            self.pending_bytes += nbytes
+            self.queue.append((data, nbytes, close))
+            if self.is_writing:
+                return self.saved_future
+            self.is_writing = True
+        self.write_next()
+        return self.saved_future
+
+    def write_next(self):
+        """Submit the next write of the queue, a chunk which is encoded in the process pool - when it is ready"""
+
+        with self.pending_lock:
+            if len(self.queue) == 0:
+                self.is_writing = False
+                return
+            item = self.queue.popleft()
+
+        if isinstance(item[0], Future):
+            item[0].add_done_callback(lambda _: self.submit_write(item))
+        else:
+            self.submit_write(item)
+
+    def submit_write(self, item: tuple[np.ndarray | Future | None, int, bool]):
+        try:
+            self.executor.submit(self.write_item, *item)
+        except RuntimeError:
+            self.write_item(*item)  # the thread pool is shut down, write in this thread
+
+    def write_item(self, data: np.ndarray | Future | None, nbytes: int, close: bool):
+        """Runs in the thread pool, the write of the next chunk is submitted after this one"""
+
+        self.write_chunk(data, nbytes, close)
+        self.write_next()
+
+    def open_sound_file(self) -> soundfile.SoundFile:
+        """The part file for one write: created by the first write, then opened for appending"""
+
+        if not self.is_part_created:
+            self.is_part_created = True
+            return soundfile.SoundFile(self.part_path,
+                                       mode='w',
+                                       samplerate=self.save_sample_rate,
+                                       channels=1,  # mono
+                                       format='WAV',
+                                       subtype=self.part_subtype)
+
+        sound_file = soundfile.SoundFile(self.part_path, mode='r+')
+        sound_file.seek(0, soundfile.SEEK_END)
+        return sound_file
+
+    def save_sound_file(self, block_frames: int = 65536):
+        """Convert the part file into the format of the record (WAV part file is the record)"""
+
+        if self.part_path == self.file_path and self.is_part_created:
+            return
+
+        with soundfile.SoundFile(self.file_path,
+                                 mode='w',
+                                 samplerate=self.save_sample_rate,
+                                 channels=1,
+                                 format=self.sf_format,
+                                 subtype=self.subtype) as sound_file:
+            if self.is_part_created:
+                dtype = 'int32' if self.part_subtype == 'PCM_32' else 'int16'
+                for block in soundfile.blocks(self.part_path, blocksize=block_frames, dtype=dtype):
+                    sound_file.write(block)
+        if self.is_part_created:
+            os.remove(self.part_path)
+
+    def write_chunk(self, data: np.ndarray | Future | None, nbytes: int, close: bool):
+        """Runs in the thread pool, an encoding future is already done"""
+
+        try:
+            if isinstance(data, Future):
+                data = data.result()
+
+            if data is not None and len(data) > 0:
+                with self.open_sound_file() as sound_file:
+                    sound_file.write(data)
+            self.count_written_bytes += nbytes
+
+            if close:
+                self.save_sound_file()
+                self.log.info(f'record is saved, file_path={self.file_path} bytes={self.count_written_bytes}')
+
+        except Exception as e:
+            self.log.error(f'ERROR write_chunk file_path={self.file_path}, e={e}')
+
+        finally:
+            with self.pending_lock:
+                self.pending_bytes -= nbytes
+            if close and not self.saved_future.done():
+                self.saved_future.set_result(self.count_written_bytes)
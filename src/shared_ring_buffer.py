@@ -0,0 +1,128 @@
+import socket
+import time
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+from src.custom_dataclasses.package import Package
+
+CACHE_LINE = 64
+
+
+def align(offset: int, alignment: int = CACHE_LINE) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class SharedRingBuffer(object):
+    """
+    Lock-free single-producer/single-consumer ring of fixed-size slots in shared memory.
+
+    Producer (UnicastServer process) writes raw RTP datagram, source address and arrival time into the slot
+    and only then moves head. Consumer (Manager) reads slots between tail and head and only then moves tail.
+    head and tail are monotonic counters, each of them is written by only one side, so no lock is needed.
+
+    Layout of shared memory:
+        head (uint64) | tail (uint64) | lengths | ports | hosts | arrivals | slots data
+    """
+
+    def __init__(self,
+                 capacity: int,
+                 slot_size: int,
+                 name: Optional[str] = None,
+                 create: bool = True):
+        self.capacity: int = capacity
+        self.slot_size: int = slot_size
+
+        self.offset_lengths = 2 * CACHE_LINE
+        self.offset_ports = align(self.offset_lengths + 2 * capacity)
+        self.offset_hosts = align(self.offset_ports + 2 * capacity)
+        self.offset_arrivals = align(self.offset_hosts + 4 * capacity)
+        self.offset_slots = align(self.offset_arrivals + 8 * capacity)
+        self.total_size = self.offset_slots + capacity * slot_size
+
+        self.is_owner: bool = create
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=self.total_size if create else 0)
+        self.name: str = self.shm.name
+        self.attach_views()
+
+        self.host_names: dict[int, str] = {}  # cache for inet_ntoa
+
+    def attach_views(self):
+        buf = self.shm.buf
+        self.head = np.ndarray((1,), dtype=np.uint64, buffer=buf, offset=0)
+        self.tail = np.ndarray((1,), dtype=np.uint64, buffer=buf, offset=CACHE_LINE)
+        self.lengths = np.ndarray((self.capacity,), dtype=np.uint16, buffer=buf, offset=self.offset_lengths)
+        self.ports = np.ndarray((self.capacity,), dtype=np.uint16, buffer=buf, offset=self.offset_ports)
+        self.hosts = np.ndarray((self.capacity,), dtype=np.uint32, buffer=buf, offset=self.offset_hosts)
+        self.arrivals = np.ndarray((self.capacity,), dtype=np.float64, buffer=buf, offset=self.offset_arrivals)
+        self.slots = np.ndarray((self.capacity, self.slot_size), dtype=np.uint8, buffer=buf, offset=self.offset_slots)
+        self.slot_views: list[memoryview] = [memoryview(slot) for slot in self.slots]
+
+    def __getstate__(self):
+        # numpy views and memoryviews can't be pickled, attach to the shared memory by name in other process
+        return {"capacity": self.capacity, "slot_size": self.slot_size, "name": self.name}
+
+    def __setstate__(self, state: dict):
+        self.__init__(capacity=state['capacity'], slot_size=state['slot_size'], name=state['name'], create=False)
+
+    def __len__(self) -> int:
+        return int(self.head[0] - self.tail[0])
+
+    def get_write_view(self) -> Optional[memoryview]:
+        """Producer: memoryview of free slot for recv_into or None if ring is full"""
+
+        head = int(self.head[0])
+        if head - int(self.tail[0]) >= self.capacity:
+            return None
+        return self.slot_views[head % self.capacity]
+
+    def commit(self, nbytes: int, addr: tuple[str, int]):
+        """Producer: publish the slot returned by get_write_view"""
+
+        index = int(self.head[0]) % self.capacity
+        self.lengths[index] = nbytes
+        self.hosts[index] = int.from_bytes(socket.inet_aton(addr[0]), byteorder='big')
+        self.ports[index] = addr[1]
+        self.arrivals[index] = time.time()
+        self.head[0] += 1  # must be the last write
+
+    def put(self, data: bytes, addr: tuple[str, int]) -> bool:
+        """Producer: copy datagram into the ring, return False if ring is full"""
+
+        view = self.get_write_view()
+        if view is None:
+            return False
+        nbytes = min(len(data), self.slot_size)
+        view[:nbytes] = data[:nbytes]
+        self.commit(nbytes, addr)
+        return True
+
+    def get_host_name(self, host: int) -> str:
+        if host not in self.host_names:
+            self.host_names[host] = socket.inet_ntoa(host.to_bytes(4, byteorder='big'))
+        return self.host_names[host]
+
+    def get_packages(self, limit: int = 0) -> list[Package]:
+        """Consumer: read all (or limit) published datagrams and free their slots"""
+
+        tail, head = int(self.tail[0]), int(self.head[0])
+        if limit:
+            head = min(head, tail + limit)
+
+        packages: list[Package] = []
+        for counter in range(tail, head):
+            index = counter % self.capacity
+            packages.append(Package(em_host=self.get_host_name(int(self.hosts[index])),
+                                    em_port=int(self.ports[index]),
+                                    data=self.slots[index, :self.lengths[index]].tobytes(),
+                                    arrival_time=float(self.arrivals[index])))
+        self.tail[0] = head  # must be the last write
+        return packages
+
+    def close(self):
+        self.slot_views.clear()
+        del self.head, self.tail, self.lengths, self.ports, self.hosts, self.arrivals, self.slots
+        self.shm.close()
+        if self.is_owner:
+            self.shm.unlink()
@@ -0,0 +1,86 @@
+import numpy as np
+
+from src.config import DEFAULT_SAMPLE_RATE, DEFAULT_WINDOW_SIZE, DEFAULT_OVERLAP_RATIO
+from src.custom_functions.build_spectrum import get_spectrum_frames, get_spectrum_frames_batch
+
+
+class SpectrumCache(object):
+    """
+    Rolling spectrogram of one channel.
+
+    FFT frames are computed only for new samples, frames are aligned to the first sample after reset().
+    The last count_frames frames are kept in a ring (one column per frame).
+    """
+
+    def __init__(self,
+                 count_frames: int,
+                 fs: int = DEFAULT_SAMPLE_RATE,
+                 wsize: int = DEFAULT_WINDOW_SIZE,
+                 wratio: float = DEFAULT_OVERLAP_RATIO):
+        self.count_frames: int = count_frames
+        self.fs: int = fs
+        self.wsize: int = wsize
+        self.wratio: float = wratio
+        self.step: int = wsize - int(wsize * wratio)
+
+        self.frames: np.ndarray = np.zeros((wsize // 2 + 1, count_frames), dtype=np.float32)
+        self.tail: np.ndarray = np.zeros(0, dtype=np.int16)  # samples of the next frame
+        self.count_computed: int = 0  # frames from reset(), index of the next frame
+
+    def __len__(self) -> int:
+        return min(self.count_computed, self.count_frames)
+
+    @staticmethod
+    def get_count_frames(count_samples: int,
+                         wsize: int = DEFAULT_WINDOW_SIZE,
+                         wratio: float = DEFAULT_OVERLAP_RATIO) -> int:
+        """Count of frames in a window of count_samples samples"""
+
+        step = wsize - int(wsize * wratio)
+        return max(0, (count_samples - wsize) // step + 1)
+
+    def reset(self):
+        self.tail = np.zeros(0, dtype=np.int16)
+        self.count_computed = 0
+
+    def add_samples(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Compute frames which are complete with new samples
+
+        :return: new frames, matrix (wsize // 2 + 1, count_new_frames)
+        """
+        samples = np.concatenate((self.tail, samples))
+        new_frames = get_spectrum_frames(samples, fs=self.fs, wsize=self.wsize, wratio=self.wratio)
+        self.store_frames(samples, new_frames)
+        return new_frames
+
+    @staticmethod
+    def add_samples_batch(caches: list['SpectrumCache'], samples_list: list[np.ndarray]) -> list[np.ndarray]:
+        """add_samples of many caches with one FFT call, all caches must have the same fs, wsize and wratio"""
+
+        if len(caches) == 0:
+            return []
+        first = caches[0]
+        signals = [np.concatenate((cache.tail, samples)) for cache, samples in zip(caches, samples_list)]
+        frames_list = get_spectrum_frames_batch(signals, fs=first.fs, wsize=first.wsize, wratio=first.wratio)
+        for cache, samples, new_frames in zip(caches, signals, frames_list):
+            cache.store_frames(samples, new_frames)
+        return frames_list
+
+    def store_frames(self, samples: np.ndarray, new_frames: np.ndarray):
+        """Keep the tail of samples (tail and new samples) for the next frame and the last count_frames frames"""
+
+        count_new = new_frames.shape[1]
+        self.tail = samples[count_new * self.step:]
+
+        # only the last count_frames of new frames are stored
+        stored = new_frames[:, -self.count_frames:]
+        columns = np.arange(self.count_computed + count_new - stored.shape[1], self.count_computed + count_new)
+        self.frames[:, columns % self.count_frames] = stored
+        self.count_computed += count_new
+
+    def get_spectrum(self) -> np.ndarray:
+        """Stored frames in order of time"""
+
+        columns = np.arange(self.count_computed - len(self), self.count_computed) % self.count_frames
+        return self.frames.take(columns, axis=1)
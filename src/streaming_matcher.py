@@ -0,0 +1,199 @@
+from collections import deque
+
+import numpy as np
+
+from src.config import (DEFAULT_FAN_VALUE,
+                        DEFAULT_AMP_MIN,
+                        MATCH_MIN_TEMPLATE_HASHES,
+                        MATCH_MIN_TIMELY_HASHES,
+                        MATCH_MIN_OFFSET_TIMES,
+                        MATCH_MIN_COUNT,
+                        MATCH_WEIGHT_OFFSET_TIMES)
+from src.fingerprint_mining import get_2d_peaks, get_log_spectrum, get_peak_neighborhood_radius, get_peak_pairs
+from src.template_index import TemplateIndex
+
+
+class StreamingMatcher(object):
+    """
+    Streaming fingerprint matching of one channel.
+
+    Only new spectrum frames are processed: a peak is final when frames of its whole neighborhood are received,
+    new peaks are paired with the last fan_value - 1 previous peaks. Hashes get absolute offsets (frame index).
+    Every match with a template votes for (template, offset difference), votes older than window_frames expire.
+    Score of a (template, difference) key: its votes + MATCH_WEIGHT_OFFSET_TIMES * count of unique offsets
+    with this difference, a template is found when the score of a key with new votes crosses the MATCH_* thresholds.
+    """
+
+    def __init__(self,
+                 template_index: TemplateIndex,
+                 window_frames: int,
+                 fan_value: int = DEFAULT_FAN_VALUE,
+                 amp_min: int = DEFAULT_AMP_MIN):
+        self.template_index: TemplateIndex = template_index
+        self.window_frames: int = window_frames
+        self.fan_value: int = fan_value
+        self.amp_min: int = amp_min
+        self.radius: int = get_peak_neighborhood_radius()
+
+        self.count_frames: int = 0  # received frames, absolute index of the next frame
+        self.arr2d_tail: np.ndarray | None = None  # log spectrum from (count_final_frames - radius)
+        self.count_final_frames: int = 0  # peaks of frames before this index are found
+        self.peaks_tail: tuple[np.ndarray, np.ndarray, np.ndarray] = (np.zeros(0, dtype=np.int64),) * 3
+
+        # votes: (template_id, difference) packed into one key
+        self.batches: deque[tuple[int, np.ndarray, np.ndarray, np.ndarray]] = deque()  # frame, ids, keys, offsets
+        self.template_votes: dict[int, int] = {}
+        self.key_votes: dict[int, int] = {}
+        self.key_offsets: dict[tuple[int, int], int] = {}
+        self.key_unique_offsets: dict[int, int] = {}
+
+        self.count_hashes: int = 0
+        self.count_matches: int = 0
+
+    @staticmethod
+    def pack_keys(template_ids: np.ndarray, diff_offsets: np.ndarray) -> np.ndarray:
+        return (template_ids.astype(np.int64) << 32) | (diff_offsets.astype(np.int64) & 0xFFFFFFFF)
+
+    @staticmethod
+    def unpack_key(key: int) -> tuple[int, int]:
+        """:return: template_id, difference of offsets"""
+
+        diff_offset = key & 0xFFFFFFFF
+        return key >> 32, diff_offset - (1 << 32) if diff_offset >= 1 << 31 else diff_offset
+
+    def get_stats(self) -> dict:
+        return {
+            "frames": self.count_frames,
+            "hashes": self.count_hashes,
+            "matches": self.count_matches,
+            "window_matches": sum(len(batch[2]) for batch in self.batches)
+        }
+
+    def add_frames(self, spectrum: np.ndarray) -> tuple[str, int] | tuple[None, None]:
+        """
+        Process new frames of the spectrogram (linear, as stft.specgram)
+
+        :return: template_name, match_count - if a template crossed the threshold
+        """
+        freqs, times, amps = self.find_new_peaks(get_log_spectrum(spectrum))
+        hashes, offsets = self.generate_new_hashes(freqs, times, amps)
+
+        touched_keys = self.add_votes(hashes, offsets)
+        self.expire_votes(self.count_frames - self.window_frames)
+        return self.check_keys(touched_keys)
+
+    def find_new_peaks(self, arr2d_new: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Peaks of frames with complete neighborhood, times are absolute"""
+
+        arr2d = arr2d_new if self.arr2d_tail is None else np.concatenate((self.arr2d_tail, arr2d_new), axis=1)
+        first_frame = self.count_frames - (0 if self.arr2d_tail is None else self.arr2d_tail.shape[1])
+        self.count_frames += arr2d_new.shape[1]
+
+        final_until = self.count_frames - self.radius  # absolute, not included
+        if final_until <= self.count_final_frames:
+            self.arr2d_tail = arr2d
+            return (np.zeros(0, dtype=np.int64),) * 3
+
+        freqs, times, amps = get_2d_peaks(arr2d, amp_min=self.amp_min)
+        times = times + first_frame
+        final = (times >= self.count_final_frames) & (times < final_until)
+
+        # order of peaks as in generate_hashes: by time, then by frequency
+        order = np.lexsort((freqs[final], times[final]))
+        peaks = freqs[final][order], times[final][order], amps[final][order]
+
+        self.count_final_frames = final_until
+        self.arr2d_tail = arr2d[:, max(0, final_until - self.radius - first_frame):]
+        return peaks
+
+    def generate_new_hashes(self,
+                            freqs: np.ndarray,
+                            times: np.ndarray,
+                            amps: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if freqs.size == 0:
+            return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+
+        count_tail = self.peaks_tail[0].size
+        freqs, times, amps = (np.concatenate((tail, new)) for tail, new in zip(self.peaks_tail, (freqs, times, amps)))
+        hashes, offsets, _ = get_peak_pairs(freqs, times, amps, fan_value=self.fan_value, first_new=count_tail)
+
+        keep = max(self.fan_value - 1, 0)
+        self.peaks_tail = (freqs[freqs.size - keep:], times[freqs.size - keep:], amps[freqs.size - keep:])
+        self.count_hashes += hashes.size
+        return hashes, offsets
+
+    def add_votes(self, hashes: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """:return: keys with new votes"""
+
+        query_index, template_ids, template_offsets = self.template_index.lookup(hashes)
+        if query_index.size == 0:
+            return template_ids.astype(np.int64)
+
+        match_offsets = offsets[query_index]
+        keys = self.pack_keys(template_ids, match_offsets - template_offsets)
+        self.batches.append((self.count_frames, template_ids, keys, match_offsets))
+        self.count_matches += keys.size
+        self.update_votes(template_ids, keys, match_offsets, sign=1)
+        return np.unique(keys)
+
+    def expire_votes(self, first_frame: int):
+        """Remove votes of hashes before first_frame"""
+
+        while self.batches:
+            frame, template_ids, keys, match_offsets = self.batches[0]
+            expired = match_offsets < first_frame
+            if not expired.any():
+                break
+
+            self.update_votes(template_ids[expired], keys[expired], match_offsets[expired], sign=-1)
+            if expired.all():
+                self.batches.popleft()
+            else:
+                self.batches[0] = (frame, template_ids[~expired], keys[~expired], match_offsets[~expired])
+                break
+
+    def update_votes(self, template_ids: np.ndarray, keys: np.ndarray, match_offsets: np.ndarray, sign: int):
+        ids, counts = np.unique(template_ids, return_counts=True)
+        for template_id, count in zip(ids.tolist(), counts.tolist()):
+            self.template_votes[template_id] = self.template_votes.get(template_id, 0) + sign * count
+
+        unique_keys, counts = np.unique(keys, return_counts=True)
+        for key, count in zip(unique_keys.tolist(), counts.tolist()):
+            votes = self.key_votes.get(key, 0) + sign * count
+            if votes > 0:
+                self.key_votes[key] = votes
+            else:
+                self.key_votes.pop(key, None)
+
+        key_offsets, counts = np.unique(np.stack((keys, match_offsets), axis=1), axis=0, return_counts=True)
+        for (key, offset), count in zip(key_offsets.tolist(), counts.tolist()):
+            votes = self.key_offsets.get((key, offset), 0) + sign * count
+            if votes > 0:
+                if (key, offset) not in self.key_offsets:
+                    self.key_unique_offsets[key] = self.key_unique_offsets.get(key, 0) + 1
+                self.key_offsets[(key, offset)] = votes
+            elif (key, offset) in self.key_offsets:
+                self.key_offsets.pop((key, offset))
+                self.key_unique_offsets[key] -= 1
+                if self.key_unique_offsets[key] == 0:
+                    self.key_unique_offsets.pop(key)
+
+    def check_keys(self, keys: np.ndarray) -> tuple[str, int] | tuple[None, None]:
+        """The best template, which crossed the threshold with new votes (other scores did not grow)"""
+
+        best_name, best_match_count = None, None
+        for key in keys.tolist():
+            template_id = key >> 32
+            votes = self.key_votes.get(key, 0)
+            count_offset_times = self.key_unique_offsets.get(key, 0)
+
+            if self.template_votes.get(template_id, 0) < MATCH_MIN_TEMPLATE_HASHES:
+                continue
+            elif votes < MATCH_MIN_TIMELY_HASHES or count_offset_times < MATCH_MIN_OFFSET_TIMES:
+                continue
+
+            match_count = votes + count_offset_times * MATCH_WEIGHT_OFFSET_TIMES
+            if match_count >= MATCH_MIN_COUNT and (best_match_count is None or match_count > best_match_count):
+                best_name, best_match_count = self.template_index.template_names[template_id], match_count
+
+        return best_name, best_match_count
@@ -0,0 +1,134 @@
+import numpy as np
+
+from src.custom_dataclasses.fingerprint import FingerPrint
+
+
+class TemplateIndex(object):
+    """
+    Inverted index of template hashes as sorted NumPy arrays.
+
+    hashes[i], template_ids[i], offsets[i] - packed hash, id of template and the first offset of the hash
+    in the template, sorted by hash. All hashes of a fingerprint are looked up with one np.searchsorted.
+    """
+
+    def __init__(self):
+        self.template_names: list[str] = []  # template_id: template_name, one template may have several ids
+
+        self.hashes: np.ndarray = np.zeros(0, dtype=np.uint64)
+        self.ids: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.offsets: np.ndarray = np.zeros(0, dtype=np.int64)
+
+        self.parts: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []  # added, but not built
+
+    def __len__(self) -> int:
+        return len(self.template_names)
+
+    def count_unique_hashes(self) -> int:
+        self.build()
+        return int(np.count_nonzero(np.diff(self.hashes))) + 1 if self.hashes.size else 0
+
+    def add(self, template_name: str, fingerprint: FingerPrint) -> int:
+        return self.add_arrays(template_name, *fingerprint.get_hash_arrays())
+
+    def add_arrays(self, template_name: str, hashes: np.ndarray, offsets: np.ndarray) -> int:
+        template_id = len(self.template_names)
+        self.template_names.append(template_name)
+        self.parts.append((hashes, np.full(hashes.size, template_id, dtype=np.int32), offsets))
+        return template_id
+
+    def build(self):
+        """Merge added templates into sorted arrays"""
+
+        if len(self.parts) == 0:
+            return
+
+        hashes = np.concatenate([self.hashes] + [part[0] for part in self.parts])
+        ids = np.concatenate([self.ids] + [part[1] for part in self.parts])
+        offsets = np.concatenate([self.offsets] + [part[2] for part in self.parts])
+        self.parts.clear()
+
+        order = np.lexsort((ids, hashes))  # by hash, then by template_id
+        self.hashes, self.ids, self.offsets = hashes[order], ids[order], offsets[order]
+
+    def lookup(self, hashes: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find all templates with the hashes
+
+        :param hashes: packed hashes (uint64)
+        :return: index in hashes, template_id, offset in the template - for every match
+        """
+        self.build()
+
+        left = np.searchsorted(self.hashes, hashes, side='left')
+        right = np.searchsorted(self.hashes, hashes, side='right')
+        counts = right - left
+        total = int(counts.sum())
+        if total == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty.astype(np.int32), empty
+
+        # expand ranges [left, right) of every hash into positions of the index
+        query_index = np.repeat(np.arange(hashes.size), counts)
+        starts = np.repeat(left - np.cumsum(counts) + counts, counts)
+        positions = starts + np.arange(total)
+        return query_index, self.ids[positions], self.offsets[positions]
+
+    def align(self,
+              hashes: np.ndarray,
+              offsets: np.ndarray,
+              min_hashes: int = 1) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Offset alignment with every template sharing at least min_hashes hashes, the same as the median loop
+        (np.median of differences of offsets per template): one sort of (template, difference, offset) for
+        all templates, the median difference of a template is the middle of its sorted run.
+        Timely hashes have the median difference, there are none if the median is between two differences.
+
+        :param hashes: packed hashes of the fingerprint
+        :param offsets: offsets of the hashes in the fingerprint
+        :return: template_ids (sorted), first matched hash index, count of matched hashes,
+                 median difference of offsets (rounded down), timely hashes, unique offsets of timely hashes
+        """
+        query_index, template_ids, template_offsets = self.lookup(hashes)
+        counts = np.bincount(template_ids, minlength=len(self.template_names))
+        ids = np.flatnonzero(counts >= max(min_hashes, 1))
+        if ids.size == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty, empty, empty, empty
+
+        candidate_index = np.zeros(counts.size, dtype=np.int64)
+        candidate_index[ids] = np.arange(ids.size)
+        matches = counts[template_ids] >= max(min_hashes, 1)
+        query_index, template_offsets = query_index[matches], template_offsets[matches]
+        candidates = candidate_index[template_ids[matches]]
+
+        first_query = np.full(ids.size, hashes.size, dtype=np.int64)
+        np.minimum.at(first_query, candidates, query_index)
+
+        match_offsets = offsets[query_index]
+        diff_offsets = match_offsets - template_offsets
+        min_diff, min_offset = int(diff_offsets.min()), int(match_offsets.min())
+        span = int(diff_offsets.max()) - min_diff + 1
+        offset_span = int(match_offsets.max()) - min_offset + 1
+
+        bins = candidates * span + (diff_offsets - min_diff)
+
+        # sorted (bin, offset) pairs: runs of templates, sorted differences inside a run
+        pairs = np.sort(bins * offset_span + (match_offsets - min_offset))
+        pair_bins = pairs // offset_span
+        new_bins = np.r_[True, pair_bins[1:] != pair_bins[:-1]]
+        bin_index = np.cumsum(new_bins) - 1  # index of the filled bin for every pair
+        votes = np.bincount(bin_index)
+        offset_times = np.bincount(bin_index[np.r_[True, pairs[1:] != pairs[:-1]]], minlength=votes.size)
+
+        # median of every run: two middle differences, timely hashes only if they are equal
+        match_counts = counts[ids]
+        starts = np.cumsum(match_counts) - match_counts
+        lower = pair_bins[starts + (match_counts - 1) // 2]
+        upper = pair_bins[starts + match_counts // 2]
+        median_bins = bin_index[starts + (match_counts - 1) // 2]
+        is_timely = lower == upper
+
+        median_diffs = (lower + upper) // 2 % span + min_diff
+        timely_hashes = np.where(is_timely, votes[median_bins], 0)
+        timely_offset_times = np.where(is_timely, offset_times[median_bins], 0)
+        return ids, first_query, match_counts, median_diffs, timely_hashes, timely_offset_times
@@ -0,0 +1,74 @@
+import numpy as np
+
+from src.config import (MATCH_MIN_TEMPLATE_HASHES,
+                        MATCH_MIN_TIMELY_HASHES,
+                        MATCH_MIN_OFFSET_TIMES,
+                        MATCH_MIN_COUNT,
+                        MATCH_WEIGHT_OFFSET_TIMES)
+from src.template_index import TemplateIndex
+
+DUPLICATE_MATCH_COUNT = 6700  # match_count of the same audio, lower (but detected) - near duplicate
+DUPLICATE_HASH_RATIO = 0.9  # or timely hashes of short templates
+
+
+def find_similar_templates(template_names: list[str],
+                           hashes: np.ndarray,
+                           ids: np.ndarray,
+                           offsets: np.ndarray,
+                           templates: list[tuple[str, np.ndarray, np.ndarray]]) -> list[dict]:
+    """
+    Templates which would be detected in the audio of other templates, runs in the process pool.
+    Only templates sharing hashes with the checked one are aligned (TemplateIndex.align).
+
+    :param template_names, hashes, ids, offsets: the built template index
+    :param templates: template_name, hashes and offsets of its fingerprint - templates to check
+    :return: template_name, similar_name, match_count, ... - the best match with every similar template
+    """
+    template_index = TemplateIndex()
+    template_index.template_names = template_names
+    template_index.hashes, template_index.ids, template_index.offsets = hashes, ids, offsets
+
+    similar = []
+    for template_name, template_hashes, template_offsets in templates:
+        alignment = template_index.align(template_hashes, template_offsets, min_hashes=MATCH_MIN_TEMPLATE_HASHES)
+        similar_ids, _, counts, diff_offsets, timely_hashes, offset_times = alignment
+        match_counts = timely_hashes + offset_times * MATCH_WEIGHT_OFFSET_TIMES
+        detected = ((timely_hashes >= MATCH_MIN_TIMELY_HASHES) &
+                    (offset_times >= MATCH_MIN_OFFSET_TIMES) &
+                    (match_counts >= MATCH_MIN_COUNT))
+
+        best: dict[str, dict] = {}  # one template has several ids (phase shifts)
+        for position in np.flatnonzero(detected).tolist():
+            similar_name = template_names[similar_ids[position]]
+            match_count = int(match_counts[position])
+            if similar_name == template_name:
+                continue
+            elif similar_name in best and best[similar_name]['match_count'] >= match_count:
+                continue
+
+            is_duplicate = (match_count > DUPLICATE_MATCH_COUNT or
+                            timely_hashes[position] >= DUPLICATE_HASH_RATIO * template_hashes.size)
+            best[similar_name] = {
+                "template_name": template_name,
+                "similar_name": similar_name,
+                "kind": "duplicate" if is_duplicate else "near_duplicate",
+                "match_count": match_count,
+                "shared_hashes": int(counts[position]),
+                "timely_hashes": int(timely_hashes[position]),
+                "offset_times": int(offset_times[position]),
+                "diff_offset": int(diff_offsets[position]),
+                "hash_count": int(template_hashes.size)
+            }
+        similar.extend(best.values())
+    return similar
+
+
+def merge_similar_pairs(similar: list[dict]) -> list[dict]:
+    """One record for a pair of templates (the best direction), sorted by match_count"""
+
+    pairs: dict[tuple[str, str], dict] = {}
+    for record in similar:
+        pair = tuple(sorted((record['template_name'], record['similar_name'])))
+        if pair not in pairs or record['match_count'] > pairs[pair]['match_count']:
+            pairs[pair] = record
+    return sorted(pairs.values(), key=lambda record: (-record['match_count'], record['template_name']))
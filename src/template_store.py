@@ -0,0 +1,358 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import Executor
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import soundfile
+from loguru import logger
+
+from src.config import (DEFAULT_SAMPLE_RATE,
+                        DEFAULT_WINDOW_SIZE,
+                        DEFAULT_OVERLAP_RATIO,
+                        DEFAULT_FAN_VALUE,
+                        DEFAULT_AMP_MIN,
+                        PEAK_NEIGHBORHOOD_SIZE,
+                        MIN_HASH_TIME_DELTA,
+                        MAX_HASH_TIME_DELTA)
+from src.custom_dataclasses.template import Template
+from src.fingerprint_mining import HASH_FREQ1_SHIFT, HASH_FREQ2_SHIFT, HASH_TIME_DELTA_SHIFT
+from src.template_index import TemplateIndex
+
+INDEX_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+TEMPLATES_FOLDER = 'templates'
+INDEX_ARRAYS = ('hashes', 'ids', 'offsets')
+
+
+def get_index_params(phase_shift: int) -> dict:
+    """Parameters of fingerprints, all templates are compiled again when they are changed"""
+
+    return {
+        "version": INDEX_VERSION,
+        "sample_rate": DEFAULT_SAMPLE_RATE,
+        "window_size": DEFAULT_WINDOW_SIZE,
+        "overlap_ratio": DEFAULT_OVERLAP_RATIO,
+        "fan_value": DEFAULT_FAN_VALUE,
+        "amp_min": DEFAULT_AMP_MIN,
+        "peak_neighborhood_size": PEAK_NEIGHBORHOOD_SIZE,
+        "hash_time_delta": [MIN_HASH_TIME_DELTA, MAX_HASH_TIME_DELTA],
+        "hash_shifts": [HASH_FREQ1_SHIFT, HASH_FREQ2_SHIFT, HASH_TIME_DELTA_SHIFT],
+        "phase_shift": phase_shift
+    }
+
+
+def get_file_sha1(file_path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def compile_template(file_path: str, phase_shift: int) -> tuple[str, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fingerprints of one WAV template, runs in the process pool
+
+    :return: error ('' - compiled), hashes and offsets of all fingerprints, count of hashes of every fingerprint
+             (the first one is the fingerprint of the template, the next are shifted by phase_shift)
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    try:
+        audio_data, samplerate = soundfile.read(file_path, dtype='int16')
+    except Exception as e:
+        return f'invalid audio_data: {e}', empty.astype(np.uint64), empty, empty
+
+    if samplerate != DEFAULT_SAMPLE_RATE:
+        return f'incorrect sample_rate {samplerate}', empty.astype(np.uint64), empty, empty
+    elif audio_data.ndim != 1:
+        return 'found stereo', empty.astype(np.uint64), empty, empty
+    elif audio_data.size == 0:
+        return 'invalid audio_data', empty.astype(np.uint64), empty, empty
+
+    template_name = os.path.basename(file_path).replace('.wav', '')
+    template = Template(template_id=0,
+                        template_name=template_name,
+                        limit_samples=0,
+                        amplitudes=audio_data,
+                        phase_shift=phase_shift)
+
+    arrays = [fingerprint.get_hash_arrays() for fingerprint in [template.fingerprint] + template.phase_fingerprints]
+    return ('',
+            np.concatenate([hashes for hashes, _ in arrays]),
+            np.concatenate([offsets for _, offsets in arrays]),
+            np.array([hashes.size for hashes, _ in arrays], dtype=np.int64))
+
+
+class TemplateStore(object):
+    """
+    Compiled template index on disk.
+
+    index_path/templates/<template_name>.npz - hashes of one template, index_path/<hashes|ids|offsets>.npy -
+    the built TemplateIndex, index_path/manifest.json - size, mtime and sha1 of every WAV file, template names
+    of the index and parameters of fingerprints. Only added or changed WAV files are fingerprinted
+    (in the process pool), without changes the index is loaded as memory-mapped arrays.
+    Without index_path the compiled templates are kept in memory for the next load.
+    """
+
+    def __init__(self,
+                 folder_path: str,
+                 index_path: str,
+                 phase_shift: int = 0,
+                 executor: Optional[Executor] = None):
+        self.folder_path: str = folder_path
+        self.index_path: str = index_path  # empty - the index is not saved
+        self.phase_shift: int = phase_shift
+        self.executor: Optional[Executor] = executor
+        self.params: dict = get_index_params(phase_shift)
+
+        self.files: dict[str, dict] = {}  # file_name: size, mtime_ns, sha1, template_name, error
+        self.template_names: list[str] = []  # template_id: template_name of the last index
+        self.memory_templates: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}  # without index_path
+        self.changed_names: list[str] = []  # templates compiled by the last load
+        self.stats: dict = {}
+        self.log = logger.bind(object_id=self.__class__.__name__)
+
+    def count_templates(self) -> int:
+        return sum(1 for entry in self.files.values() if entry['error'] == '')
+
+    def has_template(self, template_name: str) -> bool:
+        if template_name in self.memory_templates:
+            return True
+        return bool(self.index_path) and os.path.isfile(self.get_template_path(template_name))
+
+    def get_template_path(self, template_name: str) -> str:
+        return os.path.join(self.index_path, TEMPLATES_FOLDER, f'{template_name}.npz')
+
+    def get_array_path(self, name: str) -> str:
+        return os.path.join(self.index_path, f'{name}.npy')
+
+    def read_manifest(self) -> dict:
+        manifest_path = os.path.join(self.index_path, MANIFEST_NAME)
+        if not self.index_path or not os.path.isfile(manifest_path):
+            return {}
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except Exception as e:
+            self.log.warning(f'invalid manifest {manifest_path}, e={e}')
+            return {}
+        return manifest if manifest.get('params') == self.params else {}
+
+    def get_changed_files(self, old_files: dict[str, dict]) -> tuple[dict[str, dict], list[str]]:
+        """:return: entries of unchanged WAV files, WAV files which are new or changed"""
+
+        files: dict[str, dict] = {}
+        changed: list[str] = []
+        for file_name in sorted(file for file in os.listdir(self.folder_path) if file.endswith('.wav')):
+            stat = os.stat(os.path.join(self.folder_path, file_name))
+            entry = old_files.get(file_name)
+
+            if entry is None or (entry['error'] == '' and not self.has_template(entry['template_name'])):
+                changed.append(file_name)
+            elif entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                files[file_name] = entry
+            elif entry['size'] == stat.st_size and entry['sha1'] == get_file_sha1(
+                    os.path.join(self.folder_path, file_name)):
+                files[file_name] = dict(entry, mtime_ns=stat.st_mtime_ns)  # touched only
+            else:
+                changed.append(file_name)
+        for file_name, entry in files.items():
+            if entry['error']:
+                self.log.warning(f'{entry["error"]} in file_name={file_name}, SKIP!')
+        return files, changed
+
+    def compile_files(self, file_names: list[str]) -> dict[str, tuple[str, np.ndarray, np.ndarray, np.ndarray]]:
+        file_paths = [os.path.join(self.folder_path, file_name) for file_name in file_names]
+        if self.executor is not None and len(file_paths) > 1:
+            results = self.executor.map(compile_template, file_paths, [self.phase_shift] * len(file_paths))
+        else:
+            results = map(compile_template, file_paths, [self.phase_shift] * len(file_paths))
+        return dict(zip(file_names, results))
+
+    def is_changed(self) -> bool:
+        """
+        WAV files are added, removed or have other size or mtime after the last load (without reading).
+        Runs in the watcher thread: self.files is only replaced by load, never changed in place.
+        """
+        files = self.files
+        file_names = {file for file in os.listdir(self.folder_path) if file.endswith('.wav')}
+        if file_names != set(files):
+            return True
+        for file_name in file_names:
+            stat = os.stat(os.path.join(self.folder_path, file_name))
+            entry = files[file_name]
+            if entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+                return True
+        return False
+
+    def load(self) -> Optional[TemplateIndex]:
+        """
+        Compile added and changed templates and build the index
+
+        :return: the new index, None - if templates were not changed after the previous load
+        """
+        t1 = time.monotonic()
+        is_first = len(self.stats) == 0
+        manifest = self.read_manifest() if is_first or self.index_path else self.get_memory_manifest()
+        old_files = manifest.get('files', {})
+        files, changed_files = self.get_changed_files(old_files)
+        removed_files = set(old_files) - set(files) - set(changed_files)
+
+        self.changed_names = []
+        compiled: dict[str, tuple[str, np.ndarray, np.ndarray, np.ndarray]] = {}
+        for file_name, (error, hashes, offsets, sizes) in self.compile_files(changed_files).items():
+            file_path = os.path.join(self.folder_path, file_name)
+            stat = os.stat(file_path)
+            template_name = file_name.replace('.wav', '')
+            files[file_name] = {"size": stat.st_size,
+                                "mtime_ns": stat.st_mtime_ns,
+                                "sha1": get_file_sha1(file_path),
+                                "template_name": template_name,
+                                "error": error}
+            if error:
+                self.log.warning(f'{error} in file_name={file_name}, SKIP!')
+                continue
+            compiled[template_name] = (error, hashes, offsets, sizes)
+            self.changed_names.append(template_name)
+
+        # the new mapping is built aside and replaced by one assignment (the watcher reads it in other thread),
+        # template ids of the index follow file names
+        self.files = dict(sorted(files.items()))
+        removed_names = sorted(old_files[file_name]['template_name'] for file_name in removed_files)
+        template_index = None
+        if len(changed_files) == 0 and len(removed_files) == 0:
+            if not is_first:
+                self.save_manifest(manifest.get('template_names', []))  # mtime of touched files
+                self.set_stats(None, [], [], t1)
+                return None
+
+            template_index = self.load_index(manifest.get('template_names', []))
+
+        if template_index is None:
+            template_index = self.build_index(compiled)
+            self.save(compiled, removed_names, template_index)
+        else:
+            self.save_manifest(template_index.template_names)
+
+        self.set_stats(template_index, self.changed_names, removed_names, t1)
+        self.log.info(f'template index, templates: {self.stats["templates"]}, compiled: {len(changed_files)}, '
+                      f'removed: {len(removed_files)}, time: {self.stats["rebuild_time"]}s')
+        return template_index
+
+    def set_stats(self, template_index: Optional[TemplateIndex], compiled: list[str], removed: list[str], t1: float):
+        self.stats.update({
+            "templates": self.count_templates(),
+            "compiled": compiled,
+            "removed": removed,
+            "rebuild_time": round(time.monotonic() - t1, 3),
+            "load_time": datetime.now().isoformat()
+        })
+        if template_index is not None:
+            self.stats["index_hashes"] = int(template_index.hashes.size)
+            self.stats["index_bytes"] = int(template_index.hashes.nbytes +
+                                            template_index.ids.nbytes +
+                                            template_index.offsets.nbytes)
+
+    def get_memory_manifest(self) -> dict:
+        """Templates of the previous load, when the index is not saved"""
+
+        return {"params": self.params, "files": self.files, "template_names": self.template_names}
+
+    def load_index(self, template_names: list[str]) -> Optional[TemplateIndex]:
+        try:
+            arrays = [np.load(self.get_array_path(name), mmap_mode='r') for name in INDEX_ARRAYS]
+        except Exception as e:
+            self.log.warning(f'index is not loaded, e={e}')
+            return None
+
+        template_index = TemplateIndex()
+        template_index.template_names = list(template_names)
+        template_index.hashes, template_index.ids, template_index.offsets = arrays
+        return template_index
+
+    def load_template(self, template_name: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """:return: hashes, offsets, count of hashes of every fingerprint"""
+
+        if template_name in self.memory_templates:
+            return self.memory_templates[template_name]
+        with np.load(self.get_template_path(template_name)) as data:
+            return data['hashes'], data['offsets'], data['sizes']
+
+    def get_main_arrays(self, template_name: str) -> tuple[np.ndarray, np.ndarray]:
+        """Hashes and offsets of the fingerprint of the template (without phase shifts)"""
+
+        hashes, offsets, sizes = self.load_template(template_name)
+        return hashes[:sizes[0]], offsets[:sizes[0]]
+
+    def build_index(self, compiled: dict[str, tuple[str, np.ndarray, np.ndarray, np.ndarray]]) -> TemplateIndex:
+        template_index = TemplateIndex()
+        for entry in self.files.values():
+            template_name = entry['template_name']
+            if entry['error']:
+                continue
+            elif template_name in compiled:
+                _, hashes, offsets, sizes = compiled[template_name]
+            else:
+                hashes, offsets, sizes = self.load_template(template_name)
+
+            bounds = np.cumsum(sizes)[:-1]
+            for part_hashes, part_offsets in zip(np.split(hashes, bounds), np.split(offsets, bounds)):
+                template_index.add_arrays(template_name, part_hashes, part_offsets)
+        template_index.build()
+        return template_index
+
+    def save(self,
+             compiled: dict[str, tuple[str, np.ndarray, np.ndarray, np.ndarray]],
+             removed_names: list[str],
+             template_index: TemplateIndex):
+        """Files are replaced atomically, the manifest is the last"""
+
+        names = {entry['template_name'] for entry in self.files.values() if entry['error'] == ''}
+        if not self.index_path:
+            for template_name, (_, hashes, offsets, sizes) in compiled.items():
+                self.memory_templates[template_name] = hashes, offsets, sizes
+            for template_name in set(self.memory_templates) - names:
+                self.memory_templates.pop(template_name)
+            self.template_names = list(template_index.template_names)
+            return
+
+        try:
+            os.makedirs(os.path.join(self.index_path, TEMPLATES_FOLDER), exist_ok=True)
+            for template_name, (_, hashes, offsets, sizes) in compiled.items():
+                self.save_file(self.get_template_path(template_name),
+                               lambda f: np.savez(f, hashes=hashes, offsets=offsets, sizes=sizes))
+
+            for name in INDEX_ARRAYS:
+                array = np.ascontiguousarray(getattr(template_index, name))
+                self.save_file(self.get_array_path(name), lambda f: np.save(f, array))
+
+            self.save_manifest(template_index.template_names)
+
+            for template_name in removed_names:
+                if template_name not in names and os.path.isfile(self.get_template_path(template_name)):
+                    os.remove(self.get_template_path(template_name))
+        except Exception as e:
+            self.log.warning(f'template index is not saved, index_path={self.index_path}, e={e}')
+
+    def save_manifest(self, template_names: list[str]):
+        self.template_names = list(template_names)
+        if not self.index_path:
+            return
+
+        manifest = {"params": self.params, "files": self.files, "template_names": self.template_names}
+        try:
+            self.save_file(os.path.join(self.index_path, MANIFEST_NAME),
+                           lambda f: f.write(json.dumps(manifest).encode()))
+        except Exception as e:
+            self.log.warning(f'manifest is not saved, index_path={self.index_path}, e={e}')
+
+    @staticmethod
+    def save_file(file_path: str, write):
+        tmp_path = f'{file_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, file_path)
@@ -0,0 +1,160 @@
+import asyncio
+import bisect
+import time
+from datetime import datetime
+
+from loguru import logger
+
+from src.audio_container import AudioContainer
+from src.config import Config
+
+DEADLINE_CHECK_INTERVAL = 1  # seconds, idle containers are checked only for deadlines
+TICK_HISTOGRAM_BOUNDS_MS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class TickHistogram(object):
+    """Histogram of tick durations with fixed buckets in milliseconds"""
+
+    def __init__(self, bounds_ms: tuple = TICK_HISTOGRAM_BOUNDS_MS):
+        self.bounds_ms: tuple = bounds_ms
+        self.counts: list[int] = [0] * (len(bounds_ms) + 1)
+        self.count: int = 0
+        self.sum_ms: float = 0
+        self.max_ms: float = 0
+
+    def add(self, duration: float):
+        duration_ms = duration * 1000
+        self.counts[bisect.bisect_left(self.bounds_ms, duration_ms)] += 1
+        self.count += 1
+        self.sum_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def get_stats(self) -> dict:
+        buckets = {f'<={bound}ms': count for bound, count in zip(self.bounds_ms, self.counts)}
+        buckets[f'>{self.bounds_ms[-1]}ms'] = self.counts[-1]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum_ms / self.count, 3) if self.count else 0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": buckets
+        }
+
+
+class TickScheduler(object):
+    """
+    Central scheduler of AudioContainers.
+
+    Instead of a task with own sleep for every channel, one loop runs parse ticks only for containers
+    with new packages (or packages still waiting in the jitter buffer) and for containers with expired deadlines.
+    Containers are processed in batches, the event loop is released between batches.
+    """
+
+    def __init__(self,
+                 config: Config,
+                 audio_containers: dict[str, AudioContainer]):
+        self.config: Config = config
+        self.audio_containers: dict[str, AudioContainer] = audio_containers
+
+        self.parsing_chan_ids: set[str] = set()  # containers which received packages and are not finished
+        self.dirty_chan_ids: set[str] = set()  # containers with packages after the last tick
+
+        self.tick_histogram: TickHistogram = TickHistogram()  # one container
+        self.pass_histogram: TickHistogram = TickHistogram()  # all due containers of one loop iteration
+        self.count_ticks: int = 0
+        self.count_finished: int = 0
+        self.log = logger.bind(object_id=self.__class__.__name__)
+
+    def mark(self, audio_container: AudioContainer):
+        """Called for every allocated package"""
+
+        if audio_container.parse_finished:
+            return
+        self.parsing_chan_ids.add(audio_container.chan_id)
+        self.dirty_chan_ids.add(audio_container.chan_id)
+
+    def get_stats(self) -> dict:
+        return {
+            "parsing": len(self.parsing_chan_ids),
+            "dirty": len(self.dirty_chan_ids),
+            "ticks": self.count_ticks,
+            "finished": self.count_finished,
+            "tick_duration": self.tick_histogram.get_stats(),
+            "pass_duration": self.pass_histogram.get_stats()
+        }
+
+    def get_due_chan_ids(self, check_deadlines: bool) -> list[str]:
+        now = time.monotonic()
+        due_chan_ids: list[str] = []
+
+        chan_ids = self.parsing_chan_ids if check_deadlines else self.dirty_chan_ids
+        for chan_id in list(chan_ids):
+            audio_container = self.audio_containers.get(chan_id)
+            if audio_container is None:
+                self.parsing_chan_ids.discard(chan_id)
+                self.dirty_chan_ids.discard(chan_id)
+            elif chan_id in self.dirty_chan_ids and now >= audio_container.next_tick_time:
+                due_chan_ids.append(chan_id)
+            elif check_deadlines and audio_container.is_deadline_expired(datetime.now()):
+                due_chan_ids.append(chan_id)
+
+        return due_chan_ids
+
+    def run_tick(self, chan_id: str):
+        audio_container = self.audio_containers.get(chan_id)
+        if audio_container is None:
+            return
+
+        t1 = time.perf_counter()
+        is_parsing = audio_container.run_tick()
+        self.tick_histogram.add(time.perf_counter() - t1)
+        self.count_ticks += 1
+
+        if is_parsing is False:
+            self.count_finished += 1
+            self.parsing_chan_ids.discard(chan_id)
+            self.dirty_chan_ids.discard(chan_id)
+        elif len(audio_container.jitter_buffer) == 0:
+            # packages waiting for playout delay need the next tick without new packages
+            self.dirty_chan_ids.discard(chan_id)
+
+    def finish_parsing(self):
+        """Final tick of every parsing container: with alive=False the container finishes and saves the record"""
+
+        chan_ids = list(self.parsing_chan_ids)
+        for chan_id in chan_ids:
+            self.run_tick(chan_id)
+        if chan_ids:
+            self.log.info(f'finished parsing containers: {len(chan_ids)}')
+
+    async def start_scheduler(self):
+        self.log.info('start_scheduler')
+
+        last_deadline_check = time.monotonic()
+        last_log_time = time.monotonic()
+        # calls are parsed during restart (wait_shutdown), containers are finalized when the app is not alive
+        while self.config.alive:
+            await asyncio.sleep(self.config.scheduler_interval)
+
+            t1 = time.monotonic()
+            check_deadlines = t1 - last_deadline_check >= DEADLINE_CHECK_INTERVAL
+            if check_deadlines:
+                last_deadline_check = t1
+
+            due_chan_ids = self.get_due_chan_ids(check_deadlines)
+            for index in range(0, len(due_chan_ids), self.config.scheduler_batch_size):
+                for chan_id in due_chan_ids[index: index + self.config.scheduler_batch_size]:
+                    self.run_tick(chan_id)
+                await asyncio.sleep(0)
+
+            if due_chan_ids:
+                self.pass_histogram.add(time.monotonic() - t1)
+
+            if time.monotonic() - t1 > 1:
+                self.log.warning(f"Huge scheduler pass: {time.monotonic() - t1}, containers: {len(due_chan_ids)}")
+
+            if time.monotonic() - last_log_time > 60:
+                last_log_time = time.monotonic()
+                self.log.info(f"scheduler stats: {self.get_stats()}")
+
+        self.finish_parsing()
+        self.log.info('end start_scheduler')
@@ -1,18 +1,28 @@
+import os
+import selectors
 import socket
 import time
-from multiprocessing import Queue, Event, Process
+from multiprocessing import Queue, Event, Process, Array
 
 from loguru import logger
 
 from src.config import Config
 from src.custom_dataclasses.package import Package
+from src.shared_ring_buffer import SharedRingBuffer
+
+
+STAT_RECEIVED = 0
+STAT_WAKEUPS = 1
+STAT_DROPS = 2
+STAT_RING_FULL = 3
 
 
 class UnicastServer(Process):
     def __init__(self,
                  config: Config,
                  mp_queue: Queue,
-                 finish_event: Event):
+                 finish_event: Event,
+                 shard_id: int = 0):
         Process.__init__(self)
         self.config: Config = config
         self.mp_queue: Queue = mp_queue
@@ -22,14 +32,30 @@ class UnicastServer(Process):
         self.em_port: int = config.app_unicast_port
         self.unicast_protocol: str = config.app_unicast_protocol
         self.app_unicast_buffer_size: int = config.app_unicast_buffer_size
+        self.batch_receive: bool = config.app_unicast_batch_receive
+        self.batch_size: int = max(1, config.app_unicast_batch_size)
+        self.shard_id: int = shard_id
+        self.reuse_port: bool = config.app_unicast_processes > 1
 
         self.buffer_queue: list[Package] = []
         self.alive_time: time = time.monotonic()
         self.buffer_send_time: time = time.monotonic()
 
+        self.ring: SharedRingBuffer | None = None
+        if config.app_unicast_transport == 'shared_memory':
+            # created before fork, so the Manager reads the same memory
+            self.ring = SharedRingBuffer(capacity=config.app_unicast_ring_slots,
+                                         slot_size=self.app_unicast_buffer_size)
+
         self.count_received: int = 0
+        self.count_wakeups: int = 0
+        self.count_ring_full: int = 0
+        self.alive_count_received: int = 0
+        self.alive_count_wakeups: int = 0
         self.server_socket = None
-        self.log = logger.bind(object_id=self.__class__.__name__)
+        # counters are written by the receiver process and read by the parent process for /diag
+        self.shared_stats = Array('q', 4, lock=False)
+        self.log = logger.bind(object_id=f'{self.__class__.__name__}-{shard_id}')
 
     def start(self) -> None:
         # This class use multiprocessing.Process
@@ -38,7 +64,10 @@ class UnicastServer(Process):
 
     def run(self):
         self.initialize_socket()
-        self.receive_packages()
+        if self.batch_receive:
+            self.receive_packages_batch()
+        else:
+            self.receive_packages()
 
     def initialize_socket(self):
         try:
@@ -47,20 +76,82 @@ class UnicastServer(Process):
                 self.unicast_protocol = 'udp'
 
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if self.reuse_port:
+                # the kernel spreads flows between all sockets bound to this port by 4-tuple hash
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             self.server_socket.bind((self.em_host, self.em_port))
             self.server_socket.settimeout(1)
             self.log.debug(f'socket {self.em_host}:{self.em_port} for receive Unicast packages started')
         except Exception as e:
             self.log.exception(e)
 
+    def get_socket_drops(self) -> int:
+        """Count datagrams dropped by the kernel for our socket (only linux, else 0)"""
+
+        try:
+            inode = str(os.fstat(self.server_socket.fileno()).st_ino)
+            with open('/proc/net/udp') as f:
+                for line in f.readlines()[1:]:
+                    columns = line.split()
+                    if columns[9] == inode:
+                        return int(columns[-1])
+        except (OSError, IndexError, ValueError):
+            pass
+        return 0
+
+    def update_shared_stats(self):
+        self.shared_stats[STAT_RECEIVED] = self.count_received
+        self.shared_stats[STAT_WAKEUPS] = self.count_wakeups
+        self.shared_stats[STAT_RING_FULL] = self.count_ring_full
+
+    def get_shared_stats(self) -> dict:
+        """Statistics of this shard, can be called from the parent process"""
+
+        return {
+            "shard_id": self.shard_id,
+            "pid": self.pid,
+            "alive": self.is_alive(),
+            "count_received": self.shared_stats[STAT_RECEIVED],
+            "count_wakeups": self.shared_stats[STAT_WAKEUPS],
+            "count_drops": self.shared_stats[STAT_DROPS],
+            "count_ring_full": self.shared_stats[STAT_RING_FULL]
+        }
+
+    def get_stats(self) -> dict:
+        """Receive counters since the previous alive log"""
+
+        duration = max(time.monotonic() - self.alive_time, 0.001)
+        received = self.count_received - self.alive_count_received
+        wakeups = self.count_wakeups - self.alive_count_wakeups
+        return {
+            "count_received": self.count_received,
+            "packets_per_second": round(received / duration, 1),
+            "datagrams_per_wakeup": round(received / wakeups, 2) if wakeups else 0
+        }
+
+    def log_alive(self):
+        if time.monotonic() - self.alive_time > 30:
+            stats = self.get_stats()
+            self.shared_stats[STAT_DROPS] = self.get_socket_drops()
+            self.log.info(f"alive, count_received={stats['count_received']} "
+                          f"packets_per_second={stats['packets_per_second']} "
+                          f"datagrams_per_wakeup={stats['datagrams_per_wakeup']} "
+                          f"count_drops={self.shared_stats[STAT_DROPS]}")
+            self.alive_time = time.monotonic()
+            self.alive_count_received = self.count_received
+            self.alive_count_wakeups = self.count_wakeups
+
     def send_buffer(self):
-        if len(self.buffer_queue) > 0:
+        if self.ring is not None:
+            # packages are already visible to the Manager
+            self.buffer_send_time = time.monotonic()
+            self.update_shared_stats()
+        elif len(self.buffer_queue) > 0:
             self.mp_queue.put_nowait(self.buffer_queue)
             self.buffer_send_time = time.monotonic()
             self.buffer_queue = []
-        if time.monotonic() - self.alive_time > 30:
-            self.log.info(f"alive, count_received={self.count_received}")
-            self.alive_time = time.monotonic()
+            self.update_shared_stats()
+        self.log_alive()
 
     def receive_packages(self):
         self.log.debug('Start waiting and receiving RTP packages')
@@ -68,14 +159,23 @@ class UnicastServer(Process):
             try:
                 try:
                     data, addr = self.server_socket.recvfrom(self.app_unicast_buffer_size)
+                    self.count_received += 1
+                    self.count_wakeups += 1
+                    if self.ring is not None:
+                        if self.ring.put(data, addr) is False:
+                            self.count_ring_full += 1
+                        if (time.monotonic() - self.buffer_send_time) > 0.2:
+                            self.send_buffer()
+                        continue
+
                     package = Package(addr[0], addr[1], data)
                     self.buffer_queue.append(package)
-                    self.count_received += 1
 
                     if len(self.buffer_queue) > 300 or (time.monotonic() - self.buffer_send_time) > 0.2:
                         self.mp_queue.put_nowait(self.buffer_queue)
                         self.buffer_send_time = time.monotonic()
                         self.buffer_queue = []
+                        self.update_shared_stats()
 
                 except socket.timeout:
                     self.send_buffer()
@@ -88,3 +188,87 @@ class UnicastServer(Process):
                     self.finish_event.set()
         self.server_socket.close()
         self.log.info('END WHILE UNICAST')
+
+    def drain_socket(self, views: list[memoryview]) -> int:
+        """
+        Read up to batch_size datagrams from non-blocking socket into preallocated buffers
+
+        :param views: memoryview of every preallocated buffer (avoid create new view for every datagram)
+        :return: count received datagrams
+        """
+        count = 0
+        for view in views:
+            try:
+                nbytes, addr = self.server_socket.recvfrom_into(view)
+            except (BlockingIOError, InterruptedError):
+                break
+
+            self.buffer_queue.append(Package(addr[0], addr[1], bytes(view[:nbytes])))  # the only copy
+            count += 1
+
+        self.count_received += count
+        return count
+
+    def drain_socket_into_ring(self) -> int:
+        """
+        Read up to batch_size datagrams from non-blocking socket directly into slots of the shared ring
+
+        :return: count received datagrams
+        """
+        count = 0
+        for _ in range(self.batch_size):
+            view = self.ring.get_write_view()
+            if view is None:
+                # the Manager is late, leave datagrams in the socket buffer
+                self.count_ring_full += 1
+                time.sleep(0.001)
+                break
+            try:
+                nbytes, addr = self.server_socket.recvfrom_into(view)
+            except (BlockingIOError, InterruptedError):
+                break
+
+            self.ring.commit(nbytes, addr)
+            count += 1
+
+        self.count_received += count
+        return count
+
+    def receive_packages_batch(self):
+        self.log.debug(f'Start waiting and receiving RTP packages, batch_size={self.batch_size}')
+        buffers = [bytearray(self.app_unicast_buffer_size) for _ in range(self.batch_size)]
+        views = [memoryview(buffer) for buffer in buffers]
+
+        self.server_socket.setblocking(False)
+        selector = selectors.DefaultSelector()  # epoll on linux
+        selector.register(self.server_socket, selectors.EVENT_READ)
+
+        while self.finish_event.is_set() is False:
+            try:
+                try:
+                    if selector.select(timeout=0.2):
+                        self.count_wakeups += 1
+                        # socket may contain more than batch_size datagrams, read until it is empty
+                        if self.ring is not None:
+                            while self.drain_socket_into_ring() == self.batch_size:
+                                continue
+                        else:
+                            while self.drain_socket(views) == self.batch_size:
+                                if len(self.buffer_queue) > 300:
+                                    break
+
+                    if len(self.buffer_queue) > 300 or (time.monotonic() - self.buffer_send_time) > 0.2:
+                        self.send_buffer()
+                    else:
+                        self.log_alive()
+
+                except socket.error as e:
+                    self.send_buffer()
+                    self.log.error(e)
+            except KeyboardInterrupt:
+                self.log.info('KeyboardInterrupt')
+                if self.finish_event.is_set() is False:
+                    self.finish_event.set()
+        selector.close()
+        self.server_socket.close()
+        self.log.info('END WHILE UNICAST')
@@ -1,19 +1,18 @@
-import asyncio
 import json
 import os
 import time
-from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import soundfile as sf
 from loguru import logger
 
-from src.config import Config
-from src.custom_dataclasses.template import Template
-from src.detector import Detector
-from src.fingerprint_mining import get_fingerprint
+from src.config import Config, DEFAULT_SAMPLE_SIZE
+from src.detect_worker import init_worker, detect_channels
+from src.detector import DETECT_WINDOW_PACKAGES
+from src.template_store import TemplateStore
 
 
-async def main():
+def main():
     config = Config()
     config.template_folder_path = 'templates/enable'
     time.sleep(0.1)
@@ -22,45 +21,37 @@ async def main():
     os.makedirs(folder_records, exist_ok=True)
     file_list = [file for file in os.listdir(folder_records) if file.endswith('.wav')]
 
-    ppe = ProcessPoolExecutor()
-
-    detector = Detector(config=config,
-                        audio_containers=dict(),
-                        ppe=ppe)
-    await detector.start_detection()
-    await asyncio.sleep(2)
+    # the same pipeline as in the detect workers: SpectrumCache and StreamingMatcher of every record
+    template_index = TemplateStore(folder_path=config.template_folder_path,
+                                   index_path='',
+                                   phase_shift=config.template_phase_shift).load()
+    template_index.build()
+    init_worker(template_index.template_names, template_index.hashes, template_index.ids, template_index.offsets)
 
+    window_samples = DETECT_WINDOW_PACKAGES * DEFAULT_SAMPLE_SIZE
+    chunk_samples = DEFAULT_SAMPLE_SIZE * 5  # one tick of the scheduler
     results = {}
 
     for index, file_name in enumerate(file_list):
         logger.info(f'search in file_name={file_name}')
-        file_path = os.path.join(folder_records, file_name)
-        data, sample_rate = sf.read(file_path, dtype='int16')
-
-        template = Template(template_id=index + 20000000,
-                            template_name=file_name,
-                            amplitudes=data.tolist(),
-                            sample_rate=sample_rate)
-
-        count_amps = 8000 * 3
-        count_parts = len(template.amplitudes) // count_amps + 1
-
-        for part in range(0, count_parts):
-            part_amps = template.amplitudes[part * count_amps: (part + 1) * count_amps]
-            fingerprint = get_fingerprint(print_name=file_name, amplitudes=part_amps)
-            found_template = detector.analise_fingerprint(fingerprint)
-            if found_template is not None:
-                results[file_name] = found_template
-                print(f"in file={file_name} found template={found_template}")
+        data, sample_rate = sf.read(os.path.join(folder_records, file_name), dtype='int16')
+        data = data if data.ndim == 1 else data[:, 0]
 
-            if (index + 1) % 10 == 0 and len(results) > 0:
-                with open(f"result_{index}", 'w', encoding='utf-8') as jsonf:
-                    jsonf.write(json.dumps(results, indent=4))
-                    results = {}
+        for start in range(0, data.size, chunk_samples):
+            samples = np.ascontiguousarray(data[start: start + chunk_samples])
+            [(_, found_template, match_count, _)] = detect_channels([(file_name, samples, window_samples, start == 0)])
+            if found_template is not None and found_template not in results.get(file_name, {}):
+                # the first crossing of the threshold
+                results.setdefault(file_name, {})[found_template] = {"match_count": match_count,
+                                                                     "second": start / sample_rate}
+                print(f"in file={file_name} found template={found_template} match_count={match_count}")
 
-    await asyncio.sleep(1)
-    config.wait_shutdown = True
+        detect_channels([(file_name, None, window_samples, False)])
+        if (index + 1) % 10 == 0 and len(results) > 0:
+            with open(f"result_{index}", 'w', encoding='utf-8') as jsonf:
+                jsonf.write(json.dumps(results, indent=4))
+                results = {}
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    main()
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from scipy.ndimage import generate_binary_structure, iterate_structure, maximum_filter
+
+from src.config import DEFAULT_AMP_MIN, PEAK_NEIGHBORHOOD_SIZE
+from src.custom_functions.stft import specgram
+from src.fingerprint_mining import get_2d_peaks, get_log_spectrum
+from tests.benchmark_generate_hashes import get_window
+
+
+def get_2d_peaks_footprint(arr2d: np.ndarray,
+                           amp_min: int = DEFAULT_AMP_MIN,
+                           connectivity_mask: int = 1,
+                           peak_neighborhood_size: int = PEAK_NEIGHBORHOOD_SIZE) -> tuple:
+    """Previous get_2d_peaks: maximum_filter with the footprint, the threshold after the extraction"""
+
+    neighborhood = iterate_structure(generate_binary_structure(2, connectivity_mask), peak_neighborhood_size)
+    local_max = maximum_filter(arr2d, footprint=neighborhood) == arr2d
+    amps = arr2d[local_max]
+    freqs, times = np.where(local_max)
+    filter_idxs = np.where(amps.flatten() > amp_min)
+    return freqs[filter_idxs], times[filter_idxs], amps[filter_idxs]
+
+
+def check_equal(spectrums: list[np.ndarray]):
+    """The same peaks as with the footprint, for the square and the diamond masks, also on plateaus and edges"""
+
+    rng = np.random.default_rng(2)
+    plateaus = [np.round(rng.random((rng.integers(1, 40), rng.integers(1, 60))) * 15).astype(np.float32)
+                for _ in range(200)]
+    for arr2d in spectrums + plateaus:
+        for connectivity_mask in (1, 2):
+            for peak_neighborhood_size in (1, 2, PEAK_NEIGHBORHOOD_SIZE):
+                expected = get_2d_peaks_footprint(arr2d, connectivity_mask=connectivity_mask,
+                                                  peak_neighborhood_size=peak_neighborhood_size)
+                actual = get_2d_peaks(arr2d, connectivity_mask=connectivity_mask,
+                                      peak_neighborhood_size=peak_neighborhood_size)
+                for a, b in zip(expected, actual):
+                    assert np.array_equal(a, b)
+
+
+def main():
+    spectrums = [get_log_spectrum(specgram(get_window(seed))) for seed in range(50)]
+    check_equal(spectrums)
+
+    for connectivity_mask, mask_name in ((1, 'diamond'), (2, 'square')):
+        start_time = time.perf_counter()
+        for arr2d in spectrums:
+            get_2d_peaks_footprint(arr2d, connectivity_mask=connectivity_mask)
+        footprint_time = (time.perf_counter() - start_time) / len(spectrums)
+
+        start_time = time.perf_counter()
+        for arr2d in spectrums:
+            get_2d_peaks(arr2d, connectivity_mask=connectivity_mask)
+        new_time = (time.perf_counter() - start_time) / len(spectrums)
+
+        print(f'{mask_name} mask, 3 s window {spectrums[0].shape}: footprint {footprint_time * 1000:.2f} ms/call, '
+              f'get_2d_peaks {new_time * 1000:.2f} ms/call')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.config import DEFAULT_SAMPLE_RATE
+from src.spectrum_cache import SpectrumCache
+
+WINDOW_SAMPLES = DEFAULT_SAMPLE_RATE * 3
+TICK_SAMPLES = 800  # 5 packages of 20 ms, samples of one channel between two detections
+
+caches: dict[int, SpectrumCache] = {}
+
+
+def get_cache(chan_id: int) -> SpectrumCache:
+    if chan_id not in caches:
+        caches[chan_id] = SpectrumCache(count_frames=SpectrumCache.get_count_frames(WINDOW_SAMPLES))
+    return caches[chan_id]
+
+
+def spectrum_per_channel(chan_id: int, samples: np.ndarray) -> np.ndarray:
+    """Previous path: one task and one FFT call per channel"""
+
+    return get_cache(chan_id).add_samples(samples)
+
+
+def spectrum_batch(chan_ids: list[int], samples_list: list[np.ndarray]) -> list[np.ndarray]:
+    return SpectrumCache.add_samples_batch([get_cache(chan_id) for chan_id in chan_ids], samples_list)
+
+
+def check_equal(count_channels: int = 50, count_ticks: int = 40):
+    """Batched frames are the same as frames of one channel"""
+
+    rng = np.random.default_rng(1)
+    single = [SpectrumCache(count_frames=200) for _ in range(count_channels)]
+    batched = [SpectrumCache(count_frames=200) for _ in range(count_channels)]
+    for _ in range(count_ticks):
+        samples_list = [rng.normal(0, 3000, rng.integers(0, 2000)).astype(np.int16) for _ in range(count_channels)]
+        frames_list = SpectrumCache.add_samples_batch(batched, samples_list)
+        for cache, samples, frames in zip(single, samples_list, frames_list):
+            assert np.allclose(cache.add_samples(samples), frames)
+    for a, b in zip(single, batched):
+        assert np.allclose(a.get_spectrum(), b.get_spectrum())
+
+
+def main():
+    count_channels = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    count_ticks = 20
+    check_equal()
+
+    rng = np.random.default_rng(7)
+    ticks = [[rng.normal(0, 3000, TICK_SAMPLES).astype(np.int16) for _ in range(count_channels)]
+             for _ in range(count_ticks)]
+
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        executor.submit(get_cache, 0).result()  # start the worker
+
+        start_time = time.perf_counter()
+        for samples_list in ticks:
+            futures = [executor.submit(spectrum_per_channel, chan_id, samples)
+                       for chan_id, samples in enumerate(samples_list)]
+            [future.result() for future in futures]
+        per_channel_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for samples_list in ticks:
+            futures = [executor.submit(spectrum_batch,
+                                       list(range(start, min(start + batch_size, count_channels))),
+                                       samples_list[start: start + batch_size])
+                       for start in range(0, count_channels, batch_size)]
+            [future.result() for future in futures]
+        batch_time = time.perf_counter() - start_time
+
+    print(f'channels={count_channels} ticks={count_ticks} batch_size={batch_size}, one worker process')
+    print(f'per channel: {count_channels * count_ticks / per_channel_time:.0f} channels/s')
+    print(f'batched: {count_channels * count_ticks / batch_time:.0f} channels/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+
+from src.config import DEFAULT_SAMPLE_RATE, DEFAULT_SAMPLE_SIZE
+from src.dtmf_detector import DTMF_KEYS, DTMF_LOW_FREQS, DTMF_HIGH_FREQS, DtmfDetector
+from src.spectrum_cache import SpectrumCache
+from src.streaming_matcher import StreamingMatcher
+from src.template_index import TemplateIndex
+
+TICK_PACKAGES = 5  # packages of one channel between two ticks (0.1 s)
+
+
+def get_digits_audio(code: str, rng: np.random.Generator) -> np.ndarray:
+    """Digits of 60 ms with pauses of 60 ms between noise"""
+
+    t = np.arange(int(DEFAULT_SAMPLE_RATE * 0.06)) / DEFAULT_SAMPLE_RATE
+    parts = [rng.normal(0, 300, DEFAULT_SAMPLE_RATE)]
+    for key in code:
+        row = next(num for num, keys in enumerate(DTMF_KEYS) if key in keys)
+        column = DTMF_KEYS[row].index(key)
+        parts.append(3000 * np.sin(2 * np.pi * DTMF_LOW_FREQS[row] * t) +
+                     2500 * np.sin(2 * np.pi * DTMF_HIGH_FREQS[column] * t))
+        parts.append(rng.normal(0, 300, t.size))
+    audio = np.concatenate(parts).astype(np.int16)
+    return audio[:audio.size // DEFAULT_SAMPLE_SIZE * DEFAULT_SAMPLE_SIZE].reshape(-1, DEFAULT_SAMPLE_SIZE)
+
+
+def main():
+    rng = np.random.default_rng(4)
+    count_channels = 500
+    codes = [''.join(rng.choice(list('0123456789*#ABCD'), 6)) for _ in range(count_channels)]
+    streams = [get_digits_audio(code, rng) for code in codes]
+    count_ticks = min(len(stream) for stream in streams) // TICK_PACKAGES
+
+    dtmf_detector = DtmfDetector()
+    found = {num: '' for num in range(count_channels)}
+    start_time = time.perf_counter()
+    for tick in range(count_ticks):
+        packages = {num: stream[tick * TICK_PACKAGES: (tick + 1) * TICK_PACKAGES] for num, stream in enumerate(streams)}
+        for num, digits in dtmf_detector.process(packages).items():
+            found[num] += digits
+    dtmf_time = time.perf_counter() - start_time
+    correct = sum(codes[num].startswith(digits) and len(digits) > 0 for num, digits in found.items())
+
+    # spectrum and streaming matching of the same audio (empty template index, so without votes)
+    template_index = TemplateIndex()
+    template_index.build()
+    caches = [SpectrumCache(count_frames=SpectrumCache.get_count_frames(DEFAULT_SAMPLE_RATE * 3))
+              for _ in range(count_channels)]
+    matchers = [StreamingMatcher(template_index=template_index, window_frames=cache.count_frames) for cache in caches]
+    start_time = time.perf_counter()
+    for tick in range(count_ticks):
+        frames_list = SpectrumCache.add_samples_batch(
+            caches, [stream[tick * TICK_PACKAGES: (tick + 1) * TICK_PACKAGES].ravel() for stream in streams])
+        for matcher, frames in zip(matchers, frames_list):
+            matcher.add_frames(frames)
+    fingerprint_time = time.perf_counter() - start_time
+
+    print(f'channels={count_channels} ticks={count_ticks}, digits found correctly on {correct} channels')
+    print(f'goertzel: {dtmf_time * 1000 / count_ticks:.2f} ms/tick, '
+          f'spectrum + matching: {fingerprint_time * 1000 / count_ticks:.2f} ms/tick')
+
+
+if __name__ == '__main__':
+    main()
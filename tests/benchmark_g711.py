@@ -0,0 +1,47 @@
+import random
+import struct
+import time
+
+import numpy as np
+
+from src.custom_functions.g711 import (CODEC_ULAW,
+                                       CODEC_ALAW,
+                                       ulaw2linear,
+                                       alaw2linear,
+                                       decode_payload,
+                                       decode_payloads)
+from src.custom_dataclasses.package import Package
+
+
+def main():
+    count_packages = 20000
+    payloads = [bytes(random.randint(0, 255) for _ in range(160)) for _ in range(count_packages)]
+
+    for codec, python_decoder in ((CODEC_ULAW, ulaw2linear), (CODEC_ALAW, alaw2linear)):
+        start_time = time.perf_counter()
+        python_result = [[python_decoder(value) for value in payload] for payload in payloads]
+        python_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        packet_result = [decode_payload(payload, codec) for payload in payloads]
+        packet_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        batch_result = decode_payloads(payloads, codec)
+        batch_time = time.perf_counter() - start_time
+
+        assert all(np.array_equal(a, b) for a, b in zip(python_result, batch_result))
+        assert all(np.array_equal(a, b) for a, b in zip(packet_result, batch_result))
+
+        # codec of the container (em_codec) is used instead of the payload type 0 (PCMU)
+        header = struct.pack('>BBHII', 0x80, 0, 1, 160, 12345)
+        assert all(np.array_equal(Package('127.0.0.1', 5000, header + payload, codec=codec).samples, result)
+                   for payload, result in zip(payloads[:100], batch_result))
+
+        print(f'{codec}: per-sample python={python_time / count_packages * 1e6:.2f} us/package, '
+              f'lookup per package={packet_time / count_packages * 1e6:.2f} us/package, '
+              f'lookup per batch={batch_time / count_packages * 1e6:.2f} us/package')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import random
+import time
+from operator import itemgetter
+
+import matplotlib.mlab as mlab
+import numpy as np
+
+from src.config import (DEFAULT_SAMPLE_RATE,
+                        DEFAULT_WINDOW_SIZE,
+                        DEFAULT_OVERLAP_RATIO,
+                        DEFAULT_FAN_VALUE,
+                        MIN_HASH_TIME_DELTA,
+                        MAX_HASH_TIME_DELTA)
+from src.custom_dataclasses.fingerprint import FingerPrint
+from src.fingerprint_mining import get_2d_peaks, generate_hashes, pack_hash
+
+
+def generate_hashes_loop(peaks: list[tuple], fan_value: int = DEFAULT_FAN_VALUE) -> dict:
+    """Previous generate_hashes: nested loop over peaks and fan_value, dict insertion for every pair"""
+
+    hashes_offsets, first_points, second_points = {}, {}, {}
+    peaks.sort(key=itemgetter(1))
+    for i in range(len(peaks)):
+        for j in range(1, fan_value):
+            if (i + j) < len(peaks):
+                freq1, t1, amp1 = peaks[i]
+                freq2, t2, amp2 = peaks[i + j]
+                if freq1 < 2 or freq2 < 2:
+                    continue
+                t_delta = t2 - t1
+                if freq1 > freq2:
+                    freq1, freq2, t1, t2, amp1, amp2 = freq2, freq1, t2, t1, amp2, amp1
+                balance = 1 if amp1 > amp2 else 0
+                if MIN_HASH_TIME_DELTA <= t_delta <= MAX_HASH_TIME_DELTA:
+                    packed_hash = pack_hash(freq1, freq2, t_delta, balance)
+                    hashes_offsets.setdefault(packed_hash, int(t1))
+                    first_points.setdefault(packed_hash, (int(t1), int(freq1)))
+                    second_points.setdefault(packed_hash, (int(t2), int(freq2)))
+    return {"hashes_offsets": hashes_offsets, "first_points": first_points, "second_points": second_points}
+
+
+def get_window(seed: int) -> np.ndarray:
+    """3 seconds of tones, chirps and noise"""
+
+    rnd = random.Random(seed)
+    t = np.arange(DEFAULT_SAMPLE_RATE * 3) / DEFAULT_SAMPLE_RATE
+    signal = np.random.default_rng(seed).normal(0, rnd.uniform(5, 200), t.size)
+    for _ in range(rnd.randint(1, 8)):
+        f0, f1 = rnd.uniform(200, 3800), rnd.uniform(200, 3800)
+        start, end = sorted(rnd.sample(range(t.size), 2))
+        part = t[:end - start]
+        signal[start:end] += rnd.uniform(300, 8000) * np.sin(2 * np.pi * (f0 + (f1 - f0) * part / 6) * part)
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+
+def main():
+    count_windows = 200
+    windows_peaks = []
+    for seed in range(count_windows):
+        amplitudes = np.concatenate((np.zeros(DEFAULT_WINDOW_SIZE * 2),
+                                     get_window(seed),
+                                     np.zeros(DEFAULT_WINDOW_SIZE)))
+        spectrum, _, _ = mlab.specgram(amplitudes,
+                                       NFFT=DEFAULT_WINDOW_SIZE,
+                                       Fs=DEFAULT_SAMPLE_RATE,
+                                       window=mlab.window_hanning,
+                                       noverlap=int(DEFAULT_WINDOW_SIZE * DEFAULT_OVERLAP_RATIO))
+        arr2d = 10 * np.log10(spectrum, out=np.zeros_like(spectrum), where=(spectrum > 1))
+        windows_peaks.append((arr2d, get_2d_peaks(arr2d)))
+
+    start_time = time.perf_counter()
+    loop_results = [generate_hashes_loop(list(zip(*peaks))) for _, peaks in windows_peaks]
+    loop_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    vector_results = [generate_hashes(FingerPrint(print_name='bench', arr2d=arr2d), peaks)
+                      for arr2d, peaks in windows_peaks]
+    vector_time = time.perf_counter() - start_time
+
+    for loop_result, fingerprint in zip(loop_results, vector_results):
+        assert loop_result["hashes_offsets"] == fingerprint.hashes_offsets
+        assert list(loop_result["hashes_offsets"]) == fingerprint.hashes.tolist()  # the same order
+        assert loop_result["first_points"] == fingerprint.first_points
+        assert loop_result["second_points"] == fingerprint.second_points
+
+    count_peaks = sum(peaks[0].size for _, peaks in windows_peaks) / count_windows
+    count_hashes = sum(fingerprint.hashes.size for fingerprint in vector_results) / count_windows
+    print(f'3 second windows: {count_windows}, peaks/window={count_peaks:.0f}, hashes/window={count_hashes:.0f}')
+    print(f'nested loop: {loop_time / count_windows * 1000:.2f} ms/window')
+    print(f'vectorized: {vector_time / count_windows * 1000:.2f} ms/window')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import time
+
+import numpy as np
+
+from src.config import (MATCH_MIN_TEMPLATE_HASHES,
+                        MATCH_MIN_TIMELY_HASHES,
+                        MATCH_MIN_OFFSET_TIMES,
+                        MATCH_MIN_COUNT,
+                        MATCH_WEIGHT_OFFSET_TIMES)
+from src.custom_dataclasses.fingerprint import FingerPrint
+from src.template_index import TemplateIndex
+
+
+def align_median_loop(template_index: TemplateIndex,
+                      hashes: np.ndarray,
+                      offsets: np.ndarray,
+                      min_hashes: int = MATCH_MIN_TEMPLATE_HASHES) -> dict:
+    """
+    Previous alignment: median difference of offsets, one template after another
+
+    :return: template_id: (timely hashes, offset times)
+    """
+
+    query_index, template_ids, template_offsets = template_index.lookup(hashes)
+    order = np.lexsort((query_index, template_ids))
+    query_index, template_ids, template_offsets = query_index[order], template_ids[order], template_offsets[order]
+    ids, starts, counts = np.unique(template_ids, return_index=True, return_counts=True)
+
+    results = {}
+    for template_id, start, count in zip(ids, starts, counts):
+        if count < min_hashes:
+            continue
+        match_offsets = offsets[query_index[start: start + count]]
+        diff_offsets = match_offsets - template_offsets[start: start + count]
+        timely_offsets = match_offsets[diff_offsets == np.median(diff_offsets)]
+        results[int(template_id)] = timely_offsets.size, np.unique(timely_offsets).size
+    return results
+
+
+def is_detected(timely_hashes: int, offset_times: int) -> bool:
+    """MATCH_* thresholds of detection"""
+
+    return (timely_hashes >= MATCH_MIN_TIMELY_HASHES and offset_times >= MATCH_MIN_OFFSET_TIMES and
+            timely_hashes + offset_times * MATCH_WEIGHT_OFFSET_TIMES >= MATCH_MIN_COUNT)
+
+
+def get_decisions(template_index: TemplateIndex, hashes: np.ndarray, offsets: np.ndarray) -> tuple[set, set]:
+    """:return: detected template ids of the median loop and of TemplateIndex.align"""
+
+    median = {template_id for template_id, (timely_hashes, offset_times)
+              in align_median_loop(template_index, hashes, offsets).items() if is_detected(timely_hashes, offset_times)}
+    ids, _, _, _, timely_hashes, offset_times = template_index.align(hashes, offsets,
+                                                                     min_hashes=MATCH_MIN_TEMPLATE_HASHES)
+    aligned = {int(template_id) for template_id, timely, times in zip(ids, timely_hashes, offset_times)
+               if is_detected(int(timely), int(times))}
+    return median, aligned
+
+
+def get_embedded_query(rng: np.random.Generator,
+                       template: FingerPrint,
+                       vocabulary: np.ndarray,
+                       ratio: float,
+                       count_noise: int) -> tuple[np.ndarray, np.ndarray]:
+    """ratio of hashes of the template shifted in time, between noise hashes of the vocabulary"""
+
+    taken = rng.random(template.hashes.size) < ratio
+    noise = np.setdiff1d(rng.choice(vocabulary, count_noise, replace=False), template.hashes[taken])
+    hashes = np.concatenate((template.hashes[taken], noise))
+    offsets = np.concatenate((template.offsets[taken] + rng.integers(0, 500), rng.integers(0, 2000, noise.size)))
+    order = rng.permutation(hashes.size)
+    return hashes[order], offsets[order]
+
+
+def check_decisions(rng: np.random.Generator, vocabulary: np.ndarray):
+    """
+    Detect/reject decisions at the MATCH_* thresholds are the same as of the median loop:
+    random queries, queries with a template between noise hashes
+    """
+    template_index = TemplateIndex()
+    templates = [get_fingerprint(rng, vocabulary[:5000], 300) for _ in range(100)]
+    for num, template in enumerate(templates):
+        template_index.add(f'template_{num}', template)
+    template_index.build()
+
+    count_detected = 0
+    for num in range(300):
+        if num % 3 == 0:
+            hashes, offsets = get_fingerprint(rng, vocabulary, 2000).get_hash_arrays()
+        else:
+            template = templates[rng.integers(0, len(templates))]
+            hashes, offsets = get_embedded_query(rng, template, vocabulary, rng.uniform(0.2, 1), 2000)
+        median, aligned = get_decisions(template_index, hashes, offsets)
+        assert median == aligned, (num, median, aligned)
+        count_detected += len(aligned)
+    print(f'decisions: 300 queries, the same {count_detected} detections')
+
+
+def check_align(template_index: TemplateIndex, hashes: np.ndarray, offsets: np.ndarray):
+    """Median difference, timely hashes and offset times of every template are the same as of the median loop"""
+
+    query_index, template_ids, template_offsets = template_index.lookup(hashes)
+    ids, first_query, counts, diff_offsets, timely_hashes, offset_times = template_index.align(hashes, offsets)
+    expected = align_median_loop(template_index, hashes, offsets, min_hashes=1)
+    assert sorted(expected) == ids.tolist()
+    for position, template_id in enumerate(ids.tolist()):
+        matches = template_ids == template_id
+        differences = offsets[query_index[matches]] - template_offsets[matches]
+        assert counts[position] == np.count_nonzero(matches)
+        assert first_query[position] == query_index[matches].min()
+        assert diff_offsets[position] == np.floor(np.median(differences))
+        assert (timely_hashes[position], offset_times[position]) == expected[template_id]
+
+
+def get_fingerprint(rng: np.random.Generator, vocabulary: np.ndarray, count_hashes: int) -> FingerPrint:
+    fingerprint = FingerPrint(print_name='bench', arr2d=None)
+    fingerprint.hashes = rng.choice(vocabulary, count_hashes, replace=False)
+    fingerprint.offsets = np.sort(rng.integers(0, 2000, count_hashes)).astype(np.int64)
+    return fingerprint
+
+
+def main():
+    rng = np.random.default_rng(3)
+    vocabulary = rng.choice(1 << 40, 20000, replace=False).astype(np.uint64)  # shared by all templates
+
+    small_vocabulary = vocabulary[:300]
+    template_index = TemplateIndex()
+    for num in range(50):
+        template_index.add(f'template_{num}', get_fingerprint(rng, small_vocabulary, 100))
+    for _ in range(30):
+        check_align(template_index, *get_fingerprint(rng, small_vocabulary, 150).get_hash_arrays())
+    check_decisions(rng, vocabulary)
+
+    for count_templates in (100, 1000, 4000):
+        template_index = TemplateIndex()
+        for num in range(count_templates):
+            template_index.add(f'template_{num}', get_fingerprint(rng, vocabulary, 3000))
+        template_index.build()
+
+        queries = [get_fingerprint(rng, vocabulary, 2000) for _ in range(20)]
+        start_time = time.perf_counter()
+        for query in queries:
+            align_median_loop(template_index, *query.get_hash_arrays())
+        loop_time = (time.perf_counter() - start_time) / len(queries)
+
+        start_time = time.perf_counter()
+        for query in queries:
+            template_index.align(*query.get_hash_arrays())
+        histogram_time = (time.perf_counter() - start_time) / len(queries)
+
+        print(f'templates={count_templates}: median loop {loop_time * 1000:.1f} ms/query, '
+              f'one sort {histogram_time * 1000:.1f} ms/query')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import pickle
+import random
+import struct
+import sys
+import time
+from datetime import datetime, timedelta
+
+from src.custom_dataclasses.package import Package
+
+
+def parse_eager(em_host: str, em_port: int, data: bytes) -> dict:
+    """Previous Package.__post_init__: everything is decoded for every datagram"""
+
+    csrc_count = data[0] & 0x0F
+    payload = data[12 + (4 * csrc_count):]
+    amplitudes = list(struct.unpack(">" + "h" * (len(payload) // 2), payload))
+    wav_bytes = b''
+    for amp in amplitudes:
+        wav_bytes += struct.pack('<h', amp)
+
+    return {
+        "em_host": em_host,
+        "em_port": em_port,
+        "data": data,
+        "csrc_count": csrc_count,
+        "payload_type": data[1] & 0x7F,
+        "seq_num": int.from_bytes(data[2:4], byteorder='big', signed=False),
+        "payload": payload,
+        "timestamp": int.from_bytes(data[4:8], byteorder='big'),
+        "ssrc": int.from_bytes(data[8:12], byteorder='big'),
+        "em_address": f"{em_host}:{em_port}",
+        "em_address_ssrc": f"{int.from_bytes(data[8:12], byteorder='big')}@{em_host}:{em_port}",
+        "amplitudes": amplitudes,
+        "max_amplitude": max(amplitudes),
+        "min_amplitude": min(amplitudes),
+        "wav_bytes": wav_bytes,
+        "lose_time": datetime.now() + timedelta(seconds=5)
+    }
+
+
+def main():
+    count = 20000
+    datagrams: list[bytes] = []
+    for seq_num in range(count):
+        header = struct.pack('>BBHII', 0x80, 11, seq_num % 65536, seq_num * 160, 12345)
+        payload = struct.pack('>160h', *[random.randint(-32000, 32000) for _ in range(160)])
+        datagrams.append(header + payload)
+
+    start_time = time.perf_counter()
+    eager = [parse_eager('127.0.0.1', 5000, data) for data in datagrams]
+    eager_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    lazy = [Package('127.0.0.1', 5000, data) for data in datagrams]
+    lazy_time = time.perf_counter() - start_time
+    lazy_pickle_size = len(pickle.dumps(lazy)) / count  # as sent by the unicast server, before decoding
+
+    start_time = time.perf_counter()
+    for package in lazy:
+        _ = package.max_amplitude, package.min_amplitude, package.wav_bytes
+    lazy_decode_time = time.perf_counter() - start_time
+
+    assert all(e['wav_bytes'] == p.wav_bytes and e['max_amplitude'] == p.max_amplitude for e, p in zip(eager, lazy))
+
+    # G.711 samples are decoded by the lookup table once, next accesses return the kept array
+    ulaw = [Package('127.0.0.1', 5000, bytes([0x80, 0]) + data[2:]) for data in datagrams]
+    access_times = []
+    for _ in range(3):
+        start_time = time.perf_counter()
+        for package in ulaw:
+            _ = package.samples
+        access_times.append(time.perf_counter() - start_time)
+    assert all(package.samples is package.samples and not package.samples.flags.writeable for package in ulaw)
+
+    print(f'eager parse: {eager_time / count * 1e6:.2f} us/package, '
+          f'pickle size={len(pickle.dumps(eager)) / count:.0f} B/package, '
+          f'object size={sys.getsizeof(eager[0]) + sys.getsizeof(eager[0]["amplitudes"])} B')
+    print(f'lazy parse: {lazy_time / count * 1e6:.2f} us/package, '
+          f'pickle size={lazy_pickle_size:.0f} B/package, '
+          f'object size={sys.getsizeof(lazy[0])} B')
+    print(f'lazy parse + stats + wav_bytes: {(lazy_time + lazy_decode_time) / count * 1e6:.2f} us/package')
+    print(f'ulaw samples: first access {access_times[0] / count * 1e6:.2f} us/package, '
+          f'next accesses {sum(access_times[1:]) / 2 / count * 1e6:.2f} us/package')
+
+
+if __name__ == '__main__':
+    main()
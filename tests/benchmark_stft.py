@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+from matplotlib import mlab
+
+from src.config import DEFAULT_SAMPLE_RATE, DEFAULT_WINDOW_SIZE, DEFAULT_OVERLAP_RATIO
+from src.custom_functions.stft import specgram
+
+
+def specgram_mlab(amplitudes: list[int]) -> np.ndarray:
+    """Previous spectrum of get_fingerprint"""
+
+    spectrum, _, _ = mlab.specgram(amplitudes,
+                                   NFFT=DEFAULT_WINDOW_SIZE,
+                                   Fs=DEFAULT_SAMPLE_RATE,
+                                   window=mlab.window_hanning,
+                                   noverlap=int(DEFAULT_WINDOW_SIZE * DEFAULT_OVERLAP_RATIO))
+    return spectrum
+
+
+def check_equal(signals: list[list[int]]):
+    """The same layout and values (up to float32 precision) as mlab.specgram"""
+
+    for amplitudes in signals:
+        expected, actual = specgram_mlab(amplitudes), specgram(amplitudes)
+        assert expected.shape == actual.shape
+        assert np.allclose(expected, actual, rtol=1e-4, atol=expected.max() * 1e-6)
+
+
+def main():
+    rng = np.random.default_rng(5)
+    for seconds in (0.5, 3, 30):
+        signals = [rng.normal(0, 3000, int(DEFAULT_SAMPLE_RATE * seconds)).astype(np.int16).tolist()
+                   for _ in range(20)]
+        check_equal(signals)
+
+        start_time = time.perf_counter()
+        for amplitudes in signals:
+            specgram_mlab(amplitudes)
+        mlab_time = (time.perf_counter() - start_time) / len(signals)
+
+        start_time = time.perf_counter()
+        for amplitudes in signals:
+            specgram(amplitudes)
+        stft_time = (time.perf_counter() - start_time) / len(signals)
+
+        print(f'{seconds} s of audio: mlab.specgram {mlab_time * 1000:.2f} ms, '
+              f'stft.specgram {stft_time * 1000:.2f} ms, x{mlab_time / stft_time:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import numpy as np
+
+from src.audio_ring_buffer import AudioRingBuffer
+from src.config import DEFAULT_SAMPLE_RATE, DEFAULT_SAMPLE_SIZE, DEFAULT_WINDOW_SIZE
+from src.custom_functions.stft import specgram
+from src.detector import DETECT_WINDOW_PACKAGES
+from src.fingerprint_mining import get_2d_peaks, get_log_spectrum, is_without_peaks
+
+PREVIOUS_GATE_AMPLITUDE = 100  # peak-to-peak of one package, the first version of the gate
+
+
+def get_window(rng: np.random.Generator) -> np.ndarray:
+    """3 seconds of quiet audio: tones, square waves (the worst case for one bin), noise and the ADC offset"""
+
+    count_samples = DETECT_WINDOW_PACKAGES * DEFAULT_SAMPLE_SIZE
+    t = np.arange(count_samples) / DEFAULT_SAMPLE_RATE
+    amplitude = rng.uniform(1, 60)
+    frequency = rng.uniform(100, 3900)
+    kind = rng.integers(0, 4)
+    if kind == 0:
+        signal = amplitude * np.sin(2 * np.pi * frequency * t)
+    elif kind == 1:
+        # bin frequency with the sign of the window - the biggest magnitude for the peak-to-peak amplitude
+        frequency = DEFAULT_SAMPLE_RATE / DEFAULT_WINDOW_SIZE * rng.integers(2, DEFAULT_WINDOW_SIZE // 2)
+        signal = amplitude * np.sign(np.cos(2 * np.pi * frequency * t))
+    elif kind == 2:
+        signal = rng.normal(0, amplitude / 3, count_samples)
+    else:
+        signal = amplitude * np.sin(2 * np.pi * frequency * t) + rng.normal(0, amplitude / 4, count_samples)
+    offset = rng.choice([0, rng.uniform(-3000, 3000)])
+    return np.clip(np.round(signal + offset), -32768, 32767).astype(np.int16)
+
+
+def main():
+    rng = np.random.default_rng(11)
+    count_gated, count_previous_wrong = 0, 0
+    for _ in range(3000):
+        samples = get_window(rng)
+        audio_buffer = AudioRingBuffer(audio_capacity=DETECT_WINDOW_PACKAGES, stats_capacity=DETECT_WINDOW_PACKAGES)
+        for seq_num, package in enumerate(samples.reshape(-1, DEFAULT_SAMPLE_SIZE)):
+            audio_buffer.put(seq_num, package)
+
+        freqs, _, _ = get_2d_peaks(get_log_spectrum(specgram(samples, pad_short=False)))
+        has_peaks = np.count_nonzero(freqs >= 2) > 0  # peaks which are used in hashes
+
+        min_amp, max_amp = audio_buffer.get_amplitude_range(DETECT_WINDOW_PACKAGES)
+        if is_without_peaks(min_amp, max_amp):
+            assert not has_peaks, f'gated window with peaks, range=({min_amp}, {max_amp})'
+            count_gated += 1
+
+        max_swing = int((audio_buffer.max_amplitudes - audio_buffer.min_amplitudes).max())
+        count_previous_wrong += has_peaks and max_swing < PREVIOUS_GATE_AMPLITUDE
+
+    # 425 Hz tone at amplitude 49 still has peaks and must not be gated
+    t = np.arange(DETECT_WINDOW_PACKAGES * DEFAULT_SAMPLE_SIZE) / DEFAULT_SAMPLE_RATE
+    tone = np.round(49 * np.sin(2 * np.pi * 425 * t)).astype(np.int16)
+    assert get_2d_peaks(get_log_spectrum(specgram(tone, pad_short=False)))[0].size > 0
+    assert not is_without_peaks(int(tone.min()), int(tone.max()))
+
+    print(f'windows=3000 gated without peaks={count_gated}, '
+          f'windows with peaks gated by the previous threshold {PREVIOUS_GATE_AMPLITUDE}={count_previous_wrong}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import struct
+
+from src.custom_dataclasses.package import Package
+from src.jitter_buffer import JitterBuffer
+
+TIMESTAMP_STEP = 160  # 20 ms of 8 kHz audio
+
+
+def get_package(seq_num: int, timestamp: int, arrival_time: float) -> Package:
+    header = struct.pack('>BBHII', 0x80, 11, seq_num % 65536, timestamp % 2 ** 32, 12345)
+    return Package('127.0.0.1', 5000, header + b'\x00\x01' * 160, arrival_time=arrival_time)
+
+
+def play(stream: list[tuple[int, int]]) -> tuple[JitterBuffer, list[int]]:
+    """Push packages (seq_num, timestamp) every 20 ms, release them after playout delay"""
+
+    jitter_buffer = JitterBuffer(playout_delay=0.2)
+    released = []
+    for num, (seq_num, timestamp) in enumerate(stream):
+        jitter_buffer.push(get_package(seq_num, timestamp, arrival_time=num * 0.02))
+        released.extend(ext_seq for ext_seq, _ in jitter_buffer.pop_ready(now=num * 0.02))
+    released.extend(ext_seq for ext_seq, _ in jitter_buffer.pop_ready(now=len(stream) * 0.02 + 1))
+    return jitter_buffer, released
+
+
+def check_restart(name: str, first: tuple[int, int], second: tuple[int, int]):
+    """200 packages, then the sender restarts with other sequence number and timestamp, playout continues"""
+
+    stream = [(first[0] + num, first[1] + num * TIMESTAMP_STEP) for num in range(200)]
+    stream += [(second[0] + num, second[1] + num * TIMESTAMP_STEP) for num in range(200)]
+    jitter_buffer, released = play(stream)
+
+    stats = jitter_buffer.get_stats()
+    assert len(released) == 400, (name, stats)
+    assert released == sorted(released) and len(set(released)) == 400, name
+    assert stats['resets'] == 1 and stats['lost'] == 0 and stats['duplicate'] == 0, (name, stats)
+    print(f'{name}: released={len(released)} stats={stats}')
+
+
+def main():
+    check_restart('sequence restarted, timestamp goes on', (30000, 1000000), (5, 1000000 + 200 * TIMESTAMP_STEP))
+    check_restart('sequence and timestamp restarted back', (30000, 1000000), (5, 3000))
+    check_restart('sequence jumped forward, timestamp back', (1000, 1000000), (40000, 3000))
+    check_restart('sequence and timestamp restarted across the wrap',
+                  (65400, 2 ** 32 - 10000), (20000, 2 ** 32 - 90000))
+
+    # reordered packages are not a restart
+    stream = [(num, num * TIMESTAMP_STEP) for num in range(300)]
+    stream[100], stream[103] = stream[103], stream[100]
+    jitter_buffer, released = play(stream)
+    assert released == list(range(300)) and jitter_buffer.count_resets == 0, jitter_buffer.get_stats()
+    print(f'reordered: released={len(released)} stats={jitter_buffer.get_stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+import asyncio
+import os
+import random
+import struct
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import soundfile as sf
+from loguru import logger
+
+from src.audio_container import AudioContainer, CODE_AWAIT, CODE_NOT_FOUND
+from src.config import (Config,
+                        DEFAULT_SAMPLE_SIZE,
+                        AMPLITUDE_THRESHOLD_BEEP,
+                        AMPLITUDE_THRESHOLD_NOISE,
+                        AMPLITUDE_THRESHOLD_VOICE)
+from src.custom_dataclasses.package import Package
+
+MAX_PACKAGES_PER_TICK = 60  # 1.2 second
+
+
+class FullScanAudioContainer(AudioContainer):
+    """Previous implementation of detectors: every tick rescans all packages"""
+
+    def find_seq_num_first_beep(self) -> None:
+        if self.seq_num_first_beep != CODE_AWAIT:
+            return
+
+        for seq_num, max_amp in zip(*self.get_stats_window()[:2]):
+            if self.seq_num_answer_package != CODE_AWAIT:
+                self.seq_num_first_beep = CODE_NOT_FOUND
+                return
+            elif max_amp > AMPLITUDE_THRESHOLD_BEEP:
+                self.seq_num_first_beep = seq_num
+                return
+
+    def find_amp_adc_noise(self) -> None:
+        if self.amp_adc_noise != CODE_AWAIT:
+            return
+        elif self.seq_num_first_beep > 0:
+            self.amp_adc_noise = CODE_NOT_FOUND
+            return
+        elif self.event_answer is not None:
+            self.amp_adc_noise = CODE_NOT_FOUND
+            return
+
+        _, max_amps, min_amps = self.get_stats_window()
+        for max_amp, min_amp in zip(max_amps, min_amps):
+            if min(abs(min_amp), abs(max_amp)) < AMPLITUDE_THRESHOLD_NOISE:
+                continue
+            elif max_amp - min_amp > AMPLITUDE_THRESHOLD_BEEP:
+                self.amp_adc_noise = CODE_NOT_FOUND
+                return
+            elif 0.8 < min_amp / max_amp < 1.25:
+                self.amp_adc_noise = (max_amp + min_amp) // 2
+                return
+
+    def find_seq_num_noise_after_answer(self) -> None:
+        if self.seq_num_noise_after_answer != CODE_AWAIT:
+            return
+
+        if self.event_answer is None:
+            return
+
+        counter = 0
+        seq_numbers, max_amps, _ = self.get_stats_window(first_seq_num=self.seq_num_answer_package)
+        for seq_num, max_amp in zip(seq_numbers, max_amps):
+            if self.amp_adc_noise > 0:
+                max_amp = max_amp - self.amp_adc_noise
+
+            if max_amp > AMPLITUDE_THRESHOLD_NOISE:
+                counter += 1
+            else:
+                counter = max(counter - 0.3, 0)
+
+            if counter > 2:
+                self.seq_num_noise_after_answer = seq_num
+                return
+
+    def find_seq_num_voice_before_answer(self) -> None:
+        if self.seq_num_voice_before_answer != CODE_AWAIT:
+            return
+
+        seq_numbers, max_amps, _ = self.get_stats_window()
+
+        seq_num_last_beep = 0
+        counter = 0
+        for seq_num, max_amp in zip(seq_numbers, max_amps):
+            if seq_num < seq_num_last_beep:
+                continue
+            elif max_amp > AMPLITUDE_THRESHOLD_BEEP:
+                counter += 1
+            else:
+                counter = 0
+
+            if counter > 10:
+                seq_num_last_beep = seq_num + 50
+
+        if counter > 1:
+            seq_num_last_beep = self.seq_num_last_package
+
+        for seq_num, max_amp in zip(seq_numbers, max_amps):
+            if seq_num < seq_num_last_beep:
+                continue
+
+            if max_amp > AMPLITUDE_THRESHOLD_VOICE:
+                self.seq_num_voice_before_answer = seq_num
+                return
+
+    def find_first_noise(self) -> None:
+        if self.found_first_noise == 1:
+            return
+        elif max(self.seq_num_first_beep, self.seq_num_noise_after_answer, self.seq_num_voice_before_answer) > 0:
+            self.found_first_noise = 1
+            return
+
+        _, max_amps, min_amps = self.get_stats_window()
+        if len(max_amps) > 0 and max(max_amps) > AMPLITUDE_THRESHOLD_NOISE:
+            counter = 0
+            for max_amp, min_amp in zip(max_amps, min_amps):
+                if max_amp - min_amp > AMPLITUDE_THRESHOLD_NOISE:
+                    counter += 1
+
+            if counter > 1:
+                self.found_first_noise = 1
+                return
+
+
+def generate_call(seed: int) -> np.ndarray:
+    """Random call: silence, ADC noise, beeps, voice"""
+
+    rnd = random.Random(seed)
+    t = np.arange(8000) / 8000
+    parts = []
+    for _ in range(rnd.randint(3, 12)):
+        kind = rnd.choice(['silence', 'adc', 'beep', 'short_beep', 'voice'])
+        seconds = rnd.uniform(0.2, 4)
+        size = int(8000 * seconds)
+        if kind == 'silence':
+            part = np.random.default_rng(seed).normal(0, 15, size)
+        elif kind == 'adc':
+            part = np.full(size, rnd.randint(100, 400)) + np.random.default_rng(seed).normal(0, 5, size)
+        elif kind in ('beep', 'short_beep'):
+            seconds = 0.15 if kind == 'short_beep' else seconds
+            part = 6000 * np.sin(2 * np.pi * 425 * np.resize(t, int(8000 * seconds)))
+        else:
+            part = np.random.default_rng(seed).normal(0, rnd.randint(100, 3000), size)
+        parts.append(part)
+    return np.clip(np.concatenate(parts), -32768, 32767).astype(np.int16)
+
+
+def get_event_create(answer_second: float | None) -> tuple[SimpleNamespace, SimpleNamespace | None]:
+    create_time = datetime(2024, 1, 1)
+    info = SimpleNamespace(em_codec='slin', em_sample_rate=8000, em_sample_width=2, save_record=0, save_format='wav')
+    event_create = SimpleNamespace(info=info, event_time=create_time.isoformat())
+    if answer_second is None:
+        return event_create, None
+    return event_create, SimpleNamespace(event_time=(create_time + timedelta(seconds=answer_second)).isoformat())
+
+
+def tick(audio_container: AudioContainer) -> tuple:
+    audio_container.parse_tick()
+    return (audio_container.found_first_noise,
+            audio_container.seq_num_first_beep,
+            audio_container.amp_adc_noise,
+            audio_container.seq_num_noise_after_answer,
+            audio_container.seq_num_voice_before_answer)
+
+
+def replay(name: str, amplitudes: np.ndarray, answer_second: float | None, seed: int) -> bool:
+    rnd = random.Random(seed)
+    config = Config()
+    config.jitter_playout_delay = 0
+    event_create, event_answer = get_event_create(answer_second)
+
+    containers = [cls(config=config, em_host='127.0.0.1', em_port=5000, chan_id=name, call_id=name,
+                      event_create=event_create, call_service_client=None)
+                  for cls in (FullScanAudioContainer, AudioContainer)]
+
+    first_seq_num = rnd.randint(0, 65535)
+    count_packages = len(amplitudes) // DEFAULT_SAMPLE_SIZE
+    packages: list[Package] = []
+    for index in range(count_packages):
+        if rnd.random() < 0.01:
+            continue  # lost
+        payload = amplitudes[index * DEFAULT_SAMPLE_SIZE: (index + 1) * DEFAULT_SAMPLE_SIZE].astype('>i2').tobytes()
+        seq_num = (first_seq_num + index) % 65536
+        header = struct.pack('>BBHII', 0x80, 11, seq_num, (index * DEFAULT_SAMPLE_SIZE) % 2 ** 32, seed)
+        packages.append(Package('127.0.0.1', 5000, header + payload, arrival_time=time.time() - 10))
+
+    start = 0
+    while start < len(packages):
+        end = start + rnd.randint(1, MAX_PACKAGES_PER_TICK)
+        if event_answer and start * DEFAULT_SAMPLE_SIZE / 8000 >= answer_second:
+            for audio_container in containers:
+                if audio_container.event_answer is None:
+                    audio_container.add_event_answer(event_answer)
+
+        results = []
+        for audio_container in containers:
+            for package in packages[start: end]:
+                audio_container.append_package_for_analyse(package)
+            results.append(tick(audio_container))
+
+        if results[0] != results[1]:
+            logger.error(f'{name}: different results at package {start}: full={results[0]} incremental={results[1]}')
+            return False
+        start = end
+
+    logger.info(f'{name}: identical results {results[1]}')
+    return True
+
+
+async def main():
+    logger.remove()
+    logger.add(sink=lambda msg: print(msg, end=''), level='INFO', filter=lambda r: r['function'] == 'replay')
+
+    calls: list[tuple[str, np.ndarray]] = []
+    folder_records = 'file_for_analysis'
+    if os.path.isdir(folder_records):
+        for file_name in sorted(os.listdir(folder_records)):
+            if file_name.endswith('.wav'):
+                data, sample_rate = sf.read(os.path.join(folder_records, file_name), dtype='int16')
+                if sample_rate == 8000 and data.ndim == 1:
+                    calls.append((file_name, data))
+
+    for seed in range(200):
+        calls.append((f'generated_{seed}', generate_call(seed)))
+
+    count_ok = 0
+    for index, (name, amplitudes) in enumerate(calls):
+        duration = len(amplitudes) / 8000
+        answer_second = None if index % 3 == 0 else random.Random(index).uniform(0, duration)
+        count_ok += replay(name, amplitudes, answer_second, seed=index)
+
+    print(f'identical: {count_ok} / {len(calls)}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
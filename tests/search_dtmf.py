@@ -1,35 +1,38 @@
-import asyncio
 import os
+import time
 
+import numpy as np
 import soundfile as sf
 from loguru import logger
 
-from src.custom_dataclasses.template import Template
-from src.fingerprint_mining import get_fingerprint
+from src.config import DEFAULT_SAMPLE_SIZE
+from src.dtmf_detector import DtmfDetector, detect_digits
 
 
-async def main():
+def main():
     # folder_records = 'file_for_analysis/skip3'
     folder_records = 'dtmf'
     os.makedirs(folder_records, exist_ok=True)
     file_list = [file for file in os.listdir(folder_records) if file.endswith('.wav')]
 
-    for index, file_name in enumerate(file_list):
-        logger.info(f'search in file_name={file_name}')
-        file_path = os.path.join(folder_records, file_name)
-        data, sample_rate = sf.read(file_path, dtype='int16')
+    # every file is a channel, packages of all files are checked together as in Detector.run_dtmf
+    chan_packages = {}
+    for file_name in file_list:
+        data, sample_rate = sf.read(os.path.join(folder_records, file_name), dtype='int16')
+        data = data if data.ndim == 1 else data[:, 0]
+        count_packages = data.size // DEFAULT_SAMPLE_SIZE
+        chan_packages[file_name] = data[:count_packages * DEFAULT_SAMPLE_SIZE].reshape(count_packages, -1)
 
-        template = Template(template_id=index + 20000000,
-                            template_name=file_name,
-                            amplitudes=data.tolist(),
-                            sample_rate=sample_rate)
+    dtmf_detector = DtmfDetector(fs=sample_rate) if file_list else DtmfDetector()
+    start_time = time.perf_counter()
+    digits = dtmf_detector.process(chan_packages)
+    duration = time.perf_counter() - start_time
 
-        fingerprint = get_fingerprint(print_name=file_name,
-                                      amplitudes=template.amplitudes,
-                                      plot=False)
-
-        logger.info(f'print_name={fingerprint.print_name} dtmf={fingerprint.dtmf}')
+    for file_name, packages in chan_packages.items():
+        logger.info(f'file_name={file_name} dtmf={digits.get(file_name, "")} '
+                    f'packages with digit={np.count_nonzero(detect_digits(packages, fs=sample_rate) >= 0)}')
+    logger.info(f'stats={dtmf_detector.get_stats()} time={duration:.4f}s')
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    main()